@@ -15,8 +15,8 @@ type Article = { article_id: number; article_summary?: string; cluster_id?: numb
 const API_BASE = "http://127.0.0.1:5000";
 
 const Landing = () => {
-    const [clusters, setClusters] = useState<Cluster[]>([]);
-    const [articles, setArticles] = useState<Article[]>([]);
+    const [nodes, setNodes] = useState<NodeDatum[]>([]);
+    const [links, setLinks] = useState<LinkDatum[]>([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState<string | null>(null);
   const [focusedNode, setFocusedNode] = useState<NodeDatum | null>(null);
@@ -27,16 +27,12 @@ const Landing = () => {
       async function load() {
         try {
           setLoading(true);
-          const [artRes, cluRes] = await Promise.all([
-            fetch(`${API_BASE}/api/articles`),
-            fetch(`${API_BASE}/api/clusters`),
-          ]);
-
-          const artJson = await artRes.json();
-          const cluJson = await cluRes.json();
+          // nodes and links are precomputed server-side; article text is not included
+          const res = await fetch(`${API_BASE}/api/graph`);
+          const json = await res.json();
           if (cancelled) return;
-          setArticles(artJson.articles ?? []);
-          setClusters(cluJson.clusters ?? []);
+          setNodes(json.nodes ?? []);
+          setLinks(json.links ?? []);
         } catch (e: unknown) {
           const message = e instanceof Error ? e.message : "Failed to load data";
           if (!cancelled) setError(message);
@@ -50,51 +46,25 @@ const Landing = () => {
       };
     }, []);
 
-    // build nodes and its links
-    const { nodes, links } = useMemo(() => {
-      const n: NodeDatum[] = [];
-      const l: LinkDatum[] = [];
-
-      // map to find cluster info
-      const clusterById = new Map<number, Cluster>();
-      for (const c of clusters) clusterById.set(c.cluster_id, c);
-
-      //create cluster nodes
-      for (const c of clusters) {
-        n.push({
-          id: `cluster-${c.cluster_id}`,
-          type: "cluster",
-          cluster_id: c.cluster_id,
-          title: c.cluster_title ?? undefined,
-          article_summary: c.cluster_summary,
-        });
-      }
-
-      //create article nodes and link to cluster node
-      for (const a of articles) {
-        const id = `article-${a.article_id}`;
-        n.push({
-          id,
-          type: "article",
-          article_id: a.article_id,
-          article_summary: a.article_summary,
-          cluster_id: a.cluster_id,
-          title: a.title,
-          text: a.text,
-          source: a.source,
-        });
-
-        if (a.cluster_id != null && clusterById.has(a.cluster_id)) {
-          l.push({
-            source: id,
-            target: `cluster-${a.cluster_id}`,
-            value: 1,
+    // cluster and article lists for the side panels, derived from the graph nodes
+    const { clusters, articles } = useMemo(() => {
+      const c: Cluster[] = [];
+      const a: Article[] = [];
+      for (const n of nodes) {
+        if (n.type === "cluster" && n.cluster_id != null) {
+          c.push({ cluster_id: n.cluster_id, cluster_title: n.title ?? null, cluster_summary: n.article_summary ?? "" });
+        } else if (n.type === "article" && n.article_id != null) {
+          a.push({
+            article_id: n.article_id,
+            cluster_id: n.cluster_id,
+            title: n.title,
+            source: n.source,
+            article_summary: n.article_summary,
           });
         }
       }
-
-      return { nodes: n, links: l };
-    }, [articles, clusters]);
+      return { clusters: c, articles: a };
+    }, [nodes]);
 
     //prepare a color scale for clusters using schemeDark2, randomized assignment
     const clusterColor = useMemo(() => {
@@ -285,6 +285,9 @@ const ForceGraph: React.FC<ForceGraphProps> = ({
       .force("x", d3.forceX())
       .force("y", d3.forceY());
 
+    // positions precomputed by the server are already settled; only refine them locally
+    if (N.length > 0 && N.every((d) => d.x != null && d.y != null)) simulation.alpha(0.05);
+
     simulation.on("tick", () => {
       link
         .attr("x1", (d) => (typeof d.source === "object" ? d.source.x ?? 0 : 0))
@@ -0,0 +1,259 @@
+"""
+Admission control for the API: per-client rate limits and concurrency gates.
+
+Every route belongs to a route class ("cheap", "expensive", "write" or
+"bulk", see server.py). Two independent checks shed load before it reaches the database:
+
+- Rate limits: a token bucket per (client, route), refilled at the class's
+  rate up to its burst size. An empty bucket answers 429 immediately, with a
+  Retry-After of the time until the next token.
+- Concurrency gates: a bounded number of requests of each class may be
+  running database work at once. A request that cannot get a slot within
+  ADMISSION_WAIT seconds answers 503 with Retry-After instead of queueing.
+  Gates sit inside the response cache, so cache hits never take a slot.
+
+Expensive routes (full-text lists, search, graph, writes) get lower rates
+and fewer slots than cheap lookups, so a spike on them cannot starve the rest.
+Bulk uploads (/api/data/bulk) have a class of their own whose slots match the
+chunked uploader's UPLOAD_PARALLELISM, and whose rate matches its UPLOAD_RATE
+(transform_and_upload.py), so the shipped uploader stays within its limits.
+
+A route's class may also depend on the request: a callable taking the query
+parameters and returning the class name (see params.article_route_class).
+
+Limits are "<requests per second>/<burst>" strings, e.g. RATE_LIMIT_CHEAP=50/100;
+"0" turns a limit off, and ADMISSION_CONTROL=off turns everything off.
+
+The buckets, gates and Admission.admit() do not depend on a web framework.
+Admission.limit() and Admission.gate() wrap Flask views (server.py); asgi.py
+has a Starlette middleware and an async gate over the same pieces.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+DEFAULT_RATES = {"cheap": "50/100", "expensive": "5/10", "write": "2/5", "bulk": "2/5"}
+DEFAULT_SLOTS = {"cheap": 16, "expensive": 4, "write": 2, "bulk": 4}
+DEFAULT_WAIT = 0.05
+# token buckets kept, least recently used evicted first
+MAX_BUCKETS = 10000
+
+
+def parse_rate(value):
+    """
+    "<rate>/<burst>" -> (rate, burst), or None for "0" / "off".
+
+    Raises:
+        ValueError: if the value is malformed
+    """
+    value = value.strip().lower()
+    if value in ("0", "off", ""):
+        return None
+    rate, _, burst = value.partition("/")
+    rate = float(rate)
+    burst = float(burst) if burst else max(rate, 1.0)
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Invalid rate limit {value!r}")
+    return rate, burst
+
+
+class TokenBuckets:
+    """Token buckets keyed by an arbitrary hashable, all with the same rate and burst."""
+
+    def __init__(self, rate, burst, max_buckets=MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key):
+        """
+        Take one token from key's bucket.
+
+        Returns:
+            0 if a token was taken, else the seconds until one is available
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_buckets:
+                # an evicted client just starts again with a full bucket
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class Gate:
+    """A bounded number of concurrent slots that fails fast instead of queueing."""
+
+    def __init__(self, slots, wait):
+        self.slots = slots
+        self.wait = wait
+        self._semaphore = threading.BoundedSemaphore(slots)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if not self._semaphore.acquire(timeout=self.wait):
+            return self._admitted(False)
+        return self._admitted(True)
+
+    async def acquire_async(self, poll=0.005):
+        """acquire() for an event loop: polls for a slot instead of blocking the loop."""
+        deadline = time.monotonic() + self.wait
+        while not self._semaphore.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                return self._admitted(False)
+            await asyncio.sleep(poll)
+        return self._admitted(True)
+
+    def _admitted(self, admitted):
+        with self._lock:
+            if admitted:
+                self.active += 1
+            else:
+                self.rejected += 1
+        return admitted
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._semaphore.release()
+
+
+def client_key(headers, remote_addr):
+    """
+    The client a request is accounted to: the first X-Forwarded-For hop when
+    TRUST_PROXY is set (the server sits behind a proxy), else the peer address.
+
+    Args:
+        headers: the request headers (Flask or Starlette; only .get() is used)
+        remote_addr: the peer address, if known
+    """
+    if os.getenv("TRUST_PROXY"):
+        forwarded = headers.get("X-Forwarded-For", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return remote_addr or "unknown"
+
+
+def retry_after(seconds):
+    """Retry-After header value: whole seconds, at least 1."""
+    return str(max(1, math.ceil(seconds)))
+
+
+def resolve_class(route_class, args):
+    """The class name of a route whose class is a name or a callable of the query parameters."""
+    return route_class(args) if callable(route_class) else route_class
+
+
+def _reject(message, status, wait):
+    from flask import jsonify
+
+    response = jsonify({"error": message})
+    response.status_code = status
+    response.headers["Retry-After"] = retry_after(wait)
+    return response
+
+
+class Admission:
+    def __init__(self, rates=None, slots=None, wait=DEFAULT_WAIT, enabled=True):
+        """
+        Args:
+            rates: route class -> (rate, burst) or None for no rate limit
+            slots: route class -> concurrent requests allowed (0 for no gate)
+            wait: seconds to wait for a gate slot before answering 503
+            enabled: False to admit everything
+        """
+        self.enabled = enabled
+        self.limits = {name: TokenBuckets(*rate) for name, rate in (rates or {}).items() if rate}
+        self.gates = {name: Gate(n, wait) for name, n in (slots or {}).items() if n > 0}
+        self._lock = threading.Lock()
+        self.throttled = {}
+
+    @classmethod
+    def from_env(cls):
+        """Admission configured from RATE_LIMIT_<CLASS>, <CLASS>_CONCURRENCY, ADMISSION_WAIT and ADMISSION_CONTROL."""
+        rates = {name: parse_rate(os.getenv(f"RATE_LIMIT_{name.upper()}", default))
+                 for name, default in DEFAULT_RATES.items()}
+        slots = {name: int(os.getenv(f"{name.upper()}_CONCURRENCY", default))
+                 for name, default in DEFAULT_SLOTS.items()}
+        return cls(rates, slots,
+                   wait=float(os.getenv("ADMISSION_WAIT", DEFAULT_WAIT)),
+                   enabled=os.getenv("ADMISSION_CONTROL", "on").lower() not in ("off", "0", "false"))
+
+    def admit(self, route_class, client, endpoint):
+        """
+        Take a token from client's bucket for endpoint.
+
+        Returns:
+            0 if the request is admitted, else the seconds until it may retry
+        """
+        buckets = self.limits.get(route_class)
+        if not self.enabled or buckets is None:
+            return 0.0
+        wait = buckets.take((client, endpoint))
+        if wait:
+            with self._lock:
+                self.throttled[route_class] = self.throttled.get(route_class, 0) + 1
+        return wait
+
+    def gate_for(self, route_class):
+        """The class's Gate, or None when it is not gated (or admission is off)."""
+        return self.gates.get(route_class) if self.enabled else None
+
+    def limit(self, route_class):
+        """Decorator for a Flask view: answer 429 when this client's bucket for the route is empty."""
+        from flask import request
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                name = resolve_class(route_class, request.args)
+                wait = self.admit(name, client_key(request.headers, request.remote_addr), request.endpoint)
+                if wait:
+                    return _reject("Rate limit exceeded", 429, wait)
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def gate(self, route_class):
+        """Decorator for a Flask view: run it in one of the class's slots, or answer 503 if none frees up in time."""
+        from flask import request
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                gate = self.gate_for(resolve_class(route_class, request.args))
+                if gate is None:
+                    return view(*args, **kwargs)
+                if not gate.acquire():
+                    return _reject("Server busy, try again shortly", 503, 1)
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    gate.release()
+            return wrapper
+        return decorator
+
+    def gauges(self):
+        """Current gate occupancy and rejection counts, for /metrics."""
+        values = {}
+        for name, gate in self.gates.items():
+            values[f'noogie_admission_active{{class="{name}"}}'] = gate.active
+            values[f'noogie_admission_rejected_total{{class="{name}"}}'] = gate.rejected
+        for name, count in self.throttled.items():
+            values[f'noogie_admission_throttled_total{{class="{name}"}}'] = count
+        return values
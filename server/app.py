@@ -5,33 +5,30 @@ os.environ["OMP_NUM_THREADS"] = "1"
 from dotenv import load_dotenv
 load_dotenv()
 
-import feedparser
 import newspaper
-from newspaper import Article, Config, ArticleException, ArticleBinaryDataException
-from newspaper.mthreading import fetch_news
-import requests
+from newspaper import ArticleException
 import warnings
-import json
-from datetime import datetime, timedelta, timezone
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from collections import defaultdict
 
 import google.generativeai as genai
-from openai import OpenAI
-from supabase import create_client, Client
+from budget import RunBudget, CircuitBreakers, SourceDeadline, SOURCE_TIMEOUT
+from db import create_store
+from semantic import EMBEDDING_MODEL
+from records import ArticleStore, write_rawdata, RAWDATA_PATH
+from extract import parse_article
+from url_filter import UrlFilter
+from pipeline import (RSS_FEEDS, NEWSPAPER_SOURCES, MIN_RSS_TEXT, MIN_PAGE_TEXT, cutoff, newspaper_config,
+                      create_session, openai_client, download_html, feed_links, generate_summary,
+                      summarize_and_name_cluster, cluster_records, encode_within)
 from sentence_transformers import SentenceTransformer
-from sklearn.cluster import AgglomerativeClustering
-import numpy as np
 
 def main():
     warnings.simplefilter(action="ignore", category=FutureWarning)
     # --- Supabase Setup ---
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    store = create_store()
 
     # --- OpenAI Setup ---
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    client = openai_client()
 
 
 
@@ -45,231 +42,209 @@ def main():
         exit()
 
     # --- Newspaper Config ---
-    config = Config()
-    config.memoize_articles = False
-    config.browser_user_agent = (
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/122.0 Safari/537.36"
-    )
+    config = newspaper_config()
 
     # --- Constants ---
-    CUTOFF = datetime.now(timezone.utc) - timedelta(hours=72)
-
-    RSS_FEEDS = {
-        "CNN": "http://rss.cnn.com/rss/cnn_latest.rss",
-        "Guardian": "https://www.theguardian.com/world/rss",
-        "NYPost": "https://nypost.com/feed/",
-        "BBC": "http://feeds.bbci.co.uk/news/world/rss.xml",
-        "Politico": "https://rss.politico.com/politics-news.xml",
-        "Politico - Congress": "https://rss.politico.com/congress.xml",
-        "AlJazeera": "https://www.aljazeera.com/xml/rss/all.xml",
-        "Fox": "https://feeds.foxnews.com/foxnews/latest",
-        "CBS": "https://www.cbsnews.com/latest/rss/main",
-        "ABC": "https://abcnews.go.com/abcnews/topstories"
-    }
-
-    NEWSPAPER_SOURCES = {
-        "CNN": "https://www.cnn.com",
-        "Guardian": "https://www.theguardian.com",
-        "NYT": "https://www.nytimes.com",
-        "NYPost": "https://nypost.com",
-    }
+    CUTOFF = cutoff()
 
     MAX_ARTICLES = 2000
     THREADS = 6  # Number of threads for multithreading
 
+    # the run stops each stage at its deadline and skips sources that keep failing; see budget.py
+    budget = RunBudget()
+    breakers = CircuitBreakers()
+    session = create_session()
+
     # --- Helper Functions ---
-    def article_exists(title: str) -> bool:
-        """Check if an article title already exists in the database."""
+    def existing_titles(titles) -> set:
+        """Titles that already exist in the database, checked in one batched query."""
         try:
-            result = supabase.table("articles").select("title").eq("title", title).execute()
-            return bool(result.data)
+            return store.existing_titles(titles)
         except Exception as e:
             print(f"[!] Supabase check error: {e}")
-            return False
-
-    def collect_from_rss(src_url):
+            return set()
+
+    def collect_from_rss(src_url, stage):
+        """
+        Returns:
+            (articles, timed_out): what was collected before the source's deadline; timed_out is
+            None if the stage's deadline stopped the source before its own did
+        """
         src, url = src_url
-        feed = feedparser.parse(url)
+        clock = SourceDeadline(stage)
+        deadline = clock.start()
         results = []
-        for e in feed.entries:
-            pub = e.get("published_parsed") or e.get("updated_parsed")
-            if not pub:
-                continue
-            if datetime(*pub[:6], tzinfo=timezone.utc) < CUTOFF:
-                continue
+        for link in feed_links(session, url, deadline, CUTOFF):
+            if deadline.expired():
+                return results, True if clock.timed_out() else None
             try:
-                art = Article(e.link, config=config)
-                art.download()
-                art.parse()
-                if len(art.text.strip()) >= 120:
-                    results.append((src, art.title, e.link, art.text))
+                title, text, _ = parse_article(download_html(session, link, deadline), link, config)
+                if len(text.strip()) >= MIN_RSS_TEXT:
+                    results.append((src, title, link, text))
             except (ArticleException, Exception):
                 continue
-        return results
+        return results, False
 
-    def generate_summary(text, prompt_type="article"):
-        if not text or len(text.strip()) < 100:
-            return "Not enough content to summarize."
-
-        if prompt_type == "article":
-            system_prompt = "You are a helpful assistant that summarizes news articles concisely."
-            user_prompt = f"Summarize the following news article in 2-3 concise sentences:\n\n{text}"
-        else:  # cluster
-            system_prompt = "You are a helpful assistant that synthesizes multiple summaries into a coherent overview."
-            user_prompt = f"Synthesize the following summaries into 3-4 concise sentences:\n\n{text}"
-
-        try:
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.5,
-                max_tokens=200,
-            )
-            return resp.choices[0].message.content.strip()
-        except Exception as e:
-            return f"OpenAI summary error: {e}"
+    def allowed(sources, kind):
+        """The sources whose circuit breaker is closed, reporting the rest."""
+        kept = {name: url for name, url in sources.items() if breakers.allow(f"{kind}:{name}")}
+        for name in sources.keys() - kept.keys():
+            print(f"Skipping {name} ({kind}): failed on recent runs")
+        return kept
 
     # Fetch RSS Articles with Multithreading 
-    articles = []
-    article_info = []      # (source, title, url)
-    article_details = {}   # identifier -> {text, summary}
+    # every article is an integer id into one compact store; see records.py
+    records = ArticleStore()
 
     print("\n=== Fetching articles via RSS (multithreaded) ===")
+    stage = budget.stage("rss")
     with ThreadPoolExecutor(max_workers=THREADS) as executor:
-        futures = [executor.submit(collect_from_rss, item) for item in RSS_FEEDS.items()]
+        futures = {executor.submit(collect_from_rss, item, stage): item[0]
+                   for item in allowed(RSS_FEEDS, "rss").items()}
         for future in as_completed(futures):
-            items = future.result()
+            src = futures[future]
+            try:
+                items, timed_out = future.result()
+            except Exception as e:
+                print(f"[!] RSS {src} failed: {e}")
+                breakers.failure(f"rss:{src}", e)
+                continue
+            if timed_out:
+                print(f"[!] RSS {src} timed out after {len(items)} articles")
+                breakers.failure(f"rss:{src}", "timeout")
+            elif timed_out is None:
+                print(f"[!] RSS budget spent, {src} stopped after {len(items)} articles")
+            else:
+                breakers.success(f"rss:{src}")
+            seen = existing_titles([title for (_, title, _, _) in items])
             for (s, title, link, text) in items:
-                if article_exists(title):
+                if title in seen:
                     continue
-                summary = generate_summary(text)
-                ident = (s, title, link)
-                articles.append(text)
-                article_info.append(ident)
-                article_details[ident] = {"text": text, "summary": summary}
+                records.add(s, title, link, text)
 
-    print(f"RSS fetched: {len(articles)} articles collected.")
+    print(f"RSS fetched: {len(records)} articles collected.")
 
     # Build Newspaper Sources
     print("\n=== Building newspaper sources ===")
+    stage = budget.stage("newspaper")
+    # drops seen, non-article and out-of-window links before they are downloaded
+    url_filter = UrlFilter(CUTOFF, store)
+    url_filter.add_collected(records.urls)
+
+    def source_urls(name, url):
+        """(brand, article URLs) of an outlet; the newspaper Source and its Articles are not kept."""
+        html = download_html(session, url, stage.sooner(SOURCE_TIMEOUT))
+        paper = newspaper.build(url, config=config, memoize_articles=False, input_html=html)
+        articles = url_filter.filter(name, paper.articles, url=lambda art: art.url)
+        return paper.brand, [art.url for art in articles[:MAX_ARTICLES]]
+
     papers = []
-    for name, url in NEWSPAPER_SOURCES.items():
+    for name, url in allowed(NEWSPAPER_SOURCES, "newspaper").items():
+        if stage.expired():
+            print(f"Newspaper budget spent, skipping {name}")
+            continue
         try:
-            r = requests.get(url, headers={"User-Agent": config.browser_user_agent}, timeout=30)
-            r.raise_for_status()
-            paper = newspaper.build(url, config=config, memoize_articles=False, input_html=r.text)
-            papers.append(paper)
+            papers.append((name, *source_urls(name, url)))
         except Exception as e:
             print(f"Could not build {name}: {e}")
-
-    # Multithreaded Newspaper Download
-    fetch_news(papers, threads=THREADS)
-
-    for paper in papers:
-        count = 0
-        for art in paper.articles:
-            if count >= MAX_ARTICLES:
-                break
+            breakers.failure(f"newspaper:{name}", e)
+    print(url_filter.report())
+
+    # Multithreaded Newspaper Download, each source until its own deadline,
+    # which starts when its first download does rather than when it is queued.
+    # A page is parsed as soon as its download completes and then dropped, so
+    # only the pages not yet consumed are held rather than every page of the
+    # stage (python records.py --bench)
+    def download_page(url, clock):
+        deadline = clock.start()
+        if deadline.expired():
+            return None
+        return download_html(session, url, deadline)
+
+    clocks = {name: SourceDeadline(stage) for name, _, _ in papers}
+    outcomes = {name: {"ok": 0, "failed": 0, "late": 0, "skipped": 0, "collected": 0} for name, _, _ in papers}
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        futures = {}
+        for name, brand, urls in papers:
+            for url in urls:
+                futures[executor.submit(download_page, url, clocks[name])] = (name, brand, url)
+        for future in as_completed(futures):
+            # popped so the future, and the page it holds, are freed once consumed
+            name, brand, url = futures.pop(future)
             try:
-                art.parse()
-                if len(art.text.strip()) > 100:
-                    summary = generate_summary(art.text)
-                    ident = (paper.brand, art.title, art.url)
-                    articles.append(art.text)
-                    article_info.append(ident)
-                    article_details[ident] = {"text": art.text, "summary": summary}
-                    count += 1
+                html = future.result()
             except Exception:
+                outcomes[name]["failed"] += 1
                 continue
-        print(f"Collected {count} articles from {paper.brand}")
-
-    print(f"Total articles gathered: {len(articles)}")
+            if html is None:
+                # late: the source used up its own time; skipped: the stage ran out first
+                outcomes[name]["late" if clocks[name].timed_out() else "skipped"] += 1
+                continue
+            outcomes[name]["ok"] += 1
+            try:
+                title, text, _ = parse_article(html, url, config)
+            except Exception:
+                continue
+            if len(text.strip()) > MIN_PAGE_TEXT:
+                records.add(brand, title, url, text)
+                outcomes[name]["collected"] += 1
+            else:
+                url_filter.mark_seen(url)
+    for name, counts in outcomes.items():
+        print(f"Collected {counts['collected']} articles from {name}")
+        if counts["late"]:
+            print(f"[!] {name} timed out with {counts['late']} articles not downloaded")
+            breakers.failure(f"newspaper:{name}", "timeout")
+        elif counts["failed"] and not counts["ok"]:
+            breakers.failure(f"newspaper:{name}", "every article download failed")
+        elif counts["ok"]:
+            breakers.success(f"newspaper:{name}")
+        if counts["skipped"]:
+            print(f"[!] Newspaper budget spent, {counts['skipped']} {name} articles not downloaded")
+    url_filter.seen.save()
+    breakers.save()
+
+    # Article Summaries, with a lead-sentence fallback once the stage's time is up
+    stage = budget.stage("summaries")
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        futures = {executor.submit(generate_summary, client, text, "article", stage): article_id
+                   for article_id, text in enumerate(records.texts)}
+        for future in as_completed(futures):
+            records.summaries[futures[future]] = future.result()
 
-    # Prepare  Articles for Clustering
-    structured_articles = []
-    for ident in article_info:
-        info = article_details[ident]
-        structured_articles.append({
-            "title": ident[1],
-            "article_summary": info["summary"],
-            "source": ident[0],
-            "text": info["text"],
-        })
+    print(f"Total articles gathered: {len(records)}")
 
     # Embeddings + Clustering 
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    texts = [a["article_summary"] for a in structured_articles]
-    embs = model.encode(texts)
-
-    clustering = AgglomerativeClustering(
-        n_clusters=None,
-        distance_threshold=1.2,
-        linkage="average"
-    ).fit(embs)
-
-    labels = clustering.labels_
-
-    # Build Clusters 
-    clusters = defaultdict(list)
-    for art, label in zip(structured_articles, labels):
-        clusters[label].append(art)
-
-    unique_by_source = {}
-    for cid, arts in clusters.items():
-        keep = {}
-        for a in arts:
-            if a["source"] not in keep:
-                keep[a["source"]] = a
-        unique_by_source[cid] = list(keep.values())
-    clusters = unique_by_source
+    model = SentenceTransformer(EMBEDDING_MODEL)
 
-    # Multithreaded Cluster Summarization
-    def summarize_and_name_cluster(arts):
-        """Generate cluster summary and a meaningful cluster name from it."""
-        cluster_text = " ".join(a["article_summary"] for a in arts)
-        summary = generate_summary(cluster_text, prompt_type="cluster")
+    # kept with each article so the server can do semantic search without re-encoding;
+    # articles not encoded before the stage's deadline are left for the next run
+    vectors = encode_within(model, records.summaries, budget.stage("encode"))
+    if len(vectors) < len(records):
+        print(f"[!] Encoding budget spent, leaving out {len(records) - len(vectors)} articles")
+        records.truncate(len(vectors))
+    records.set_embeddings(vectors)
 
-        # Generate a concise cluster name using OpenAI
-        name_prompt = f"Create a short, descriptive title (3-5 words) for the following news summary:\n\n{summary}"
-        try:
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that creates concise titles."},
-                    {"role": "user", "content": name_prompt},
-                ],
-                temperature=0.3,
-                max_tokens=20
-            )
-            cluster_name = resp.choices[0].message.content.strip()
-        except Exception as e:
-            cluster_name = summary.split()[:5]  # fallback: first 5 words
-            cluster_name = " ".join(cluster_name)
+    # Build Clusters (article ids, one article per source)
+    clusters = cluster_records(records, budget.stage("cluster"))
 
-        return summary, cluster_name
+    # Multithreaded Cluster Summarization
+    stage = budget.stage("naming")
 
     # Execute in parallel
-    output = {}
+    output = []
     with ThreadPoolExecutor(max_workers=THREADS) as executor:
-        futures = {executor.submit(summarize_and_name_cluster, arts): arts for arts in clusters.values()}
-        for idx, future in enumerate(as_completed(futures), 1):
-            arts = futures[future]
+        futures = {executor.submit(summarize_and_name_cluster, client, [records.summaries[i] for i in ids], stage): ids
+                   for ids in clusters}
+        for future in as_completed(futures):
             cluster_summary, cluster_name = future.result()
-            output[str(idx)] = {
-                "cluster_name": cluster_name,
-                "cluster_summary": cluster_summary,
-                "articles": arts
-            }
+            output.append((cluster_name, cluster_summary, futures[future]))
 
-    with open("rawdata.json", "w") as f:
-        json.dump(output, f, indent=4)
+    # articles are turned into JSON one at a time rather than as one big dict
+    write_rawdata(RAWDATA_PATH, records, output)
 
-    print(f"Saved {len(clusters)} clusters with AI-generated names to rawdata.json")
+    print(f"Saved {len(clusters)} clusters with AI-generated names to {RAWDATA_PATH}")
+    print(budget.report())
 
 main()
 
@@ -0,0 +1,678 @@
+"""
+Async ASGI serving mode for the read API.
+
+Serves the same GET routes and JSON shapes as server.py from Starlette with an
+async Supabase client, so a request waiting on the database does not hold a
+thread. Routes that need several queries issue them concurrently.
+
+    uvicorn asgi:app --workers 4 --port 5000
+    # or
+    WEB_CONCURRENCY=4 python asgi.py
+
+Writes (the POST endpoints) are still served by server.py. Admission control
+(admission.py) applies here as in server.py: AdmissionMiddleware rate limits
+each client per route, and gated() bounds the concurrent requests of each
+route class, inside the response cache. Each worker has its own buckets and
+slots. Response caching
+here needs REDIS_URL so that every worker sees the version bumped by writes;
+without it each request goes to the database and /api/graph is rebuilt at most
+every GRAPH_TTL seconds. Cache reads and writes go to Redis from worker
+threads, so a slow Redis does not stall the event loop.
+
+Search, related articles and the change feed use the same in-memory indexes
+and ChangeFeed as server.py, each over a blocking store called from worker
+threads. Every worker follows the change log to keep its indexes current, and
+/api/changes/stream waits on that instead of holding a thread per client.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from email.utils import formatdate
+from functools import wraps
+
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+import metrics
+from admission import Admission, client_key, resolve_class, retry_after
+from cache import ResponseCache, cache_key, not_modified
+from changes import ChangeFeed
+from db import (AsyncStore, create_async_store, create_store, CLUSTER_FIELDS, ARTICLE_FIELDS, TOPIC_FIELDS,
+                TOPIC_SELECT)
+from graph import build_graph, CLUSTER_GRAPH_FIELDS, ARTICLE_GRAPH_FIELDS
+from layout import layout_graph, load_positions, save_positions
+from params import article_route_class, parse_page_args, parse_ids, parse_limit, parse_time_range
+from search import SearchIndex, INDEX_FIELDS
+from semantic import SemanticIndex, EMBEDDING_FIELDS, embedding_rows, encode_query
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GRAPH_TTL = int(os.getenv("GRAPH_TTL", "60"))
+# how often an open /api/changes/stream checks the feed's version
+STREAM_CHECK_SECONDS = 1.0
+STREAM_KEEPALIVE = 15.0
+
+cache = ResponseCache(redis_url=os.getenv("REDIS_URL")) if os.getenv("REDIS_URL") else None
+store: AsyncStore = None
+# blocking store for the change feed and index builds, only called from worker threads
+sync_store = None
+feed: ChangeFeed = None
+request_metrics = metrics.RequestMetrics()
+# per-client rate limits and concurrency gates by route class, as in server.py
+admission = Admission.from_env()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global store, sync_store, feed
+    store = await create_async_store()
+    sync_store = create_store()
+    feed = ChangeFeed(sync_store)
+    # also what keeps feed.version current for the change streams
+    feed.watch(on_external_change)
+    yield
+
+
+def error(message, status):
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def gated(route_class):
+    """Async counterpart of Admission.gate: run the view in one of the class's slots, or answer 503."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request):
+            gate = admission.gate_for(resolve_class(route_class, request.query_params))
+            if gate is None:
+                return await view(request)
+            if not await gate.acquire_async():
+                return JSONResponse({"error": "Server busy, try again shortly"}, status_code=503,
+                                    headers={"Retry-After": retry_after(1)})
+            try:
+                return await view(request)
+            finally:
+                gate.release()
+        return wrapper
+    return decorator
+
+
+def _cache_state():
+    return cache.version, cache.last_modified
+
+
+def cached(view):
+    """Async counterpart of server.cached; a no-op without a shared cache."""
+    @wraps(view)
+    async def wrapper(request):
+        if cache is None:
+            return await view(request)
+
+        version, last_modified = await asyncio.to_thread(_cache_state)
+        key = cache_key(request.url.path, request.query_params.multi_items())
+        etag = cache.etag(key, version)
+        last_modified = int(last_modified)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(last_modified, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+
+        if not_modified(etag, last_modified,
+                        request.headers.get("if-none-match"),
+                        request.headers.get("if-modified-since")):
+            return Response(status_code=304, headers=headers)
+
+        entry = await asyncio.to_thread(cache.get, key, version)
+        if entry is not None:
+            return Response(entry[0], media_type=entry[1], headers=dict(headers, **{"X-Cache": "HIT"}))
+
+        response = await view(request)
+        # no-store: a stand-in answer (e.g. the previous graph) that must not be cached or revalidated
+        if response.status_code != 200 or "no-store" in response.headers.get("cache-control", ""):
+            return response
+        await asyncio.to_thread(cache.set, key, version, response.body, response.media_type)
+        response.headers.update(dict(headers, **{"X-Cache": "MISS"}))
+        return response
+    return wrapper
+
+
+async def home(request):
+    return PlainTextResponse("Hello, World!")
+
+
+async def health(request):
+    try:
+        await store.ping()
+        return JSONResponse({"status": "ok", "supabase_connected": True})
+    except Exception as e:
+        return JSONResponse({"status": "error", "supabase_connected": False, "error": str(e)}, status_code=503)
+
+
+@cached
+@gated("cheap")
+async def get_all_clusters(request):
+    try:
+        select, limit, cursor = parse_page_args(request.query_params, "cluster_id", CLUSTER_FIELDS)
+        since, until = parse_time_range(request.query_params)
+        ids = parse_ids(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        if ids is not None:
+            data, next_cursor = await store.get_clusters(ids, select), None
+        else:
+            data, next_cursor = await store.list_clusters(
+                select, limit, cursor,
+                since=since,
+                until=until,
+            )
+        return JSONResponse({"clusters": data, "total": len(data), "next_cursor": next_cursor})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@cached
+@gated(article_route_class)
+async def get_all_articles(request):
+    try:
+        select, limit, cursor = parse_page_args(request.query_params, "article_id", ARTICLE_FIELDS)
+        since, until = parse_time_range(request.query_params)
+        ids = parse_ids(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    cluster_id = request.query_params.get('cluster_id')
+    if cluster_id is not None and not cluster_id.isdigit():
+        return error("cluster_id must be an integer", 400)
+
+    try:
+        if ids is not None:
+            data, next_cursor = await store.get_articles(ids, select), None
+        else:
+            data, next_cursor = await store.list_articles(
+                select, limit, cursor,
+                cluster_id=int(cluster_id) if cluster_id is not None else None,
+                source=request.query_params.get('source'),
+                since=since,
+                until=until,
+            )
+        return JSONResponse({"articles": data, "total": len(data), "next_cursor": next_cursor})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+# per-process (version, graph) snapshot, laid out by one background task while
+# readers keep getting the previous graph; see server.get_graph_snapshot
+_graph_task = None
+_graph_pending = False
+_graph_snapshot = (None, None)
+_layout_positions = None
+
+
+async def _graph_version():
+    if cache is not None:
+        return await asyncio.to_thread(lambda: cache.version)
+    # no shared version counter: rebuild on a fixed interval instead
+    return -int(time.time() // GRAPH_TTL)
+
+
+async def build_graph_snapshot():
+    """Lay out the graph of the current data and swap it in (only ever run by the refresh task)."""
+    global _graph_snapshot, _layout_positions
+    version = await _graph_version()
+    if _graph_snapshot[0] == version:
+        return
+    clusters, articles = await asyncio.gather(
+        store.fetch_all('clusters', CLUSTER_GRAPH_FIELDS, 'cluster_id'),
+        store.fetch_all('articles', ARTICLE_GRAPH_FIELDS, 'article_id'),
+    )
+    graph = build_graph(clusters, articles)
+    if _layout_positions is None:
+        _layout_positions = await asyncio.to_thread(load_positions)
+    # the layout is CPU bound; keep it off the event loop
+    _layout_positions = await asyncio.to_thread(layout_graph, graph, _layout_positions)
+    await asyncio.to_thread(save_positions, _layout_positions)
+    _graph_snapshot = (version, graph)
+
+
+async def _run_graph_refresh():
+    global _graph_pending
+    while True:
+        _graph_pending = False
+        try:
+            await build_graph_snapshot()
+        except Exception as e:
+            logger.warning("Graph refresh failed: %s", e)
+        if not _graph_pending:
+            return
+
+
+def schedule_graph_refresh():
+    """Start a background layout, or queue one behind the running layout."""
+    global _graph_task, _graph_pending
+    if _graph_task is not None and not _graph_task.done():
+        _graph_pending = True
+        return
+    _graph_task = asyncio.create_task(_run_graph_refresh())
+
+
+async def get_graph_snapshot():
+    """
+    The latest laid-out (version, graph), which may be older than the data
+    while a refresh runs. Only the first request, with no graph yet, waits.
+
+    Raises:
+        RuntimeError: if there is no graph and the layout failed
+    """
+    snapshot = _graph_snapshot
+    if snapshot[0] == await _graph_version():
+        return snapshot
+    schedule_graph_refresh()
+    if snapshot[1] is None:
+        # wait() rather than await: a reader that disconnects must not cancel the layout for everyone else
+        await asyncio.wait({_graph_task})
+        snapshot = _graph_snapshot
+        if snapshot[1] is None:
+            raise RuntimeError("Graph layout failed; see the server log")
+    return snapshot
+
+
+@cached
+@gated("expensive")
+async def get_graph(request):
+    try:
+        version, graph = await get_graph_snapshot()
+        response = JSONResponse({
+            "nodes": graph["nodes"],
+            "links": graph["links"],
+            "version": version,
+            "node_count": len(graph["nodes"]),
+            "link_count": len(graph["links"])
+        })
+        if version != await _graph_version():
+            # the previous graph while the new one is laid out; not cached under the new version
+            response.headers["Cache-Control"] = "no-store"
+        return response
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@cached
+@gated("cheap")
+async def get_articles_by_cluster(request):
+    cluster_id = request.path_params["cluster_id"]
+    try:
+        cluster = await store.get_cluster_with_articles(cluster_id)
+        if not cluster:
+            return error("Cluster not found", 404)
+
+        articles = cluster.get('articles') or []
+        return JSONResponse({
+            "cluster_id": cluster_id,
+            "cluster_summary": cluster.get('cluster_summary'),
+            "articles": articles,
+            "article_count": len(articles)
+        })
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@cached
+@gated("cheap")
+async def get_cluster_by_id(request):
+    cluster_id = request.path_params["cluster_id"]
+    try:
+        cluster = await store.get_cluster(cluster_id, "cluster_id, cluster_summary")
+        if not cluster:
+            return error("Cluster not found", 404)
+        return JSONResponse({
+            "cluster_id": cluster.get("cluster_id"),
+            "cluster_title": cluster.get("cluster_summary")
+        })
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@cached
+@gated("cheap")
+async def get_all_topics(request):
+    try:
+        select, limit, cursor = parse_page_args(request.query_params, "topic_id", TOPIC_FIELDS)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        data, next_cursor = await store.list_topics(TOPIC_SELECT if select == "*" else select, limit, cursor)
+        return JSONResponse({"topics": data, "total": len(data), "next_cursor": next_cursor})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@cached
+@gated("cheap")
+async def get_clusters_by_topic(request):
+    try:
+        select, limit, cursor = parse_page_args(request.query_params, "cluster_id", CLUSTER_FIELDS)
+        since, until = parse_time_range(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    topic_id = request.path_params["topic_id"]
+    try:
+        topic, (data, next_cursor) = await asyncio.gather(
+            store.get_topic(topic_id, TOPIC_SELECT),
+            store.list_clusters(select, limit, cursor,
+                                since=since,
+                                until=until,
+                                topic_id=topic_id),
+        )
+        if not topic:
+            return error("Topic not found", 404)
+        return JSONResponse(dict(topic, clusters=data, total=len(data), next_cursor=next_cursor))
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@cached
+@gated("cheap")
+async def get_article_by_id(request):
+    try:
+        article = await store.get_article(request.path_params["article_id"])
+        if not article:
+            return error("Article not found", 404)
+        return JSONResponse({"article": article})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+# Full-text (search.py) and embedding (semantic.py) indexes, per worker, built
+# on the first query and extended from the change log; see server.py
+_search_lock = threading.Lock()
+_semantic_lock = threading.Lock()
+_search_index = None
+_semantic_index = None
+
+
+def get_search_index():
+    global _search_index
+    if _search_index is None:
+        with _search_lock:
+            if _search_index is None:
+                index = SearchIndex()
+                index.add_articles(sync_store.fetch_all('articles', INDEX_FIELDS, 'article_id'))
+                _search_index = index
+    return _search_index
+
+
+def get_semantic_index():
+    global _semantic_index
+    if _semantic_index is None:
+        with _semantic_lock:
+            if _semantic_index is None:
+                index = SemanticIndex()
+                index.add_articles(embedding_rows(sync_store.fetch_all('article_embeddings', EMBEDDING_FIELDS,
+                                                                       'article_id')))
+                _semantic_index = index
+    return _semantic_index
+
+
+def on_external_change(cluster_ids, article_ids):
+    """
+    Every write reaches this app through the change log (called from the
+    watcher thread). The shared cache version was bumped by the process that
+    wrote the rows, so only the indexes are updated here.
+    """
+    if os.getenv("WATCH_CHANGES", "on").lower() in ("off", "0", "false"):
+        return
+    if article_ids and _search_index is not None:
+        _search_index.add_articles(sync_store.get_articles(article_ids, INDEX_FIELDS))
+    if article_ids and _semantic_index is not None:
+        _semantic_index.add_articles(embedding_rows(sync_store.get_embeddings(article_ids, EMBEDDING_FIELDS)))
+
+
+def _search(query, limit):
+    if hasattr(sync_store, 'search_articles'):
+        # the SQLite backend answers from its own FTS5 index
+        return sync_store.search_articles(query, limit=limit)
+    return get_search_index().search(query, limit=limit)
+
+
+@cached
+@gated("expensive")
+async def search_articles(request):
+    query = (request.query_params.get('q') or "").strip()
+    if not query:
+        return error("q is required", 400)
+    try:
+        limit = parse_limit(request.query_params, 20, 100)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        results, total = await asyncio.to_thread(_search, query, limit)
+        return JSONResponse({"query": query, "results": results, "total": total})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@cached
+@gated("expensive")
+async def semantic_search_articles(request):
+    query = (request.query_params.get('q') or "").strip()
+    if not query:
+        return error("q is required", 400)
+    try:
+        limit = parse_limit(request.query_params, 10, 100)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        results = await asyncio.to_thread(lambda: get_semantic_index().search(encode_query(query), k=limit))
+        return JSONResponse({"query": query, "results": results, "total": len(results)})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@cached
+@gated("expensive")
+async def get_related_articles(request):
+    article_id = request.path_params["article_id"]
+    try:
+        limit = parse_limit(request.query_params, 10, 100)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    same_cluster = request.query_params.get('same_cluster') == "1"
+    try:
+        related = await asyncio.to_thread(
+            lambda: get_semantic_index().related(article_id, k=limit, same_cluster=same_cluster))
+        if related is None:
+            return error("Article not found or has no embedding", 404)
+        return JSONResponse({"article_id": article_id, "related": related, "total": len(related)})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+def parse_version(value, name):
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise ValueError(f"{name} must be a non-negative integer")
+    return int(value)
+
+
+@gated("cheap")
+async def get_changes(request):
+    try:
+        since = parse_version(request.query_params.get('since', "0"), "since")
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        return JSONResponse(await asyncio.to_thread(feed.changes_since, since))
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def change_events(since):
+    """Async counterpart of ChangeFeed.stream: checks the version the watcher thread keeps current."""
+    yield f"retry: {int(feed.poll_interval * 1000)}\n\n"
+    idle = 0.0
+    while True:
+        await asyncio.sleep(STREAM_CHECK_SECONDS)
+        version = feed.version
+        if version > since:
+            yield f"id: {version}\nevent: change\ndata: {json.dumps({'version': version, 'since': since})}\n\n"
+            since = version
+            idle = 0.0
+        else:
+            idle += STREAM_CHECK_SECONDS
+            if idle >= STREAM_KEEPALIVE:
+                yield ": keepalive\n\n"
+                idle = 0.0
+
+
+async def stream_changes(request):
+    try:
+        since = parse_version(request.headers.get("last-event-id") or request.query_params.get('since'), "since")
+        if since is None:
+            since = await asyncio.to_thread(lambda: feed.version)
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        return error(str(e), 500)
+
+    return StreamingResponse(change_events(since), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def get_metrics(request):
+    """Request and query metrics in Prometheus text format, for this worker."""
+    gauges = {"noogie_cache_version": await asyncio.to_thread(lambda: cache.version)} if cache is not None else {}
+    gauges.update(admission.gauges())
+    body = request_metrics.render(store.stats, gauges)
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class MetricsMiddleware:
+    """Per-route latency, status and response size, like metrics.install() for Flask."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        state = {"status": 500, "size": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["size"] += len(message.get("body", b""))
+            await send(message)
+
+        with request_metrics._lock:
+            request_metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            with request_metrics._lock:
+                request_metrics.in_flight -= 1
+            route = scope.get("route")
+            # per-request database time is not tracked here: queries of concurrent requests interleave on one loop
+            request_metrics.observe(route.path if route is not None else "unmatched", scope["method"],
+                                    state["status"], time.perf_counter() - start, state["size"], None, None)
+
+
+class AdmissionMiddleware:
+    """Per-client rate limits by route class, like Admission.limit on server.py's routes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not admission.enabled:
+            return await self.app(scope, receive, send)
+        route = next((r for r in routes if r.matches(scope)[0] == Match.FULL), None)
+        route_class = ROUTE_CLASSES.get(route.path) if route is not None else None
+        if route_class is not None:
+            request = Request(scope)
+            client = client_key(request.headers, request.client.host if request.client else None)
+            wait = admission.admit(resolve_class(route_class, request.query_params), client, route.name)
+            if wait:
+                response = JSONResponse({"error": "Rate limit exceeded"}, status_code=429,
+                                        headers={"Retry-After": retry_after(wait)})
+                return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+# admission classes, as in server.py; routes not listed are not limited
+ROUTE_CLASSES = {
+    "/api/clusters": "cheap",
+    "/api/articles": article_route_class,
+    "/api/graph": "expensive",
+    "/api/clusters/{cluster_id:int}/articles": "cheap",
+    "/api/clusters/{cluster_id:int}": "cheap",
+    "/api/articles/{article_id:int}": "cheap",
+    "/api/topics": "cheap",
+    "/api/topics/{topic_id:int}/clusters": "cheap",
+    "/api/search": "expensive",
+    "/api/search/semantic": "expensive",
+    "/api/articles/{article_id:int}/related": "expensive",
+    "/api/changes": "cheap",
+    # rate limited, but takes no slot: it is held open
+    "/api/changes/stream": "cheap",
+}
+
+routes = [
+    Route("/server", home),
+    Route("/health", health),
+    Route("/api/clusters", get_all_clusters),
+    Route("/api/articles", get_all_articles),
+    Route("/api/graph", get_graph),
+    Route("/api/clusters/{cluster_id:int}/articles", get_articles_by_cluster),
+    Route("/api/clusters/{cluster_id:int}", get_cluster_by_id),
+    Route("/api/articles/{article_id:int}", get_article_by_id),
+    Route("/api/topics", get_all_topics),
+    Route("/api/topics/{topic_id:int}/clusters", get_clusters_by_topic),
+    Route("/api/search", search_articles),
+    Route("/api/search/semantic", semantic_search_articles),
+    Route("/api/articles/{article_id:int}/related", get_related_articles),
+    Route("/api/changes", get_changes),
+    Route("/api/changes/stream", stream_changes),
+    Route("/metrics", get_metrics),
+]
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[
+        Middleware(MetricsMiddleware),
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["GET"], allow_headers=["*"]),
+        Middleware(AdmissionMiddleware),
+    ],
+)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "asgi:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "5000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "4")),
+    )
@@ -0,0 +1,159 @@
+"""
+Run deadlines and per-source circuit breakers for the pipeline (app.py).
+
+An hourly run has to finish before the next cron tick however slow an outlet
+or the OpenAI API is. RunBudget gives the run a deadline (RUN_BUDGET_SECONDS)
+and splits it into stage budgets: each stage may use the time left minus what
+is reserved for the stages after it, so time one stage does not use rolls
+over to the next. A stage that runs out stops and the run carries on with
+what it collected. A source's own limit (SourceDeadline) starts when its
+first request does, not when its work was queued behind other sources.
+
+CircuitBreakers remember which sources failed or timed out on recent runs
+(CIRCUIT_BREAKER_PATH). After BREAKER_FAILURES failures in a row a source is
+skipped for BREAKER_COOLDOWN_MINUTES, then tried once more: a success closes
+the breaker, another failure opens it for a new cooldown.
+"""
+import json
+import os
+import threading
+import time
+
+RUN_BUDGET_SECONDS = float(os.getenv("RUN_BUDGET_SECONDS", "2700"))
+# whole-source limit (a feed and its articles, or an outlet's downloads)
+SOURCE_TIMEOUT = float(os.getenv("SOURCE_TIMEOUT", "240"))
+# single HTTP request limit
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "15"))
+
+# share of the run reserved for each stage, in run order; the rest is slack for the last one
+STAGE_SHARES = {"rss": 0.3, "newspaper": 0.3, "summaries": 0.15, "encode": 0.05, "cluster": 0.05, "naming": 0.1}
+
+CIRCUIT_BREAKER_PATH = os.getenv("CIRCUIT_BREAKER_PATH", "circuit_breakers.json")
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "2"))
+BREAKER_COOLDOWN_MINUTES = float(os.getenv("BREAKER_COOLDOWN_MINUTES", "180"))
+
+
+class Deadline:
+    """A point in time.monotonic() that work checks against."""
+
+    def __init__(self, at):
+        self.at = at
+
+    @classmethod
+    def after(cls, seconds):
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self):
+        return max(0.0, self.at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.at
+
+    def sooner(self, seconds):
+        """This deadline or now + seconds, whichever comes first."""
+        return Deadline(min(self.at, time.monotonic() + seconds))
+
+    def timeout(self, limit=REQUEST_TIMEOUT):
+        """A request timeout that respects both limit and this deadline (never 0, requests rejects it)."""
+        return max(0.1, min(limit, self.remaining()))
+
+
+class SourceDeadline:
+    """
+    A source's SOURCE_TIMEOUT within a stage, counted from its first request.
+
+    Work queued behind other sources does not use up the source's time, and a
+    source cut short by the stage's deadline rather than its own did not time
+    out (timed_out() is False), so its circuit breaker is left alone.
+    """
+
+    def __init__(self, stage, seconds=SOURCE_TIMEOUT):
+        self.stage = stage
+        self.seconds = seconds
+        self._deadline = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """The source's deadline, started by the first call."""
+        with self._lock:
+            if self._deadline is None:
+                self._deadline = self.stage.sooner(self.seconds)
+            return self._deadline
+
+    def timed_out(self):
+        """True once the source has used up its own time."""
+        deadline = self._deadline
+        return deadline is not None and deadline.at < self.stage.at and deadline.expired()
+
+
+class RunBudget:
+    def __init__(self, seconds=RUN_BUDGET_SECONDS, shares=STAGE_SHARES):
+        """
+        Args:
+            seconds: the whole run's budget, starting now
+            shares: stage name -> fraction of the run reserved for it, in run order
+        """
+        self.seconds = seconds
+        self.shares = dict(shares)
+        self.started = time.monotonic()
+        self.deadline = Deadline(self.started + seconds)
+
+    def stage(self, name):
+        """
+        The deadline for a stage: the run deadline minus the time reserved for later stages.
+
+        Raises:
+            KeyError: if name is not one of the configured stages
+        """
+        names = list(self.shares)
+        later = sum(self.shares[n] for n in names[names.index(name) + 1:])
+        return Deadline(self.deadline.at - later * self.seconds)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def report(self):
+        return f"Run took {self.elapsed():.0f}s of its {self.seconds:.0f}s budget"
+
+
+class CircuitBreakers:
+    def __init__(self, path=CIRCUIT_BREAKER_PATH, failures=BREAKER_FAILURES,
+                 cooldown_minutes=BREAKER_COOLDOWN_MINUTES):
+        self.path = path
+        self.failures = failures
+        self.cooldown = cooldown_minutes * 60
+        self.state = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[!] Ignoring unreadable {path}: {e}")
+
+    def allow(self, source):
+        """False while source's breaker is open and cooling down."""
+        entry = self.state.get(source)
+        if not entry or entry["failures"] < self.failures:
+            return True
+        return time.time() - entry["opened_at"] >= self.cooldown
+
+    def success(self, source):
+        self.state.pop(source, None)
+
+    def failure(self, source, error):
+        entry = self.state.setdefault(source, {"failures": 0, "opened_at": 0})
+        entry["failures"] += 1
+        entry["error"] = str(error)[:200]
+        if entry["failures"] >= self.failures:
+            entry["opened_at"] = time.time()
+
+    def open_sources(self):
+        return sorted(source for source in self.state if not self.allow(source))
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.path)
@@ -0,0 +1,139 @@
+"""
+Versioned response cache for the read API.
+
+Cached GET responses are keyed by route + query string and tagged with the
+dataset version. Write endpoints bump the version, which invalidates every
+cached entry at once instead of tracking which rows a response touched.
+
+The cache is in-process by default. Setting REDIS_URL shares the version
+counter and the cached bodies between worker processes.
+
+Versions restart at 1 with the process (or with an emptied Redis), so ETags
+also carry an epoch: a random id per process, or per Redis dataset when
+shared. A client holding an ETag from before a restart, or from another worker
+with its own counter, then revalidates instead of getting a 304 for data that
+has changed since.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+
+
+def cache_key(path, query_items):
+    """Route + normalised query, so ?a=1&b=2 and ?b=2&a=1 share an entry."""
+    return path + "?" + urlencode(sorted(query_items))
+
+
+def not_modified(etag, last_modified, if_none_match=None, if_modified_since=None):
+    """Whether conditional request headers allow a 304 for this etag / timestamp."""
+    if if_none_match:
+        return etag in [t.strip() for t in if_none_match.split(",")]
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= int(last_modified)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, redis_url=None, ttl=3600):
+        """
+        Args:
+            max_entries: size of the in-process LRU
+            redis_url: optional Redis URL to share entries across processes
+            ttl: expiry in seconds for shared entries
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = 1
+        self._modified = time.time()
+        self._redis = None
+        self.epoch = os.urandom(4).hex()
+
+        if redis_url:
+            import redis  # optional dependency, only needed for a shared cache
+            self._redis = redis.Redis.from_url(redis_url)
+            self._redis.setnx("noogie:version", 1)
+            self._redis.setnx("noogie:modified", self._modified)
+            self._redis.setnx("noogie:epoch", self.epoch)
+            self.epoch = self._redis.get("noogie:epoch").decode("utf-8")
+
+    @property
+    def shared(self):
+        """Whether the version lives in Redis, where every worker sees a bump made by any process."""
+        return self._redis is not None
+
+    @property
+    def version(self):
+        if self._redis is not None:
+            return int(self._redis.get("noogie:version") or 1)
+        return self._version
+
+    @property
+    def last_modified(self):
+        if self._redis is not None:
+            return float(self._redis.get("noogie:modified") or self._modified)
+        return self._modified
+
+    def bump_version(self):
+        """Invalidate all cached responses. Called by every write endpoint."""
+        now = time.time()
+        if self._redis is not None:
+            pipe = self._redis.pipeline()
+            pipe.incr("noogie:version")
+            pipe.set("noogie:modified", now)
+            version = pipe.execute()[0]
+        else:
+            with self._lock:
+                self._version += 1
+                self._modified = now
+                version = self._version
+        with self._lock:
+            self._entries.clear()
+        return version
+
+    def etag(self, key, version=None):
+        """ETag for a cache key; the body of a key is fully determined by the epoch and dataset version."""
+        version = self.version if version is None else version
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+        return f'"{self.epoch}-v{version}-{digest}"'
+
+    def get(self, key, version):
+        """Return the cached (body, mimetype) for key at version, or None."""
+        with self._lock:
+            entry = self._entries.get((version, key))
+            if entry is not None:
+                self._entries.move_to_end((version, key))
+                return entry
+
+        if self._redis is not None:
+            shared = self._redis.hmget(f"noogie:resp:{version}:{key}", "body", "mimetype")
+            if shared[0] is not None:
+                entry = (shared[0], shared[1].decode("utf-8"))
+                self._store_local(key, version, entry)
+                return entry
+        return None
+
+    def set(self, key, version, body, mimetype):
+        entry = (body, mimetype)
+        self._store_local(key, version, entry)
+        if self._redis is not None:
+            name = f"noogie:resp:{version}:{key}"
+            pipe = self._redis.pipeline()
+            pipe.hset(name, mapping={"body": body, "mimetype": mimetype})
+            pipe.expire(name, self.ttl)
+            pipe.execute()
+
+    def _store_local(self, key, version, entry):
+        with self._lock:
+            self._entries[(version, key)] = entry
+            self._entries.move_to_end((version, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,193 @@
+"""
+Change feed for incremental client sync.
+
+Every upload that creates rows appends one entry to the changes table: a
+monotonically increasing version plus the ids of the clusters and articles it
+added or updated (a cluster counts as updated when articles were added to it).
+Clients remember the last version they saw and ask /api/changes?since=<version>
+for just the rows that changed after it, or keep /api/changes/stream open to be
+told over server-sent events when a new batch lands.
+
+ChangeFeed wakes streaming clients as soon as this process records a change,
+and polls the table (at most once per POLL_INTERVAL) to notice changes written
+by other processes: other API workers, or the pipeline writing directly
+through writer.py. ChangeFeed.watch() hands those external changes to a
+callback so the server can drop cached responses and index the new rows.
+"""
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 5.0
+# most clusters / articles returned per /api/changes response
+MAX_CHANGED_ROWS = 1000
+
+CHANGED_CLUSTER_FIELDS = "cluster_id, cluster_title, cluster_summary, created_at"
+# article text is left out; clients fetch it on demand from /api/articles/<id>
+CHANGED_ARTICLE_FIELDS = "article_id, cluster_id, title, article_summary, source, created_at"
+
+
+def changed_ids(results):
+    """
+    Cluster and article ids touched by a list of ingest.group_results() entries.
+
+    Returns:
+        Tuple of (cluster_ids, article_ids)
+    """
+    cluster_ids = []
+    article_ids = []
+    for result in results:
+        if result["created"] or result["articles"]:
+            cluster_ids.append(result["cluster"]["cluster_id"])
+        article_ids.extend(a["article_id"] for a in result["articles"])
+    return cluster_ids, article_ids
+
+
+class ChangeFeed:
+    def __init__(self, store, poll_interval=POLL_INTERVAL):
+        self.store = store
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._version = None
+        self._polled_at = 0.0
+        # versions this process recorded itself, which watch() does not report
+        self._own = set()
+
+    @property
+    def version(self):
+        """Latest known change version (0 before the first change)."""
+        if self._version is None:
+            self._poll()
+        return self._version
+
+    def _poll(self):
+        version = self.store.latest_change_version()
+        with self._cond:
+            self._polled_at = time.monotonic()
+            if self._version is None or version > self._version:
+                self._version = version
+                self._cond.notify_all()
+
+    def record(self, cluster_ids, article_ids):
+        """
+        Append a change entry if anything changed and wake waiting streams.
+
+        Returns:
+            The new version, or None if there was nothing to record
+        """
+        if not cluster_ids and not article_ids:
+            return None
+        version = self.store.record_change(list(dict.fromkeys(cluster_ids)), list(dict.fromkeys(article_ids)))
+        with self._cond:
+            self._own.add(version)
+            if self._version is None or version > self._version:
+                self._version = version
+            self._cond.notify_all()
+        return version
+
+    def wait(self, since, timeout):
+        """
+        Block until the version passes since or timeout seconds elapse.
+
+        Returns:
+            The latest known version (equal to since on timeout)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            version = self.version
+            if version > since:
+                return version
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return version
+            if time.monotonic() - self._polled_at >= self.poll_interval:
+                self._poll()
+                continue
+            with self._cond:
+                self._cond.wait(min(remaining, self.poll_interval))
+
+    def changes_since(self, since, max_rows=MAX_CHANGED_ROWS):
+        """
+        Rows changed after version since.
+
+        Whole change entries are returned, oldest first, until max_rows
+        clusters or articles are collected; "has_more" tells the client to ask
+        again with the returned version.
+
+        Returns:
+            Dictionary with version, has_more, clusters and articles
+        """
+        entries = self.store.changes_since(since, limit=max_rows + 1)
+        cluster_ids = {}
+        article_ids = {}
+        version = since
+        has_more = False
+        for entry in entries:
+            if version > since and (len(cluster_ids) + len(entry["cluster_ids"]) > max_rows
+                                    or len(article_ids) + len(entry["article_ids"]) > max_rows):
+                has_more = True
+                break
+            cluster_ids.update(dict.fromkeys(entry["cluster_ids"]))
+            article_ids.update(dict.fromkeys(entry["article_ids"]))
+            version = entry["version"]
+        else:
+            has_more = len(entries) > max_rows
+
+        return {
+            "version": version,
+            "has_more": has_more,
+            "clusters": self.store.get_clusters(list(cluster_ids), CHANGED_CLUSTER_FIELDS) if cluster_ids else [],
+            "articles": self.store.get_articles(list(article_ids), CHANGED_ARTICLE_FIELDS) if article_ids else [],
+        }
+
+    def stream(self, since, keepalive=15.0):
+        """
+        Server-sent events: one "change" event per new version, with a
+        comment line every keepalive seconds so proxies keep the connection open.
+        """
+        yield f"retry: {int(self.poll_interval * 1000)}\n\n"
+        while True:
+            version = self.wait(since, keepalive)
+            if version > since:
+                yield f"id: {version}\nevent: change\ndata: {json.dumps({'version': version, 'since': since})}\n\n"
+                since = version
+            else:
+                yield ": keepalive\n\n"
+
+    def watch(self, callback, batch=MAX_CHANGED_ROWS):
+        """
+        Call callback(cluster_ids, article_ids) from a daemon thread whenever
+        another process records a change. Changes this feed recorded itself
+        are skipped.
+
+        Returns:
+            The watcher thread
+        """
+        # taken before the thread starts, so a change recorded meanwhile is not missed
+        start = self.version
+
+        def run():
+            seen = start
+            while True:
+                try:
+                    version = self.wait(seen, self.poll_interval)
+                    if version <= seen:
+                        continue
+                    entries = self.store.changes_since(seen, limit=batch)
+                    with self._cond:
+                        external = [e for e in entries if e["version"] not in self._own]
+                        self._own = {v for v in self._own if v > entries[-1]["version"]} if entries else self._own
+                    if external:
+                        callback([c for e in external for c in e["cluster_ids"]],
+                                 [a for e in external for a in e["article_ids"]])
+                    seen = entries[-1]["version"] if entries else version
+                except Exception:
+                    logger.exception("change watcher failed; retrying in %.0fs", self.poll_interval)
+                    time.sleep(self.poll_interval)
+
+        thread = threading.Thread(target=run, name="change-watcher", daemon=True)
+        thread.start()
+        return thread
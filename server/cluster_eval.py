@@ -0,0 +1,480 @@
+"""
+Clustering parameter sweep and scaling harness.
+
+app.py clusters article summary embeddings with agglomerative clustering
+(distance_threshold=1.2, linkage="average"). This script measures how that
+choice and its alternatives trade quality for runtime and memory.
+
+    python cluster_eval.py sweep                     # thresholds x linkages x engines on the stored embeddings
+    python cluster_eval.py sweep --thresholds 0.9,1.0,1.1,1.2,1.3 --engines agglomerative,faiss_single
+    python cluster_eval.py scale --sizes 1k,5k,10k,20k,50k --plot cluster_scaling.png
+
+Embeddings come from the article_embeddings table (STORAGE_BACKEND, see db.py).
+With --rawdata, or when the table is empty, they are bootstrapped by encoding
+the summaries in rawdata.json with the pipeline's model. Ground truth for the
+agreement scores is a labelled subset given with --labels (a JSON object
+mapping article title to a label). Without it, the stored cluster assignments
+are used, which only tells how far a setting moves away from the current one.
+
+Engines:
+    agglomerative  sklearn AgglomerativeClustering; linkage average, complete, single or ward
+    faiss_single   exact single linkage at the threshold: FAISS range search plus connected
+                   components, without the n x n distance matrix
+    leader         one pass, each article joins the nearest cluster leader within the threshold
+    dbscan         sklearn DBSCAN with eps=threshold, min_samples=2
+    hdbscan        sklearn HDBSCAN, min_cluster_size=2; density based, so it takes no threshold
+    birch          sklearn Birch with half the threshold as subcluster radius
+
+Each run reports runtime, peak memory (the tracemalloc peak, which covers
+NumPy and scikit-learn arrays, and resident set growth, which also covers
+FAISS but misses memory the process already held),
+the number of clusters and their size distribution, the silhouette score (on
+at most SILHOUETTE_SAMPLE articles) and adjusted Rand index / normalised
+mutual information against the labels. Articles an engine leaves as noise
+count as singleton clusters.
+
+For scaling, synthetic corpora of the requested sizes are drawn around the
+real embeddings. Each cluster centre is a random mix of three real articles,
+so there are far more distinct centres than real articles, and members are
+the centre plus Gaussian noise matching the real within-cluster spread. Every
+synthetic article therefore has a known label.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import warnings
+from collections import Counter
+
+import faiss
+import numpy as np
+import psutil
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import DBSCAN, HDBSCAN, AgglomerativeClustering, Birch
+from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score, silhouette_score
+
+from ingest import EMBEDDING_DIM
+
+RAWDATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rawdata.json")
+# the current app.py setting, marked in reports
+CURRENT = ("agglomerative", "average", 1.2)
+ENGINES = ("agglomerative", "faiss_single", "leader", "dbscan", "hdbscan", "birch")
+LINKAGES = ("average", "complete", "single", "ward")
+SILHOUETTE_SAMPLE = 5000
+# articles per cluster in the synthetic corpora, about what the pipeline produces
+SYNTHETIC_CLUSTER_SIZE = 2.5
+# rows per FAISS range search call
+RANGE_BATCH = 4096
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def _floats(text):
+    return [float(x) for x in text.split(",") if x.strip()]
+
+
+def _names(text, allowed, what):
+    names = [x.strip() for x in text.split(",") if x.strip()]
+    unknown = [n for n in names if n not in allowed]
+    if unknown:
+        raise SystemExit(f"Unknown {what}: {', '.join(unknown)} (choose from {', '.join(allowed)})")
+    return names
+
+
+# --- data ---
+
+def load_stored():
+    """
+    Embeddings and metadata from the article_embeddings table.
+
+    Returns:
+        Tuple of (float32 matrix, list of {"title", "cluster_id"})
+    """
+    from dotenv import load_dotenv
+    from db import create_store
+    from semantic import EMBEDDING_FIELDS, embedding_rows
+
+    load_dotenv()
+    rows = embedding_rows(create_store().fetch_all('article_embeddings', EMBEDDING_FIELDS, 'article_id'))
+    vectors = np.array([r['embedding'] for r in rows], dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    return vectors, [{"title": r.get('title'), "cluster_id": r.get('cluster_id')} for r in rows]
+
+
+def load_rawdata(path=RAWDATA_PATH):
+    """
+    Encode the article summaries in rawdata.json with the pipeline's model
+    (embeddings already in the file are used as they are).
+
+    Returns:
+        Tuple of (float32 matrix, list of {"title", "cluster_id"})
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    articles = [(cluster_id, a) for cluster_id, cluster in raw.items() for a in cluster["articles"]]
+    meta = [{"title": a["title"], "cluster_id": cluster_id} for cluster_id, a in articles]
+    if all(a.get("embedding") for _, a in articles):
+        return np.array([a["embedding"] for _, a in articles], dtype=np.float32), meta
+
+    from semantic import get_model
+    vectors = get_model().encode([a["article_summary"] for _, a in articles], batch_size=64, show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32), meta
+
+
+def label_array(meta, labels_path=None):
+    """
+    Ground-truth labels per article, -1 where an article is not in the labelled subset.
+
+    Args:
+        meta: list of {"title", "cluster_id"} from load_stored() / load_rawdata()
+        labels_path: JSON {title: label}; default is the stored cluster assignment
+    """
+    if labels_path:
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            by_title = json.load(f)
+        keys = [by_title.get(m["title"]) for m in meta]
+    else:
+        keys = [m["cluster_id"] for m in meta]
+    codes = {}
+    return np.array([-1 if k is None else codes.setdefault(k, len(codes)) for k in keys], dtype=np.int64)
+
+
+def within_cluster_sigma(vectors, labels):
+    """Per-dimension standard deviation of articles around their cluster centroid."""
+    residuals = []
+    for label in np.unique(labels[labels >= 0]):
+        members = vectors[labels == label]
+        if len(members) > 1:
+            residuals.append(members - members.mean(axis=0))
+    if not residuals:
+        return 0.4 / np.sqrt(vectors.shape[1])
+    return float(np.concatenate(residuals).std())
+
+
+def synthetic_corpus(base, n, sigma, cluster_size=SYNTHETIC_CLUSTER_SIZE, seed=0):
+    """
+    n unit vectors in about n / cluster_size clusters, centred on random mixes of rows of base.
+
+    Returns:
+        Tuple of (float32 matrix, int64 labels)
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, int(round(n / cluster_size)))
+    mix = rng.dirichlet(np.ones(3), n_clusters)
+    centres = np.einsum("ck,ckd->cd", mix, base[rng.integers(0, len(base), (n_clusters, 3))])
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    # every cluster gets one member; the rest go to clusters in proportion to
+    # Pareto weights, giving many singletons and a few large stories
+    weights = rng.pareto(3.0, n_clusters) + 1
+    extra = rng.choice(n_clusters, max(0, n - n_clusters), p=weights / weights.sum())
+    labels = np.concatenate([np.arange(n_clusters), extra])[:n]
+    vectors = centres[labels] + rng.normal(0, sigma, (n, base.shape[1]))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32), labels.astype(np.int64)
+
+
+# --- engines ---
+
+def _components(n, pairs):
+    rows, cols = pairs
+    graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+    return connected_components(graph, directed=False)[1]
+
+
+def faiss_single(vectors, threshold):
+    """Single-linkage clusters at threshold: components of the graph of pairs closer than threshold."""
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    rows, cols = [], []
+    for start in range(0, len(vectors), RANGE_BATCH):
+        lims, _, ids = index.range_search(vectors[start:start + RANGE_BATCH], threshold ** 2)
+        counts = np.diff(lims).astype(np.int64)
+        rows.append(np.repeat(np.arange(start, start + len(counts)), counts))
+        cols.append(ids)
+    return _components(len(vectors), (np.concatenate(rows), np.concatenate(cols)))
+
+
+def leader(vectors, threshold):
+    """One pass: join the nearest cluster leader within threshold, else lead a new cluster."""
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for i, vector in enumerate(vectors):
+        if index.ntotal:
+            distance, nearest = index.search(vector[None, :], 1)
+            if distance[0, 0] <= threshold ** 2:
+                labels[i] = nearest[0, 0]
+                continue
+        labels[i] = index.ntotal
+        index.add(vector[None, :])
+    return labels
+
+
+def run_engine(engine, vectors, threshold, linkage=None):
+    """
+    Cluster vectors with one engine.
+
+    Returns:
+        Labels per row; noise (-1) is returned as is
+    """
+    if engine == "agglomerative":
+        return AgglomerativeClustering(n_clusters=None, distance_threshold=threshold,
+                                       linkage=linkage).fit(vectors).labels_
+    if engine == "faiss_single":
+        return faiss_single(vectors, threshold)
+    if engine == "leader":
+        return leader(vectors, threshold)
+    if engine == "dbscan":
+        return DBSCAN(eps=threshold, min_samples=2).fit(vectors).labels_
+    if engine == "hdbscan":
+        with warnings.catch_warnings():
+            # newer scikit-learn warns about a changing `copy` default we do not depend on
+            warnings.simplefilter("ignore", FutureWarning)
+            return HDBSCAN(min_cluster_size=2).fit(vectors).labels_
+    if engine == "birch":
+        return Birch(threshold=threshold / 2, n_clusters=None).fit(vectors).labels_
+    raise ValueError(f"Unknown engine {engine!r}")
+
+
+def estimated_memory_gb(engine, n):
+    """Rough working set of an engine on n articles, used to skip runs that cannot fit."""
+    if engine == "agglomerative":
+        # measured about 8 bytes per pair: distance matrix plus linkage bookkeeping
+        return 8 * n * n / 1e9
+    return 0.0
+
+
+class PeakRSS:
+    """Samples this process's resident memory in a thread; growth_mb is the peak growth over the block."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self.growth_mb = 0.0
+
+    def __enter__(self):
+        self._start = self._process.memory_info().rss
+        self._peak = self._start
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, self._process.memory_info().rss)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, self._process.memory_info().rss)
+        self.growth_mb = round((self._peak - self._start) / 1e6, 1)
+
+
+# --- metrics ---
+
+def singletons_for_noise(labels):
+    """Give every noise article (-1) a cluster of its own."""
+    labels = np.asarray(labels, dtype=np.int64).copy()
+    noise = labels < 0
+    labels[noise] = labels.max(initial=-1) + 1 + np.arange(noise.sum())
+    return labels
+
+
+def size_distribution(labels):
+    sizes = np.array(sorted(Counter(labels.tolist()).values()))
+    return {
+        "clusters": int(len(sizes)),
+        "singletons": int((sizes == 1).sum()),
+        "median_size": float(np.median(sizes)),
+        "p90_size": round(float(np.percentile(sizes, 90)), 1),
+        "max_size": int(sizes.max()),
+    }
+
+
+def quality(vectors, labels, truth):
+    """Silhouette on a sample plus agreement with the labelled subset (truth >= 0)."""
+    scores = {"silhouette": None, "ari": None, "nmi": None}
+    n_clusters = len(np.unique(labels))
+    if 2 <= n_clusters < len(labels):
+        sample = min(len(labels), SILHOUETTE_SAMPLE)
+        scores["silhouette"] = round(float(silhouette_score(vectors, labels, sample_size=sample, random_state=0)), 4)
+    labelled = truth >= 0
+    if labelled.sum() > 1:
+        scores["ari"] = round(float(adjusted_rand_score(truth[labelled], labels[labelled])), 4)
+        scores["nmi"] = round(float(normalized_mutual_info_score(truth[labelled], labels[labelled])), 4)
+    return scores
+
+
+def evaluate(engine, vectors, threshold, linkage, truth, score=True):
+    """
+    One clustering run with its runtime, memory, size distribution and (if score) quality.
+
+    Returns:
+        Dictionary of results
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    with PeakRSS() as memory:
+        labels = run_engine(engine, vectors, threshold, linkage)
+    elapsed = time.perf_counter() - start
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    labels = singletons_for_noise(labels)
+    result = {
+        "engine": engine,
+        "linkage": linkage,
+        "threshold": threshold,
+        "n": len(vectors),
+        "seconds": round(elapsed, 3),
+        "peak_mb": round(traced_peak / 1e6, 1),
+        "rss_growth_mb": memory.growth_mb,
+        **size_distribution(labels),
+    }
+    if score:
+        result.update(quality(vectors, labels, truth))
+    return result
+
+
+def safe_evaluate(engine, vectors, threshold, linkage, truth, score=True):
+    """evaluate(), with a failing engine reported as an "error" entry instead of ending the run."""
+    try:
+        return evaluate(engine, vectors, threshold, linkage, truth, score)
+    except Exception as e:
+        return {"engine": engine, "linkage": linkage, "threshold": threshold, "n": len(vectors), "error": str(e)}
+
+
+def configurations(engines, linkages, thresholds):
+    for engine in engines:
+        for linkage in (linkages if engine == "agglomerative" else [None]):
+            for threshold in (thresholds if engine != "hdbscan" else [None]):
+                yield engine, linkage, threshold
+
+
+# --- commands ---
+
+def sweep(args):
+    vectors, meta = load_rawdata() if args.rawdata else load_stored()
+    if not len(vectors):
+        print("No stored embeddings; bootstrapping from rawdata.json")
+        vectors, meta = load_rawdata()
+    truth = label_array(meta, args.labels)
+    print(f"{len(vectors)} articles, {int((truth >= 0).sum())} labelled "
+          f"({'--labels ' + args.labels if args.labels else 'stored cluster assignments'})")
+
+    results = []
+    for engine, linkage, threshold in configurations(_names(args.engines, ENGINES, "engine"),
+                                                     _names(args.linkages, LINKAGES, "linkage"),
+                                                     _floats(args.thresholds)):
+        result = safe_evaluate(engine, vectors, threshold, linkage, truth)
+        result["current"] = (engine, linkage, threshold) == CURRENT
+        results.append(result)
+        print_row(result)
+    return {"sweep": results}
+
+
+def scale(args):
+    base, meta = load_rawdata() if args.rawdata else load_stored()
+    if not len(base):
+        base, meta = load_rawdata()
+    sigma = within_cluster_sigma(base, label_array(meta))
+    engines = _names(args.engines, ENGINES, "engine")
+    linkages = _names(args.linkages, LINKAGES, "linkage")
+    print(f"Synthetic corpora around {len(base)} real articles, within-cluster sigma {sigma:.4f}")
+
+    results = []
+    for n in (parse_size(s) for s in args.sizes.split(",")):
+        vectors, truth = synthetic_corpus(base, n, sigma, seed=args.seed)
+        for engine, linkage, threshold in configurations(engines, linkages, [args.threshold]):
+            if estimated_memory_gb(engine, n) > args.max_memory_gb:
+                print(f"  skip {engine}/{linkage} at n={n}: needs ~{estimated_memory_gb(engine, n):.0f} GB")
+                continue
+            result = safe_evaluate(engine, vectors, threshold, linkage, truth, score=not args.no_quality)
+            results.append(result)
+            print_row(result)
+    if args.plot:
+        plot_scaling(results, args.plot)
+        print(f"Saved scaling plot to {args.plot}")
+    return {"scale": results, "sigma": sigma}
+
+
+def print_row(r):
+    name = r["engine"] + (f"/{r['linkage']}" if r["linkage"] else "")
+    if "error" in r:
+        print(f"  {name:<26} t={str(r['threshold']):<5} n={r['n']:<6} failed: {r['error']}")
+        return
+    scores = "  ".join(f"{k} {r[k]}" for k in ("silhouette", "ari", "nmi") if r.get(k) is not None)
+    print(f"  {name:<26} t={str(r['threshold']):<5} n={r['n']:<6} {r['seconds']:>8.3f}s {r['peak_mb']:>8.1f}MB (rss +{r['rss_growth_mb']:.0f})  "
+          f"clusters {r['clusters']:<6} singletons {r['singletons']:<6} max {r['max_size']:<5} {scores}"
+          + ("  <- current" if r.get("current") else ""))
+
+
+def plot_scaling(results, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, (runtime, memory) = plt.subplots(1, 2, figsize=(12, 5))
+    series = {}
+    for r in results:
+        if "error" in r:
+            continue
+        name = r["engine"] + (f"/{r['linkage']}" if r["linkage"] else "")
+        series.setdefault(name, []).append(r)
+    for name, rows in series.items():
+        rows.sort(key=lambda r: r["n"])
+        n = [r["n"] for r in rows]
+        runtime.plot(n, [max(r["seconds"], 1e-3) for r in rows], marker="o", label=name)
+        memory.plot(n, [max(r["peak_mb"], r["rss_growth_mb"], 0.1) for r in rows], marker="o", label=name)
+    for axis, ylabel in ((runtime, "seconds"), (memory, "peak memory (MB)")):
+        axis.set_xscale("log")
+        axis.set_yscale("log")
+        axis.set_xlabel("articles")
+        axis.set_ylabel(ylabel)
+        axis.grid(True, which="both", alpha=0.3)
+    runtime.legend()
+    fig.suptitle("Clustering runtime and memory by corpus size")
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--rawdata", action="store_true", help="encode rawdata.json instead of reading stored embeddings")
+    common.add_argument("--engines", default=",".join(ENGINES), help="subset of: " + ", ".join(ENGINES))
+    common.add_argument("--linkages", default=",".join(LINKAGES), help="agglomerative linkages")
+    common.add_argument("--output", help="write the results as JSON")
+
+    sweep_parser = commands.add_parser("sweep", parents=[common], help="sweep settings on the real embeddings")
+    sweep_parser.add_argument("--thresholds", default="0.8,0.9,1.0,1.1,1.2,1.3,1.4")
+    sweep_parser.add_argument("--labels", help="JSON object mapping article title to a ground-truth label")
+
+    scale_parser = commands.add_parser("scale", parents=[common], help="runtime and memory on synthetic corpora")
+    scale_parser.add_argument("--sizes", default="1k,5k,10k,20k,50k")
+    scale_parser.add_argument("--threshold", type=float, default=CURRENT[2])
+    scale_parser.add_argument("--max-memory-gb", type=float,
+                              default=round(psutil.virtual_memory().available * 0.8 / 1e9, 1),
+                              help="skip runs estimated to need more memory than this (default: 80%% of available)")
+    scale_parser.add_argument("--no-quality", action="store_true", help="skip silhouette / agreement scores")
+    scale_parser.add_argument("--seed", type=int, default=0)
+    scale_parser.add_argument("--plot", help="save runtime / memory curves to this image")
+
+    args = parser.parse_args()
+    report = sweep(args) if args.command == "sweep" else scale(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Shared fixtures for the server tests (test_*.py next to the modules).
+
+Everything runs against the embedded SQLite backend (sqlite_store.py) in a
+temporary directory, so no Supabase project or network is needed:
+
+    cd server
+    python -m pytest
+"""
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlite_store import SqliteStore
+
+
+def make_batch(name, n_articles=2, summary=None, embedding=None, **cluster):
+    """A {"cluster", "articles"} batch as posted to /api/data/bulk."""
+    return {
+        "cluster": dict({"cluster_title": name, "cluster_summary": summary or f"Summary of {name}"}, **cluster),
+        "articles": [{
+            "title": f"{name} article {i}",
+            "text": f"Body of {name} article {i}. " * 5,
+            "article_summary": f"{name} summary {i}",
+            "source": ["CNN", "BBC", "NPR"][i % 3],
+            "url": f"https://example.com/{name.replace(' ', '-')}/{i}",
+            **({"embedding": embedding(i)} if embedding else {}),
+        } for i in range(n_articles)],
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteStore(str(tmp_path / "noogie.db"))
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """The Flask app module (server.py) on a fresh SQLite database."""
+    pytest.importorskip("flask_cors")
+    pytest.importorskip("faiss")
+    directory = tmp_path_factory.mktemp("server")
+    env = {
+        "STORAGE_BACKEND": "sqlite",
+        "SQLITE_PATH": str(directory / "noogie.db"),
+        "LAYOUT_PATH": str(directory / "layout.json"),
+        "WATCH_CHANGES": "off",
+        "ADMISSION_CONTROL": "off",
+    }
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        # LAYOUT_PATH is read at import, and a test may have imported layout already
+        if "layout" in sys.modules:
+            importlib.reload(sys.modules["layout"])
+        module = importlib.import_module("server")
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    return module
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
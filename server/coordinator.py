@@ -0,0 +1,205 @@
+"""
+Ingestion coordinator for the queue-based pipeline (jobqueue.py, worker.py).
+
+One run is one batch:
+
+1. enqueue a feed job per RSS_FEEDS entry and a homepage job per
+   NEWSPAPER_SOURCES outlet whose circuit breaker is closed
+2. wait for the feed, homepage and article jobs to drain, then record each
+   source's outcome in its circuit breaker
+3. enqueue summarize jobs over the staged articles and wait for them
+4. cluster the staged articles, name the clusters and write the output
+   (RAWDATA_PATH, default rawdata.json),
+   like app.py, then mark the batch finished
+
+Any number of worker processes on this host do the work (the queue file is
+limited to one host, see jobqueue.py); --workers N starts N that exit with the
+batch. Each
+wait is bounded by the run's stage budgets (budget.py): jobs still pending
+when a stage runs out are cancelled and the run continues with what it has,
+summarizing leftovers with lead sentences.
+
+    python coordinator.py --workers 4
+    python coordinator.py --resume            # pick up the last unfinished batch
+"""
+import os
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import subprocess
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from budget import RunBudget, CircuitBreakers
+from jobqueue import JOB_QUEUE_PATH, JobQueue
+from pipeline import (RSS_FEEDS, NEWSPAPER_SOURCES, cutoff, lead, openai_client, summarize_and_name_cluster,
+                      cluster_records, encode_within)
+from records import ArticleStore, write_rawdata, RAWDATA_PATH
+from semantic import EMBEDDING_MODEL
+
+FETCH_KINDS = ("feed", "homepage", "article")
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", "16"))
+POLL_SECONDS = 2
+THREADS = 6
+
+
+def seed(queue, batch, breakers):
+    """Enqueue the batch's feed and homepage jobs; returns how many."""
+    since = cutoff().isoformat()
+    jobs = {"feed": [], "homepage": []}
+    for kind, breaker_kind, sources in (("feed", "rss", RSS_FEEDS), ("homepage", "newspaper", NEWSPAPER_SOURCES)):
+        for name, url in sources.items():
+            if not breakers.allow(f"{breaker_kind}:{name}"):
+                print(f"Skipping {name} ({breaker_kind}): failed on recent runs")
+                continue
+            jobs[kind].append((name, {"source": name, "url": url, "cutoff": since}))
+    return sum(queue.enqueue_many(batch, kind, items) for kind, items in jobs.items())
+
+
+def wait_for(queue, batch, kinds, deadline, label):
+    """
+    Wait until the batch has no pending jobs of these kinds, or cancel them at deadline.
+
+    Returns:
+        Number of jobs cancelled
+    """
+    last = None
+    while True:
+        queue.touch_host()
+        pending = queue.pending(batch, kinds)
+        if not pending:
+            return 0
+        if deadline.expired():
+            cancelled = queue.cancel(batch, kinds)
+            print(f"[!] {label} budget spent, cancelled {cancelled} jobs")
+            return cancelled
+        if pending != last:
+            print(f"{label}: {pending} jobs pending")
+            last = pending
+        time.sleep(POLL_SECONDS)
+
+
+def record_breakers(queue, batch, breakers):
+    """A feed or homepage job that failed (or never finished) counts against its source."""
+    for (kind, name), (status, error) in queue.job_status(batch, ("feed", "homepage")).items():
+        source = f"{'rss' if kind == 'feed' else 'newspaper'}:{name}"
+        if status == "done":
+            breakers.success(source)
+        else:
+            breakers.failure(source, error or status)
+    breakers.save()
+
+
+def load_records(queue, batch, deadline):
+    """
+    The batch's staged articles as an ArticleStore, with embeddings.
+
+    Articles staged without an embedding are encoded until the deadline; the ones
+    still missing one then are left out.
+    """
+    records = ArticleStore()
+    vectors = []
+    missing = []
+    for row in queue.iter_staged(batch):
+        article = (row["source"], row["title"], row["url"], row["text"], row["summary"] or lead(row["text"]))
+        if row["embedding"] is None:
+            missing.append(article)
+            continue
+        records.add(*article)
+        vectors.append(row["embedding"])
+    if missing:
+        from sentence_transformers import SentenceTransformer
+        encoded = encode_within(SentenceTransformer(EMBEDDING_MODEL), [a[4] for a in missing], deadline)
+        if len(encoded) < len(missing):
+            print(f"[!] Encoding budget spent, leaving out {len(missing) - len(encoded)} articles")
+        for article, vector in zip(missing, encoded):
+            records.add(*article)
+            vectors.append(vector)
+    if vectors:
+        records.set_embeddings(vectors)
+    return records
+
+
+def start_workers(queue_path, batch, count):
+    return [subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py"),
+                              "--batch", batch, "--queue", queue_path])
+            for _ in range(count)]
+
+
+def run(args):
+    queue = JobQueue(args.queue)
+    budget = RunBudget()
+    breakers = CircuitBreakers()
+
+    batch = queue.latest_batch() if args.resume else None
+    if batch:
+        print(f"Resuming batch {batch}")
+    else:
+        batch = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        queue.create_batch(batch)
+        print(f"Batch {batch}: {seed(queue, batch, breakers)} source jobs queued")
+    workers = start_workers(args.queue, batch, args.workers)
+
+    try:
+        # fetching has the RSS and newspaper stages' time between them
+        wait_for(queue, batch, FETCH_KINDS, budget.stage("newspaper"), "Fetch")
+        record_breakers(queue, batch, breakers)
+
+        article_ids = queue.unsummarized(batch)
+        queue.enqueue_many(batch, "summarize", [
+            (f"{ids[0]}-{ids[-1]}", {"article_ids": ids})
+            for ids in (article_ids[i:i + SUMMARY_BATCH] for i in range(0, len(article_ids), SUMMARY_BATCH))])
+        wait_for(queue, batch, ("summarize",), budget.stage("summaries"), "Summaries")
+        for kind, statuses in sorted(queue.counts(batch).items()):
+            print(f"  {kind}: " + ", ".join(f"{n} {status}" for status, n in sorted(statuses.items())))
+
+        records = load_records(queue, batch, budget.stage("encode"))
+        print(f"Total articles gathered: {len(records)}")
+        if len(records) < 2:
+            print("Not enough articles to cluster")
+            queue.finish_batch(batch)
+            return 1
+        clusters = cluster_records(records, budget.stage("cluster"))
+
+        stage = budget.stage("naming")
+        client = openai_client()
+        output = []
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            futures = {executor.submit(summarize_and_name_cluster, client, [records.summaries[i] for i in ids],
+                                       stage): ids
+                       for ids in clusters}
+            for future in as_completed(futures):
+                cluster_summary, cluster_name = future.result()
+                output.append((cluster_name, cluster_summary, futures[future]))
+
+        write_rawdata(args.output, records, output)
+        print(f"Saved {len(clusters)} clusters with AI-generated names to {args.output}")
+        queue.finish_batch(batch)
+        print(budget.report())
+        return 0
+    finally:
+        # after a failure the batch stays unfinished for --resume, so local workers are stopped
+        for worker in workers:
+            if not queue.is_finished(batch):
+                worker.terminate()
+            worker.wait()
+
+
+def main():
+    warnings.simplefilter(action="ignore", category=FutureWarning)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=0, help="local worker processes to start for this batch")
+    parser.add_argument("--resume", action="store_true", help="continue the last unfinished batch")
+    parser.add_argument("--queue", default=JOB_QUEUE_PATH, help="job queue database (JOB_QUEUE_PATH)")
+    parser.add_argument("--output", default=RAWDATA_PATH, help="where to write the clusters (RAWDATA_PATH)")
+    return run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,505 @@
+"""
+Data access for the clusters and articles tables.
+
+All Supabase queries go through Store (or AsyncStore for the ASGI server) so
+that they share one pooled HTTP client, related reads are combined into single
+PostgREST requests (embedded resources, in.() filters) and every query is
+timed. Both stores build their queries with the same helpers below; only the
+execute call differs.
+
+create_store() picks the backend from STORAGE_BACKEND; sqlite_store.SqliteStore
+offers the same methods on an embedded database.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import httpx
+from postgrest.exceptions import APIError
+from supabase import create_client, Client, ClientOptions, acreate_client, AsyncClient, AsyncClientOptions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# keeps in.() filters well under URL length limits
+IN_BATCH_SIZE = 200
+
+CLUSTER_FIELDS = {"cluster_id", "cluster_title", "cluster_summary", "topic_id", "created_at"}
+ARTICLE_FIELDS = {"article_id", "cluster_id", "title", "text", "article_summary", "source", "created_at"}
+TOPIC_FIELDS = {"topic_id", "topic_title", "cluster_count", "article_count", "created_at"}
+# what the API returns for "*": the centroid is only used by topics.py
+TOPIC_SELECT = "topic_id, topic_title, cluster_count, article_count, created_at"
+
+FOREIGN_KEY_VIOLATION = "23503"
+UNIQUE_VIOLATION = "23505"
+
+
+class NotFound(Exception):
+    """A referenced row does not exist."""
+
+
+class Conflict(Exception):
+    """A write would duplicate a unique key."""
+
+
+class QueryStats:
+    """
+    Thread-safe per-query count / total / max timings.
+
+    Between begin_request() and end_request() the queries run by the calling
+    thread are also collected, so request middleware can tell database time
+    apart from the rest of the request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._local = threading.local()
+
+    def begin_request(self):
+        self._local.queries = []
+
+    def end_request(self):
+        """(name, seconds) of the queries this thread ran since begin_request()."""
+        queries = getattr(self._local, "queries", None) or []
+        self._local.queries = None
+        return queries
+
+    def record(self, name, seconds):
+        queries = getattr(self._local, "queries", None)
+        if queries is not None:
+            queries.append((name, seconds))
+        with self._lock:
+            s = self._stats.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            ms = seconds * 1000
+            s["count"] += 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: dict(s, avg_ms=s["total_ms"] / s["count"])
+                for name, s in self._stats.items()
+            }
+
+
+def _pool_settings():
+    return dict(
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("SUPABASE_POOL_SIZE", "20")),
+            max_keepalive_connections=int(os.getenv("SUPABASE_POOL_KEEPALIVE", "10")),
+            keepalive_expiry=30,
+        ),
+        timeout=httpx.Timeout(float(os.getenv("SUPABASE_TIMEOUT", "10")), connect=5),
+    )
+
+
+def create_pooled_client() -> Client:
+    """Create a Supabase client backed by one keep-alive httpx connection pool."""
+    return create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_KEY"),
+        options=ClientOptions(httpx_client=httpx.Client(**_pool_settings())),
+    )
+
+
+async def create_async_pooled_client() -> AsyncClient:
+    """Async counterpart of create_pooled_client."""
+    return await acreate_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_KEY"),
+        options=AsyncClientOptions(httpx_client=httpx.AsyncClient(**_pool_settings())),
+    )
+
+
+def create_store():
+    """
+    The storage backend selected by STORAGE_BACKEND: "supabase" (default) or
+    "sqlite" (an embedded database at SQLITE_PATH, see sqlite_store.py).
+    """
+    backend = os.getenv("STORAGE_BACKEND", "supabase")
+    if backend == "sqlite":
+        from sqlite_store import SqliteStore
+        return SqliteStore(os.getenv("SQLITE_PATH", "noogie.db"))
+    if backend != "supabase":
+        raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}")
+    return Store()
+
+
+async def create_async_store():
+    """Async counterpart of create_store, for the ASGI server."""
+    if os.getenv("STORAGE_BACKEND", "supabase") == "supabase":
+        return await AsyncStore.create()
+    return ThreadedAsyncStore(create_store())
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# --- query builders shared by Store and AsyncStore ---
+
+def clusters_query(client, select="*", since=None, until=None, topic_id=None):
+    query = client.table('clusters').select(select)
+    if topic_id is not None:
+        query = query.eq('topic_id', topic_id)
+    if since:
+        query = query.gte('created_at', since)
+    if until:
+        query = query.lt('created_at', until)
+    return query
+
+
+def articles_query(client, select="*", cluster_id=None, source=None, since=None, until=None):
+    query = client.table('articles').select(select)
+    if cluster_id is not None:
+        query = query.eq('cluster_id', cluster_id)
+    if source:
+        query = query.eq('source', source)
+    if since:
+        query = query.gte('created_at', since)
+    if until:
+        query = query.lt('created_at', until)
+    return query
+
+
+def keyset(query, key, limit, cursor):
+    """Apply the keyset cursor, ordering and limit (plus one look-ahead row)."""
+    if cursor is not None:
+        query = query.gt(key, cursor)
+    return query.order(key).limit(limit + 1)
+
+
+def split_page(rows, key, limit):
+    """Split a limit+1 result into (page, next_cursor)."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1][key]
+    return rows, None
+
+
+def cluster_with_articles_query(client, cluster_id):
+    """A cluster and its articles in one round trip via a PostgREST embedded resource."""
+    return client.table('clusters').select("*, articles(*)").eq('cluster_id', cluster_id)
+
+
+def first(result):
+    return result.data[0] if result.data else None
+
+
+class Store:
+    def __init__(self, client: Client = None):
+        self.client = client or create_pooled_client()
+        self.stats = QueryStats()
+
+    def _execute(self, name, query):
+        start = time.perf_counter()
+        try:
+            return query.execute()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.record(name, elapsed)
+            logger.debug("query %s took %.1fms", name, elapsed * 1000)
+
+    # --- reads ---
+
+    def list_clusters(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None, since=None, until=None,
+                      topic_id=None):
+        """
+        One keyset page of clusters.
+
+        Returns:
+            Tuple of (rows, next_cursor)
+        """
+        query = clusters_query(self.client, select, since, until, topic_id)
+        return self._page('list_clusters', query, 'cluster_id', limit, cursor)
+
+    def list_articles(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None,
+                      cluster_id=None, source=None, since=None, until=None):
+        """
+        One keyset page of articles.
+
+        Returns:
+            Tuple of (rows, next_cursor)
+        """
+        query = articles_query(self.client, select, cluster_id, source, since, until)
+        return self._page('list_articles', query, 'article_id', limit, cursor)
+
+    def _page(self, name, query, key, limit, cursor):
+        rows = self._execute(name, keyset(query, key, limit, cursor)).data or []
+        return split_page(rows, key, limit)
+
+    def fetch_all(self, table, select, key):
+        """Read a whole table in MAX_PAGE_SIZE keyset pages (PostgREST caps rows per request)."""
+        rows = []
+        cursor = None
+        while True:
+            query = self.client.table(table).select(select)
+            page, cursor = self._page(f'fetch_all_{table}', query, key, MAX_PAGE_SIZE, cursor)
+            rows.extend(page)
+            if cursor is None:
+                return rows
+
+    def list_topics(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        One keyset page of topics (server/sql/006).
+
+        Returns:
+            Tuple of (rows, next_cursor)
+        """
+        return self._page('list_topics', self.client.table('topics').select(select), 'topic_id', limit, cursor)
+
+    def get_topic(self, topic_id, select="*"):
+        return first(self._execute('get_topic', self.client.table('topics').select(select).eq('topic_id', topic_id)))
+
+    def get_cluster(self, cluster_id, select="*"):
+        return first(self._execute('get_cluster', self.client.table('clusters').select(select).eq('cluster_id', cluster_id)))
+
+    def get_cluster_with_articles(self, cluster_id):
+        return first(self._execute('get_cluster_with_articles', cluster_with_articles_query(self.client, cluster_id)))
+
+    def get_article(self, article_id, select="*"):
+        return first(self._execute('get_article', self.client.table('articles').select(select).eq('article_id', article_id)))
+
+    def get_clusters(self, cluster_ids, select="*"):
+        """Many clusters by id, batched into in.() queries."""
+        return self._get_many('clusters', 'cluster_id', cluster_ids, select)
+
+    def get_articles(self, article_ids, select="*"):
+        """Many articles by id, batched into in.() queries."""
+        return self._get_many('articles', 'article_id', article_ids, select)
+
+    def get_embeddings(self, article_ids, select="*"):
+        """article_embeddings rows for many articles, batched into in.() queries."""
+        return self._get_many('article_embeddings', 'article_id', article_ids, select)
+
+    def _get_many(self, table, key, ids, select):
+        rows = []
+        for batch in chunks(list(dict.fromkeys(ids)), IN_BATCH_SIZE):
+            query = self.client.table(table).select(select).in_(key, batch)
+            rows.extend(self._execute(f'get_many_{table}', query).data or [])
+        return rows
+
+    def existing_titles(self, titles):
+        """Subset of titles that already have an article, checked in batches."""
+        found = set()
+        for batch in chunks(list(dict.fromkeys(titles)), IN_BATCH_SIZE):
+            query = self.client.table('articles').select("title").in_('title', batch)
+            found.update(row["title"] for row in self._execute('existing_titles', query).data or [])
+        return found
+
+    def existing_urls(self, urls):
+        """Subset of urls that already have an article, checked in batches."""
+        found = set()
+        for batch in chunks(list(dict.fromkeys(urls)), IN_BATCH_SIZE):
+            query = self.client.table('articles').select("url").in_('url', batch)
+            found.update(row["url"] for row in self._execute('existing_urls', query).data or [])
+        return found
+
+    def article_exists(self, title):
+        return bool(self.existing_titles([title]))
+
+    # --- writes ---
+
+    def insert_cluster(self, row):
+        return first(self._execute('insert_cluster', self.client.table('clusters').insert(row)))
+
+    def insert_articles(self, rows):
+        if not rows:
+            return []
+        return self._execute('insert_articles', self.client.table('articles').insert(rows)).data or []
+
+    def update_row(self, table, key, row_id, values):
+        """
+        Raises:
+            Conflict: if the update would duplicate a unique key
+        """
+        try:
+            return self._execute(f'update_{table}', self.client.table(table).update(values).eq(key, row_id)).data
+        except APIError as e:
+            if e.code == UNIQUE_VIOLATION:
+                raise Conflict(e.message)
+            raise
+
+    def ingest_bulk(self, batches):
+        """
+        Write validated {"cluster", "articles"} batches in one transaction
+        through the ingest_bulk database function (server/sql/).
+
+        Returns:
+            Dictionary with the created "clusters" (in batch order) and "articles"
+        """
+        return self._execute('ingest_bulk', self.client.rpc('ingest_bulk', {'payload': batches})).data
+
+    def add_articles_to_cluster(self, cluster_id, rows):
+        """
+        Insert articles into an existing cluster, skipping any whose
+        content_hash is already stored. Embeddings of the new articles are
+        saved after the insert.
+
+        The cluster's existence is enforced by the articles.cluster_id foreign
+        key instead of a separate lookup.
+
+        Raises:
+            NotFound: if the cluster does not exist
+        """
+        embeddings = {row['content_hash']: row['embedding'] for row in rows if 'embedding' in row}
+        rows = [dict({k: v for k, v in row.items() if k != 'embedding'}, cluster_id=cluster_id) for row in rows]
+        query = self.client.table('articles').upsert(rows, on_conflict='content_hash', ignore_duplicates=True)
+        try:
+            # with ignore_duplicates only the newly inserted rows come back
+            created = self._execute('add_articles_to_cluster', query).data or []
+        except APIError as e:
+            if e.code == FOREIGN_KEY_VIOLATION:
+                raise NotFound(f"Cluster {cluster_id} not found")
+            raise
+
+        created = [dict(row, embedding=embeddings[row['content_hash']]) if row.get('content_hash') in embeddings
+                   else row for row in created]
+        self.save_embeddings({row['article_id']: row['embedding'] for row in created if 'embedding' in row})
+        return created
+
+    def save_embeddings(self, embeddings):
+        """Upsert {article_id: vector} into article_embeddings (server/sql/003)."""
+        rows = [{'article_id': article_id, 'embedding': vector} for article_id, vector in embeddings.items()]
+        for batch in chunks(rows, IN_BATCH_SIZE):
+            self._execute('save_embeddings', self.client.table('article_embeddings').upsert(batch))
+
+    def save_topics(self, topics, assignments, replace=False):
+        """
+        Upsert topics and set clusters' topic_id in one transaction (the
+        save_topics SQL function, server/sql/006).
+
+        Args:
+            topics: topic rows, each with its topic_id and centroid
+            assignments: {cluster_id: topic_id}
+            replace: also delete the topics not in topics
+        """
+        self._execute('save_topics', self.client.rpc('save_topics', {
+            'payload': topics,
+            'assignments': {str(cluster_id): topic_id for cluster_id, topic_id in assignments.items()},
+            'replace': replace,
+        }))
+
+    # --- change log (server/sql/004) ---
+
+    def record_change(self, cluster_ids, article_ids):
+        """Append a change entry; returns its version."""
+        query = self.client.table('changes').insert({'cluster_ids': cluster_ids, 'article_ids': article_ids})
+        return first(self._execute('record_change', query))['version']
+
+    def ping(self):
+        """Cheapest round trip to the database; raises if it is unreachable."""
+        self._execute('ping', self.client.table('clusters').select('cluster_id').limit(1))
+
+    def latest_change_version(self):
+        query = self.client.table('changes').select('version').order('version', desc=True).limit(1)
+        row = first(self._execute('latest_change_version', query))
+        return row['version'] if row else 0
+
+    def changes_since(self, version, limit=MAX_PAGE_SIZE):
+        """Change entries after version, oldest first."""
+        query = (self.client.table('changes').select('version, cluster_ids, article_ids')
+                 .gt('version', version).order('version').limit(limit))
+        return self._execute('changes_since', query).data or []
+
+
+class ThreadedAsyncStore:
+    """Async facade over a blocking store; each call runs in a worker thread."""
+
+    def __init__(self, store):
+        self.store = store
+        self.stats = store.stats
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return call
+
+
+class AsyncStore:
+    """Read-only async counterpart of Store, used by the ASGI server."""
+
+    def __init__(self, client: AsyncClient, stats: QueryStats = None):
+        self.client = client
+        self.stats = stats or QueryStats()
+
+    @classmethod
+    async def create(cls):
+        return cls(await create_async_pooled_client())
+
+    async def _execute(self, name, query):
+        start = time.perf_counter()
+        try:
+            return await query.execute()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.record(name, elapsed)
+            logger.debug("query %s took %.1fms", name, elapsed * 1000)
+
+    async def ping(self):
+        await self._execute('ping', self.client.table('clusters').select('cluster_id').limit(1))
+
+    async def _page(self, name, query, key, limit, cursor):
+        rows = (await self._execute(name, keyset(query, key, limit, cursor))).data or []
+        return split_page(rows, key, limit)
+
+    async def list_clusters(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None, since=None, until=None,
+                            topic_id=None):
+        query = clusters_query(self.client, select, since, until, topic_id)
+        return await self._page('list_clusters', query, 'cluster_id', limit, cursor)
+
+    async def list_topics(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None):
+        return await self._page('list_topics', self.client.table('topics').select(select), 'topic_id', limit, cursor)
+
+    async def get_topic(self, topic_id, select="*"):
+        query = self.client.table('topics').select(select).eq('topic_id', topic_id)
+        return first(await self._execute('get_topic', query))
+
+    async def list_articles(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None,
+                            cluster_id=None, source=None, since=None, until=None):
+        query = articles_query(self.client, select, cluster_id, source, since, until)
+        return await self._page('list_articles', query, 'article_id', limit, cursor)
+
+    async def fetch_all(self, table, select, key):
+        rows = []
+        cursor = None
+        while True:
+            query = self.client.table(table).select(select)
+            page, cursor = await self._page(f'fetch_all_{table}', query, key, MAX_PAGE_SIZE, cursor)
+            rows.extend(page)
+            if cursor is None:
+                return rows
+
+    async def get_cluster(self, cluster_id, select="*"):
+        query = self.client.table('clusters').select(select).eq('cluster_id', cluster_id)
+        return first(await self._execute('get_cluster', query))
+
+    async def get_cluster_with_articles(self, cluster_id):
+        return first(await self._execute('get_cluster_with_articles', cluster_with_articles_query(self.client, cluster_id)))
+
+    async def get_article(self, article_id, select="*"):
+        query = self.client.table('articles').select(select).eq('article_id', article_id)
+        return first(await self._execute('get_article', query))
+
+    async def get_clusters(self, cluster_ids, select="*"):
+        return await self._get_many('clusters', 'cluster_id', cluster_ids, select)
+
+    async def get_articles(self, article_ids, select="*"):
+        return await self._get_many('articles', 'article_id', article_ids, select)
+
+    async def _get_many(self, table, key, ids, select):
+        """Batched in.() lookups, issued concurrently."""
+        batches = chunks(list(dict.fromkeys(ids)), IN_BATCH_SIZE)
+        results = await asyncio.gather(*(
+            self._execute(f'get_many_{table}', self.client.table(table).select(select).in_(key, batch))
+            for batch in batches
+        ))
+        return [row for result in results for row in result.data or []]
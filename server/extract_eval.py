@@ -0,0 +1,246 @@
+"""
+Accuracy and speed of extract.py against newspaper's Article.parse().
+
+Pages are recorded once as fixtures and compared offline, so runs are
+repeatable and do not depend on the outlets being up:
+
+    python extract_eval.py record --from-db 20          # the latest 20 stored article URLs per outlet
+    python extract_eval.py record --urls urls.txt       # one URL per line
+    python extract_eval.py compare                      # per-outlet table
+    python extract_eval.py compare --repeat 5 --output extract_eval.json
+
+Fixtures are kept under fixtures/extract/ as <host>/<sha1 of url>.html, with
+fixtures/extract/index.json mapping each file to its URL. The reference text
+for a page is <same name>.txt when present (a hand-checked extraction), else
+newspaper's output, so without hand-checked files the score measures
+agreement with the current parser.
+
+For each outlet the comparison reports how often the fast path succeeds
+(JSON-LD or selector, without falling back), the token F1 and exact title
+match of parse_article() and of newspaper against the reference, and the mean
+milliseconds per page of extract(), parse_article() and newspaper.
+
+fixtures/extract/ ships with one page per outlet and a hand-checked .txt for
+each, built to follow the outlet's article markup rather than recorded, so
+test_extract.py can check both parsers offline; record real pages next to
+them for a current picture.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import warnings
+from collections import Counter, defaultdict
+
+import requests
+from newspaper import Article, Config
+
+from extract import _host, extract, parse_article
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "extract")
+USER_AGENT = ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+              "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0 Safari/537.36")
+
+_TOKEN = re.compile(r"\w+")
+
+
+def token_f1(text, reference):
+    """Bag-of-words F1 between two texts (1.0 when both are empty)."""
+    got, want = Counter(_TOKEN.findall(text.lower())), Counter(_TOKEN.findall(reference.lower()))
+    if not got and not want:
+        return 1.0
+    overlap = sum((got & want).values())
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / sum(got.values()), overlap / sum(want.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def load_index(directory):
+    path = os.path.join(directory, "index.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# --- record ---
+
+def urls_from_db(per_host):
+    """The latest per_host stored article URLs for each outlet."""
+    from db import create_store
+    rows = create_store().fetch_all("articles", "article_id,url", "article_id")
+    by_host = defaultdict(list)
+    for row in sorted(rows, key=lambda r: r["article_id"], reverse=True):
+        if row.get("url") and len(by_host[_host(row["url"])]) < per_host:
+            by_host[_host(row["url"])].append(row["url"])
+    return [url for urls in by_host.values() for url in urls]
+
+
+def record(args):
+    if args.urls:
+        with open(args.urls, encoding="utf-8") as f:
+            urls = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    else:
+        urls = urls_from_db(args.from_db)
+    index = load_index(args.fixtures)
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    saved = 0
+    for url in urls:
+        name = os.path.join(_host(url), hashlib.sha1(url.encode()).hexdigest()[:16] + ".html")
+        if name in index and not args.refresh:
+            continue
+        try:
+            r = session.get(url, timeout=args.timeout)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            print(f"[!] {url}: {e}")
+            continue
+        path = os.path.join(args.fixtures, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(r.text)
+        index[name] = {"url": url}
+        saved += 1
+    os.makedirs(args.fixtures, exist_ok=True)
+    with open(os.path.join(args.fixtures, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    print(f"Recorded {saved} pages ({len(index)} fixtures in {args.fixtures})")
+
+
+# --- compare ---
+
+def _timed(fn, repeat):
+    """(result of the last call, mean seconds per call)."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def newspaper_parse(html, url, config):
+    article = Article(url, config=config)
+    article.download(input_html=html)
+    article.parse()
+    return article.title, article.text
+
+
+def compare_page(html, url, reference, config, repeat):
+    """Scores and timings for one fixture."""
+    fast, fast_s = _timed(lambda: extract(html, url), repeat)
+    (title, text, method), combined_s = _timed(lambda: parse_article(html, url, config), repeat)
+    (np_title, np_text), newspaper_s = _timed(lambda: newspaper_parse(html, url, config), repeat)
+    ref_title, ref_text = reference if reference else (np_title, np_text)
+    return {
+        "method": method,
+        "fast_hit": fast is not None,
+        "f1": token_f1(text, ref_text),
+        "title_match": title.strip().casefold() == ref_title.strip().casefold(),
+        "newspaper_f1": token_f1(np_text, ref_text),
+        "newspaper_title_match": np_title.strip().casefold() == ref_title.strip().casefold(),
+        "fast_ms": fast_s * 1000,
+        "combined_ms": combined_s * 1000,
+        "newspaper_ms": newspaper_s * 1000,
+    }
+
+
+def summarize_pages(pages):
+    n = len(pages)
+    return {
+        "pages": n,
+        "fast_hit_rate": sum(p["fast_hit"] for p in pages) / n,
+        "methods": dict(Counter(p["method"] for p in pages)),
+        "mean_f1": sum(p["f1"] for p in pages) / n,
+        "title_match_rate": sum(p["title_match"] for p in pages) / n,
+        "newspaper_f1": sum(p["newspaper_f1"] for p in pages) / n,
+        "newspaper_title_match_rate": sum(p["newspaper_title_match"] for p in pages) / n,
+        "fast_ms": sum(p["fast_ms"] for p in pages) / n,
+        "combined_ms": sum(p["combined_ms"] for p in pages) / n,
+        "newspaper_ms": sum(p["newspaper_ms"] for p in pages) / n,
+    }
+
+
+def load_fixtures(directory):
+    """
+    Yields:
+        (name, url, html, reference) per fixture; reference is (title, text) from
+        the hand-checked .txt, or None without one
+    """
+    for name, meta in sorted(load_index(directory).items()):
+        path = os.path.join(directory, name)
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        reference = None
+        gold = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(gold):
+            with open(gold, encoding="utf-8") as f:
+                # first line is the title, the rest the text
+                ref_title, _, ref_text = f.read().partition("\n")
+            reference = (ref_title, ref_text)
+        yield name, meta["url"], html, reference
+
+
+def compare_fixtures(directory, repeat):
+    """Per-outlet summaries plus "all", or {} without fixtures."""
+    config = Config()
+    config.memoize_articles = False
+    by_host = defaultdict(list)
+    for name, url, html, reference in load_fixtures(directory):
+        try:
+            by_host[_host(url)].append(compare_page(html, url, reference, config, repeat))
+        except Exception as e:
+            print(f"[!] {name}: {e}")
+    if not by_host:
+        return {}
+    report = {host: summarize_pages(pages) for host, pages in sorted(by_host.items())}
+    report["all"] = summarize_pages([p for pages in by_host.values() for p in pages])
+    return report
+
+
+def compare(args):
+    report = compare_fixtures(args.fixtures, args.repeat)
+    if not report:
+        print(f"No fixtures in {args.fixtures}; run `python extract_eval.py record` first")
+        return 1
+
+    print(f"{'outlet':<20} {'pages':>5} {'fast':>6} {'F1':>6} {'title':>6} {'np F1':>6} {'np title':>8} "
+          f"{'extract':>9} {'combined':>9} {'newspaper':>10} {'speedup':>8}")
+    for host, r in report.items():
+        print(f"{host:<20} {r['pages']:>5} {r['fast_hit_rate']:>6.0%} {r['mean_f1']:>6.3f} "
+              f"{r['title_match_rate']:>6.0%} {r['newspaper_f1']:>6.3f} {r['newspaper_title_match_rate']:>8.0%} "
+              f"{r['fast_ms']:>7.1f}ms {r['combined_ms']:>7.1f}ms "
+              f"{r['newspaper_ms']:>8.1f}ms {r['newspaper_ms'] / r['combined_ms']:>7.1f}x")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+    return 0
+
+
+def main():
+    warnings.simplefilter("ignore")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="download pages into the fixtures directory")
+    source = record_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--urls", help="file with one article URL per line")
+    source.add_argument("--from-db", type=int, metavar="N", help="the latest N stored article URLs per outlet")
+    record_parser.add_argument("--refresh", action="store_true", help="download pages that are already recorded")
+    record_parser.add_argument("--timeout", type=float, default=20)
+
+    compare_parser = commands.add_parser("compare", help="score extract.py against newspaper on the fixtures")
+    compare_parser.add_argument("--repeat", type=int, default=3, help="timed runs per page")
+    compare_parser.add_argument("--output", help="write the results as JSON")
+
+    args = parser.parse_args()
+    return record(args) if args.command == "record" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Builds the node/link snapshot rendered by the front-end force graph.
+
+This mirrors what Landing.tsx used to assemble client-side, but with only the
+fields the graph and its side panels show. Article text is never included;
+clients fetch it on demand from /api/articles/<id>.
+"""
+
+CLUSTER_GRAPH_FIELDS = "cluster_id, cluster_title, cluster_summary"
+ARTICLE_GRAPH_FIELDS = "article_id, cluster_id, title, source, article_summary"
+
+
+def build_graph(clusters, articles):
+    """
+    Build graph nodes and links from cluster and article rows.
+
+    Args:
+        clusters: rows with CLUSTER_GRAPH_FIELDS
+        articles: rows with ARTICLE_GRAPH_FIELDS
+
+    Returns:
+        Dictionary with "nodes" and "links" lists
+    """
+    nodes = []
+    links = []
+    cluster_ids = set()
+
+    for c in clusters:
+        cluster_ids.add(c["cluster_id"])
+        nodes.append({
+            "id": f"cluster-{c['cluster_id']}",
+            "type": "cluster",
+            "cluster_id": c["cluster_id"],
+            "title": c.get("cluster_title"),
+            "article_summary": c.get("cluster_summary"),
+        })
+
+    for a in articles:
+        node_id = f"article-{a['article_id']}"
+        nodes.append({
+            "id": node_id,
+            "type": "article",
+            "article_id": a["article_id"],
+            "cluster_id": a.get("cluster_id"),
+            "title": a.get("title"),
+            "source": a.get("source"),
+            "article_summary": a.get("article_summary"),
+        })
+        if a.get("cluster_id") in cluster_ids:
+            links.append({"source": node_id, "target": f"cluster-{a['cluster_id']}", "value": 1})
+
+    return {"nodes": nodes, "links": links}
@@ -0,0 +1,305 @@
+"""
+Validation and batched writes for cluster/article uploads.
+
+A batch is {"cluster": {...}, "articles": [...]}, the shape posted to
+/api/clusters/batch and, as a list, to /api/data/bulk. Payloads are checked in
+full before anything is written, then handed to the ingest_bulk database
+function (sql/) which inserts all clusters and articles of a
+chunk in one transaction.
+
+Writes are idempotent: every article carries a content_hash (normalised URL +
+text hash) and every cluster a fingerprint of its members' hashes. Rows whose
+key already exists are skipped instead of inserted again, so retried or
+overlapping pipeline runs do not duplicate data.
+"""
+import hashlib
+import json
+import re
+import tempfile
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# clusters per ingest_bulk call when streaming NDJSON
+STREAM_CHUNK_SIZE = 200
+# validated NDJSON is spooled to disk beyond this size
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+# size of the all-MiniLM-L6-v2 article embeddings (see semantic.py)
+EMBEDDING_DIM = 384
+
+
+# query parameters that only track where a click came from
+TRACKING_PARAMS = {"fbclid", "gclid", "cmpid", "ocid", "ref", "smid", "taid", "ito"}
+
+
+class ValidationError(ValueError):
+    """The payload is malformed; nothing has been written."""
+
+
+def normalize_url(url):
+    """Canonical form of an article URL: no scheme/www/fragment/tracking params or trailing slash."""
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = [(k, v) for k, v in parse_qsl(parts.query)
+             if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS]
+    return urlunsplit(("", host, parts.path.rstrip("/"), urlencode(sorted(query)), "")).lstrip("/")
+
+
+def text_hash(text):
+    normalized = re.sub(r"\s+", " ", text or "").strip().lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def content_hash(url, text):
+    """Identity of an article: the same story text at the same (normalised) URL."""
+    return hashlib.sha256(f"{normalize_url(url)}\n{text_hash(text)}".encode("utf-8")).hexdigest()
+
+
+def cluster_fingerprint(article_hashes, summary=""):
+    """Identity of a cluster: the set of its articles (its summary if it has none)."""
+    members = sorted(set(article_hashes)) or [f"summary:{text_hash(summary)}"]
+    return hashlib.sha256("\n".join(members).encode("utf-8")).hexdigest()
+
+
+def clean_cluster(cluster_info, label):
+    if not cluster_info or not cluster_info.get('cluster_summary'):
+        raise ValidationError(f"{label} missing required cluster data")
+
+    cluster = {'cluster_summary': cluster_info.get('cluster_summary')}
+    if cluster_info.get('cluster_id'):
+        cluster['cluster_id'] = cluster_info.get('cluster_id')
+    if cluster_info.get('cluster_title'):
+        cluster['cluster_title'] = cluster_info.get('cluster_title')
+    return cluster
+
+
+def clean_article(article, label):
+    if not isinstance(article, dict) or not article.get('title') or not article.get('text'):
+        raise ValidationError(f"{label} missing required fields (title, text)")
+
+    article_data = {
+        'title': article.get('title'),
+        'text': article.get('text'),
+        'article_summary': article.get('article_summary'),
+        'source': article.get('source'),
+        'url': article.get('url'),
+        'content_hash': content_hash(article.get('url'), article.get('text'))
+    }
+    if article.get('article_id'):
+        article_data['article_id'] = article.get('article_id')
+    if article.get('embedding') is not None:
+        article_data['embedding'] = clean_embedding(article.get('embedding'), label)
+    return {k: v for k, v in article_data.items() if v is not None}
+
+
+def clean_embedding(embedding, label):
+    if (not isinstance(embedding, list) or len(embedding) != EMBEDDING_DIM
+            or not all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in embedding)):
+        raise ValidationError(f"{label} embedding must be a list of {EMBEDDING_DIM} numbers")
+    return embedding
+
+
+def clean_articles(articles, prefix=""):
+    if not isinstance(articles, list):
+        raise ValidationError(f"{prefix}articles must be a list")
+    return [clean_article(article, f"{prefix}Article {j+1}") for j, article in enumerate(articles)]
+
+
+def clean_batch(batch, label="Cluster", article_prefix=None):
+    """Validate and normalise one {"cluster", "articles"} batch."""
+    if not isinstance(batch, dict):
+        raise ValidationError(f"{label} must be an object")
+    cluster = clean_cluster(batch.get('cluster'), label)
+    prefix = f"{label}, " if article_prefix is None else article_prefix
+    articles = clean_articles(batch.get('articles', []), prefix=prefix)
+    cluster['fingerprint'] = cluster_fingerprint([a['content_hash'] for a in articles], cluster['cluster_summary'])
+    return {'cluster': cluster, 'articles': articles}
+
+
+def dedupe(batches):
+    """Drop repeated clusters (by fingerprint) and articles (by content_hash) within one payload."""
+    seen_clusters = set()
+    seen_articles = set()
+    unique = []
+    for batch in batches:
+        if batch['cluster']['fingerprint'] in seen_clusters:
+            continue
+        seen_clusters.add(batch['cluster']['fingerprint'])
+        articles = []
+        for article in batch['articles']:
+            if article['content_hash'] not in seen_articles:
+                seen_articles.add(article['content_hash'])
+                articles.append(article)
+        unique.append(dict(batch, articles=articles))
+    return unique
+
+
+def clean_bulk(clusters_data):
+    """Validate a whole /api/data/bulk payload before anything is written."""
+    if not isinstance(clusters_data, list):
+        raise ValidationError("clusters must be a list")
+    return [clean_batch(batch, f"Cluster {i+1}") for i, batch in enumerate(clusters_data)]
+
+
+def iter_ndjson_batches(stream, start=1):
+    """
+    Parse and validate one batch per line of an NDJSON byte stream.
+
+    Lines are read one at a time so the request body is never held in memory.
+    """
+    for i, line in enumerate(iter(stream.readline, b""), start):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            batch = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValidationError(f"Line {i} is not valid JSON: {e}")
+        yield clean_batch(batch, f"Cluster {i}")
+
+
+def spool_batches(batches):
+    """
+    Validate every batch up front without keeping the payload in memory.
+
+    Cleaned batches are written to a temporary file (in memory up to
+    SPOOL_MAX_MEMORY, then on disk) that is rewound for writing.
+
+    Returns:
+        Tuple of (file object, number of batches)
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, mode="w+b")
+    count = 0
+    for batch in batches:
+        spool.write(json.dumps(batch).encode("utf-8") + b"\n")
+        count += 1
+    spool.seek(0)
+    return spool, count
+
+
+def read_spool(spool):
+    for line in iter(spool.readline, b""):
+        yield json.loads(line)
+
+
+def group_results(written):
+    """
+    Regroup ingest_bulk output by cluster.
+
+    Returns:
+        List of {"cluster", "created", "articles", "articles_count",
+        "articles_unchanged"} in payload order. "articles" holds only newly
+        created rows; clusters that already existed have created=False.
+    """
+    by_cluster = {}
+    for article in written['articles']:
+        by_cluster.setdefault(article['cluster_id'], []).append(article)
+
+    results = []
+    for cluster in written['clusters']:
+        created = cluster.pop('created')
+        submitted = cluster.pop('submitted_articles')
+        articles = by_cluster.get(cluster['cluster_id'], [])
+        results.append({
+            "cluster": cluster,
+            "created": created,
+            "articles": articles,
+            "articles_count": len(articles),
+            "articles_unchanged": submitted - len(articles)
+        })
+    return results
+
+
+def summarize(results):
+    """Created vs unchanged totals for a list of group_results() entries."""
+    return {
+        "total_clusters_created": sum(1 for r in results if r["created"]),
+        "total_clusters_unchanged": sum(1 for r in results if not r["created"]),
+        "total_articles_created": sum(r["articles_count"] for r in results),
+        "total_articles_unchanged": sum(r["articles_unchanged"] for r in results),
+    }
+
+
+def write_batches(store, batches):
+    """Write validated batches in one transactional call; returns group_results()."""
+    if not batches:
+        return []
+    return group_results(store.ingest_bulk(dedupe(batches)))
+
+
+def write_stream(store, batches, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Write an iterator of validated batches in chunks of chunk_size clusters.
+
+    Each chunk is its own transaction; pass batches through spool_batches()
+    first so a bad line is caught before anything is written.
+
+    Yields:
+        group_results() for each committed chunk
+    """
+    chunk = []
+    for batch in batches:
+        chunk.append(batch)
+        if len(chunk) >= chunk_size:
+            yield write_batches(store, chunk)
+            chunk = []
+    if chunk:
+        yield write_batches(store, chunk)
+
+
+def backfill_keys(store):
+    """
+    Fill content_hash / fingerprint on rows written before
+    sql/002_content_hash_upserts.sql. Rows that turn out to duplicate an
+    already keyed row keep a NULL key.
+
+    Returns:
+        Tuple of (articles updated, clusters updated, duplicates skipped)
+    """
+    from db import Conflict
+
+    def set_key(table, key, row_id, values):
+        try:
+            store.update_row(table, key, row_id, values)
+            return True
+        except Conflict:
+            return False
+
+    articles = store.fetch_all('articles', "article_id, cluster_id, url, text, content_hash", 'article_id')
+    members = {}
+    updated_articles = duplicates = 0
+    for a in articles:
+        h = a.get('content_hash') or content_hash(a.get('url'), a.get('text'))
+        members.setdefault(a.get('cluster_id'), []).append(h)
+        if not a.get('content_hash'):
+            if set_key('articles', 'article_id', a['article_id'], {'content_hash': h}):
+                updated_articles += 1
+            else:
+                duplicates += 1
+
+    updated_clusters = 0
+    for c in store.fetch_all('clusters', "cluster_id, cluster_summary, fingerprint", 'cluster_id'):
+        if c.get('fingerprint'):
+            continue
+        fingerprint = cluster_fingerprint(members.get(c['cluster_id'], []), c.get('cluster_summary'))
+        if set_key('clusters', 'cluster_id', c['cluster_id'], {'fingerprint': fingerprint}):
+            updated_clusters += 1
+        else:
+            duplicates += 1
+
+    return updated_articles, updated_clusters, duplicates
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+    from db import create_store
+
+    if "--backfill" not in sys.argv:
+        print("usage: python ingest.py --backfill")
+        sys.exit(1)
+    load_dotenv()
+    articles, clusters, duplicates = backfill_keys(create_store())
+    print(f"Backfilled {articles} articles and {clusters} clusters ({duplicates} duplicates left unkeyed)")
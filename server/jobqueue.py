@@ -0,0 +1,331 @@
+"""
+Durable SQLite job queue for sharded ingestion (worker.py, coordinator.py).
+
+An ingestion batch is a set of jobs — one per feed, outlet homepage, article
+URL or summarization batch — plus the articles those jobs collect, staged in
+the same database until the coordinator clusters them.
+
+Workers lease jobs: a lease marks the job as taken until lease_until, and a
+job whose worker dies is leased again once that passes. Failed jobs go back
+on the queue with exponential backoff until MAX_ATTEMPTS, then stay failed.
+Jobs are unique per (batch, kind, key), so enqueueing the same URL twice in a
+batch is a no-op, and article staging is unique per (batch, url), so a job
+that runs twice (an expired lease that was still running) stages once.
+
+The file (JOB_QUEUE_PATH) runs in WAL mode, which coordinates processes
+through shared memory and so only works between processes on one host, with
+the file on a local disk. The queue enforces both: it refuses a path on a
+network filesystem (NFS, SMB, ...), and records the host using it, so another
+host is refused until this one has been idle for a lease period. Add workers
+as more processes on that host (worker.py --processes N).
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from array import array
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "jobs.db")
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF = 5.0
+# filesystem types (/proc/self/mounts) whose locking cannot carry a WAL database
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p", "fuse.sshfs", "fuse.s3fs"}
+
+SCHEMA = """
+create table if not exists batches (
+  batch text primary key,
+  created_at real not null,
+  finished_at real
+);
+
+create table if not exists jobs (
+  job_id integer primary key,
+  batch text not null references batches (batch),
+  kind text not null,
+  key text not null,
+  payload text not null,
+  status text not null default 'queued',
+  attempts integer not null default 0,
+  available_at real not null,
+  lease_until real,
+  worker text,
+  error text,
+  updated_at real not null,
+  unique (batch, kind, key)
+);
+
+create index if not exists jobs_ready_idx on jobs (status, available_at);
+create index if not exists jobs_batch_idx on jobs (batch, status);
+
+create table if not exists staged_articles (
+  article_id integer primary key,
+  batch text not null references batches (batch),
+  source text not null,
+  title text not null,
+  url text not null,
+  text text not null,
+  summary text,
+  embedding blob,
+  unique (batch, url)
+);
+
+create index if not exists staged_articles_title_idx on staged_articles (batch, title);
+
+-- the one host using the queue, and when it last leased a job
+create table if not exists queue_host (
+  id integer primary key check (id = 1),
+  host text not null,
+  seen_at real not null
+);
+"""
+
+
+def filesystem_type(path):
+    """Type of the filesystem holding path, from /proc/self/mounts, or None where that is unavailable."""
+    try:
+        with open("/proc/self/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best, fs_type = "", None
+    for mount_point, kind in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+        if inside and len(mount_point) > len(best):
+            best, fs_type = mount_point, kind
+    return fs_type
+
+
+class JobQueue:
+    def __init__(self, path=JOB_QUEUE_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.host = socket.gethostname()
+        fs_type = filesystem_type(os.path.dirname(os.path.abspath(path)))
+        if fs_type in NETWORK_FILESYSTEMS:
+            raise RuntimeError(f"Job queue {path} is on {fs_type}; WAL mode needs it on a local disk")
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self._claim_host()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("pragma journal_mode = wal")
+            conn.execute("pragma synchronous = normal")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, sql, params=()):
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _read(self, sql, params=()):
+        return self._connect().execute(sql, params).fetchall()
+
+    def _claim_host(self):
+        """
+        Record this host as the queue's user.
+
+        Raises:
+            RuntimeError: if another host leased a job within the last lease period
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("begin immediate")
+            row = conn.execute("select host, seen_at from queue_host where id = 1").fetchone()
+            if row and row["host"] != self.host and row["seen_at"] > now - self.lease_seconds:
+                raise RuntimeError(f"Job queue {self.path} is in use by host {row['host']}; "
+                                   f"it can only be shared by processes on one host")
+            conn.execute("insert into queue_host (id, host, seen_at) values (1, ?, ?) "
+                         "on conflict (id) do update set host = excluded.host, seen_at = excluded.seen_at",
+                         (self.host, now))
+
+    def _touch_host(self, conn, now):
+        # another host took the queue over while this one was idle
+        if not conn.execute("update queue_host set seen_at = ? where host = ?", (now, self.host)).rowcount:
+            raise RuntimeError(f"Job queue {self.path} was taken over by another host")
+
+    def touch_host(self):
+        """
+        Keep this host's claim on the queue while it is not leasing jobs (the coordinator waiting).
+
+        Raises:
+            RuntimeError: if another host has taken the queue over
+        """
+        with self._connect() as conn:
+            self._touch_host(conn, time.time())
+
+    # --- batches and jobs ---
+
+    def create_batch(self, batch):
+        self._write("insert or ignore into batches (batch, created_at) values (?, ?)", (batch, time.time()))
+
+    def finish_batch(self, batch):
+        self._write("update batches set finished_at = ? where batch = ?", (time.time(), batch))
+
+    def is_finished(self, batch):
+        rows = self._read("select finished_at from batches where batch = ?", (batch,))
+        return bool(rows and rows[0]["finished_at"] is not None)
+
+    def latest_batch(self, unfinished=True):
+        """The most recent batch id (only unfinished ones by default), or None."""
+        where = "where finished_at is null" if unfinished else ""
+        rows = self._read(f"select batch from batches {where} order by created_at desc limit 1")
+        return rows[0]["batch"] if rows else None
+
+    def enqueue_many(self, batch, kind, jobs):
+        """Add (key, payload) jobs in one transaction; returns how many were new."""
+        now = time.time()
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "insert or ignore into jobs (batch, kind, key, payload, available_at, updated_at) "
+                "values (?, ?, ?, ?, ?, ?)",
+                [(batch, kind, key, json.dumps(payload), now, now) for key, payload in jobs])
+            return conn.total_changes - before
+
+    def lease(self, worker, kinds=None):
+        """
+        Take the oldest available job: queued and due, or leased by a worker whose lease expired.
+
+        Args:
+            worker: id recorded on the job, required to complete or fail it
+            kinds: only lease jobs of these kinds
+
+        Returns:
+            Job dict with payload decoded, or None if nothing is available
+        """
+        now = time.time()
+        kind_filter = f"and kind in ({', '.join('?' * len(kinds))})" if kinds else ""
+        with self._connect() as conn:
+            self._touch_host(conn, now)
+            # leases that expired on their last attempt are not retried
+            conn.execute("update jobs set status = 'failed', error = coalesce(error, 'lease expired'), "
+                         "updated_at = ? where status = 'leased' and lease_until < ? and attempts >= ?",
+                         (now, now, self.max_attempts))
+            rows = conn.execute(
+                "update jobs set status = 'leased', attempts = attempts + 1, lease_until = ?, worker = ?, "
+                "updated_at = ? where job_id = ("
+                "  select job_id from jobs"
+                "  where ((status = 'queued' and available_at <= ?) or (status = 'leased' and lease_until < ?))"
+                f"  {kind_filter} order by job_id limit 1"
+                ") returning *",
+                (now + self.lease_seconds, worker, now, now, now, *(kinds or ()))).fetchall()
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def heartbeat(self, job, worker):
+        """Extend a lease the worker still holds; returns False if it was lost."""
+        now = time.time()
+        rows = self._write("update jobs set lease_until = ?, updated_at = ? "
+                           "where job_id = ? and worker = ? and status = 'leased' returning job_id",
+                           (now + self.lease_seconds, now, job["job_id"], worker))
+        return bool(rows)
+
+    def complete(self, job, worker):
+        """
+        Mark a leased job done.
+
+        Returns:
+            False if the lease was lost (expired and taken by another worker)
+        """
+        rows = self._write("update jobs set status = 'done', lease_until = null, updated_at = ? "
+                           "where job_id = ? and worker = ? and status = 'leased' returning job_id",
+                           (time.time(), job["job_id"], worker))
+        return bool(rows)
+
+    def fail(self, job, worker, error):
+        """Requeue a leased job with backoff, or mark it failed after max_attempts."""
+        now = time.time()
+        attempts = job["attempts"]
+        if attempts >= self.max_attempts:
+            status, available_at = "failed", now
+        else:
+            status, available_at = "queued", now + RETRY_BACKOFF * 2 ** (attempts - 1)
+        self._write("update jobs set status = ?, available_at = ?, lease_until = null, error = ?, updated_at = ? "
+                    "where job_id = ? and worker = ? and status = 'leased'",
+                    (status, available_at, str(error)[:500], now, job["job_id"], worker))
+
+    def cancel(self, batch, kinds):
+        """Drop the batch's unfinished jobs of these kinds (the run is out of time); returns how many."""
+        with self._connect() as conn:
+            return conn.execute(
+                f"update jobs set status = 'cancelled', updated_at = ? where batch = ? "
+                f"and status in ('queued', 'leased') and kind in ({', '.join('?' * len(kinds))})",
+                (time.time(), batch, *kinds)).rowcount
+
+    def pending(self, batch, kinds=None):
+        """Jobs of the batch still queued or leased."""
+        sql = "select count(*) from jobs where batch = ? and status in ('queued', 'leased')"
+        params = [batch]
+        if kinds:
+            sql += f" and kind in ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        return self._read(sql, params)[0][0]
+
+    def job_status(self, batch, kinds):
+        """(kind, key) -> (status, error) for the batch's jobs of these kinds."""
+        rows = self._read(f"select kind, key, status, error from jobs where batch = ? "
+                          f"and kind in ({', '.join('?' * len(kinds))})", (batch, *kinds))
+        return {(row["kind"], row["key"]): (row["status"], row["error"]) for row in rows}
+
+    def counts(self, batch):
+        """kind -> status -> number of jobs."""
+        counts = {}
+        for row in self._read("select kind, status, count(*) as n from jobs where batch = ? group by kind, status",
+                              (batch,)):
+            counts.setdefault(row["kind"], {})[row["status"]] = row["n"]
+        return counts
+
+    # --- staged articles ---
+
+    def stage_article(self, batch, source, title, url, text):
+        """Stage a collected article; returns False if the batch already has its URL or title."""
+        with self._connect() as conn:
+            if conn.execute("select 1 from staged_articles where batch = ? and title = ?", (batch, title)).fetchone():
+                return False
+            cursor = conn.execute("insert or ignore into staged_articles (batch, source, title, url, text) "
+                                  "values (?, ?, ?, ?, ?)", (batch, source, title, url, text))
+            return cursor.rowcount == 1
+
+    def staged_urls(self, batch):
+        return {row["url"] for row in self._read("select url from staged_articles where batch = ?", (batch,))}
+
+    def unsummarized(self, batch):
+        """Ids of the batch's staged articles without a summary yet."""
+        return [row["article_id"] for row in self._read(
+            "select article_id from staged_articles where batch = ? and summary is null order by article_id",
+            (batch,))]
+
+    def get_staged(self, article_ids):
+        rows = self._read(f"select article_id, text from staged_articles "
+                          f"where article_id in ({', '.join('?' * len(article_ids))})", article_ids)
+        return [dict(row) for row in rows]
+
+    def set_summaries(self, rows):
+        """Store (article_id, summary, embedding vector) rows."""
+        with self._connect() as conn:
+            conn.executemany("update staged_articles set summary = ?, embedding = ? where article_id = ?",
+                             [(summary, array("f", embedding).tobytes(), article_id)
+                              for article_id, summary, embedding in rows])
+
+    def iter_staged(self, batch):
+        """The batch's staged articles in id order, embeddings as float lists (None if missing)."""
+        for row in self._connect().execute("select * from staged_articles where batch = ? order by article_id",
+                                           (batch,)):
+            row = dict(row)
+            if row["embedding"] is not None:
+                row["embedding"] = array("f", row["embedding"]).tolist()
+            yield row
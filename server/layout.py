@@ -0,0 +1,284 @@
+"""
+Server-side force-directed layout for the graph snapshot.
+
+Runs the same forces as ForceGraph.tsx (many-body charge, link springs, x/y
+centering) plus collision, so clients can draw the graph straight away instead
+of running a d3 simulation from scratch. Charge is approximated Barnes-Hut
+style on a quadtree of uniform grid levels:
+
+- nodes in the same or an adjacent leaf cell interact exactly, pair by pair
+- farther nodes are aggregated into cell centroids, using at each level only
+  the cells that were too close to be aggregated at the parent level
+
+Each level is a few whole-array NumPy operations, so an iteration is
+O(n log n) with no Python loop over nodes.
+
+Layouts are seeded from the previous positions so the picture stays stable
+between pipeline runs; only new nodes need to settle.
+"""
+import json
+import os
+import tempfile
+
+import numpy as np
+
+CHARGE_STRENGTH = -60.0
+LINK_DISTANCE = 30.0
+CENTER_STRENGTH = 0.1
+VELOCITY_DECAY = 0.4
+DISTANCE_MIN2 = 1.0
+LEAF_SIZE = 8
+MAX_DEPTH = 10
+RADIUS = {"cluster": 12.0, "article": 6.0}
+
+LAYOUT_PATH = os.getenv("LAYOUT_PATH", "layout.json")
+
+
+def load_positions(path=LAYOUT_PATH):
+    """Load the last persisted {node_id: [x, y]} layout, or {} if there is none."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_positions(positions, path=LAYOUT_PATH):
+    # a temp file of its own, so workers saving at the same time do not write into each other's
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(os.path.abspath(path)),
+                                     prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False) as f:
+        json.dump(positions, f)
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+
+def _initial_positions(ids, sources, targets, previous, rng):
+    """Previous positions where known; new nodes start next to a placed neighbour."""
+    n = len(ids)
+    pos = np.empty((n, 2))
+    known = np.zeros(n, dtype=bool)
+    for i, node_id in enumerate(ids):
+        p = previous.get(node_id)
+        if p is not None:
+            pos[i] = p
+            known[i] = True
+
+    # new nodes with no placed neighbour go on d3's phyllotaxis spiral
+    i = np.arange(n)
+    radius = 10.0 * np.sqrt(0.5 + i)
+    angle = i * np.pi * (3 - np.sqrt(5))
+    spiral = np.column_stack([radius * np.cos(angle), radius * np.sin(angle)])
+
+    # new articles of an existing cluster start near that cluster
+    for s, t in zip(sources, targets):
+        for a, b in ((s, t), (t, s)):
+            if not known[a] and known[b]:
+                pos[a] = pos[b] + rng.normal(scale=LINK_DISTANCE / 2, size=2)
+                known[a] = True
+
+    pos[~known] = spiral[~known]
+    return pos, known
+
+
+def _cell_ranges(cell, n_cells):
+    """Sort order of nodes by cell plus each cell's [start, end) in that order."""
+    order = np.argsort(cell, kind="stable")
+    counts = np.bincount(cell, minlength=n_cells)
+    ends = np.cumsum(counts)
+    return order, ends - counts, ends
+
+
+def _near_pairs(ix, iy, depth):
+    """All (i, j), i != j, with j in the same or an adjacent leaf cell as i."""
+    g = 1 << depth
+    cell = ix * g + iy
+    order, starts, ends = _cell_ranges(cell, g * g)
+
+    pair_i = []
+    pair_j = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            nx = ix + dx
+            ny = iy + dy
+            valid = (nx >= 0) & (nx < g) & (ny >= 0) & (ny < g)
+            src = np.nonzero(valid)[0]
+            ncell = nx[src] * g + ny[src]
+            count = ends[ncell] - starts[ncell]
+            # expand every node into one row per member of the neighbouring cell
+            rep_i = np.repeat(src, count)
+            offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+            rep_j = order[np.repeat(starts[ncell], count) + offset]
+            pair_i.append(rep_i)
+            pair_j.append(rep_j)
+
+    pair_i = np.concatenate(pair_i)
+    pair_j = np.concatenate(pair_j)
+    distinct = pair_i != pair_j
+    return pair_i[distinct], pair_j[distinct]
+
+
+def _far_charge(pos, ix, iy, depth, strength):
+    """
+    Charge from cell centroids that are well separated from each node's cell.
+
+    Coarse levels are evaluated once per occupied cell at its centroid and
+    shared by the cell's members; the leaf level is evaluated per node.
+    """
+    force = np.zeros_like(pos)
+    # children of the parent cell's 3x3 neighbourhood, relative to the parent's first child
+    kx, ky = np.meshgrid(np.arange(-2, 4), np.arange(-2, 4), indexing="ij")
+    kx = kx.ravel()[None, :]
+    ky = ky.ravel()[None, :]
+
+    for level in range(2, depth + 1):
+        shift = depth - level
+        g = 1 << level
+        cell = (ix >> shift) * g + (iy >> shift)
+        mass = np.bincount(cell, minlength=g * g).astype(float)
+        cx = np.bincount(cell, weights=pos[:, 0], minlength=g * g)
+        cy = np.bincount(cell, weights=pos[:, 1], minlength=g * g)
+        occupied = np.nonzero(mass)[0]
+        cx[occupied] /= mass[occupied]
+        cy[occupied] /= mass[occupied]
+
+        if level == depth:
+            at = cell
+            px, py = pos[:, 0:1], pos[:, 1:2]
+        else:
+            at = occupied
+            px, py = cx[occupied][:, None], cy[occupied][:, None]
+        lx = (at // g)[:, None]
+        ly = (at % g)[:, None]
+
+        ox = ((lx >> 1) << 1) + kx
+        oy = ((ly >> 1) << 1) + ky
+        # skip cells off the grid and cells adjacent to our own (handled one level down)
+        ok = (ox >= 0) & (ox < g) & (oy >= 0) & (oy < g)
+        ok &= (np.abs(ox - lx) > 1) | (np.abs(oy - ly) > 1)
+        other = np.where(ok, ox * g + oy, 0)
+        m = np.where(ok, mass[other], 0.0)
+        dx = cx[other] - px
+        dy = cy[other] - py
+        w = strength * m / np.maximum(dx * dx + dy * dy, DISTANCE_MIN2)
+        fx = (w * dx).sum(axis=1)
+        fy = (w * dy).sum(axis=1)
+
+        if level == depth:
+            force[:, 0] += fx
+            force[:, 1] += fy
+        else:
+            cell_fx = np.zeros(g * g)
+            cell_fy = np.zeros(g * g)
+            cell_fx[occupied] = fx
+            cell_fy[occupied] = fy
+            force[:, 0] += cell_fx[cell]
+            force[:, 1] += cell_fy[cell]
+    return force
+
+
+def _scatter_add(target, index, values):
+    """target[index] += values for repeated indices (bincount is much faster than np.add.at)."""
+    n = len(target)
+    target[:, 0] += np.bincount(index, weights=values[:, 0], minlength=n)
+    target[:, 1] += np.bincount(index, weights=values[:, 1], minlength=n)
+
+
+def compute_layout(ids, types, links, previous=None, iterations=300, seed=0):
+    """
+    Lay out a graph.
+
+    Args:
+        ids: node ids
+        types: node type per id ("cluster" or "article"), used for collision radii
+        links: list of (source_id, target_id)
+        previous: optional {node_id: [x, y]} from the last run
+        iterations: simulation ticks for a cold start; warm starts use fewer
+        seed: RNG seed so identical input gives an identical layout
+
+    Returns:
+        Dictionary of node_id -> [x, y]
+    """
+    n = len(ids)
+    if n == 0:
+        return {}
+    previous = previous or {}
+    rng = np.random.default_rng(seed)
+
+    index = {node_id: i for i, node_id in enumerate(ids)}
+    pairs = [(index[s], index[t]) for s, t in links if s in index and t in index]
+    sources = np.array([p[0] for p in pairs], dtype=np.int64)
+    targets = np.array([p[1] for p in pairs], dtype=np.int64)
+    radius = np.array([RADIUS.get(t, RADIUS["article"]) for t in types])
+
+    pos, _ = _initial_positions(ids, sources, targets, previous, rng)
+    vel = np.zeros_like(pos)
+
+    # d3.forceLink defaults: strength 1/min(degree), bias towards the lighter end
+    degree = np.bincount(np.concatenate([sources, targets]), minlength=n).astype(float)
+    link_strength = 1.0 / np.maximum(np.minimum(degree[sources], degree[targets]), 1)
+    bias = degree[sources] / np.maximum(degree[sources] + degree[targets], 1)
+
+    warm = previous and sum(1 for node_id in ids if node_id in previous) >= 0.9 * n
+    alpha = 0.1 if warm else 1.0
+    ticks = iterations // 3 if warm else iterations
+    alpha_min = 0.001
+    alpha_decay = 1 - alpha_min ** (1 / max(ticks, 1))
+    depth = int(min(MAX_DEPTH, max(2, np.ceil(np.log(max(n / LEAF_SIZE, 1)) / np.log(4)))))
+
+    for _ in range(ticks):
+        alpha += (0 - alpha) * alpha_decay
+
+        # links
+        if len(sources):
+            delta = pos[targets] + vel[targets] - pos[sources] - vel[sources]
+            length = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 1e-6)
+            k = ((length - LINK_DISTANCE) / length * alpha * link_strength)[:, None] * delta
+            _scatter_add(vel, targets, -k * bias[:, None])
+            _scatter_add(vel, sources, k * (1 - bias[:, None]))
+
+        # grid over the current bounding square
+        lo = pos.min(axis=0)
+        span = max(float((pos.max(axis=0) - lo).max()), 1e-6) * (1 + 1e-9)
+        g = 1 << depth
+        cells = np.minimum(((pos - lo) / span * g).astype(np.int64), g - 1)
+        ix, iy = cells[:, 0], cells[:, 1]
+
+        # charge: exact for near pairs, aggregated for far cells
+        charge = _far_charge(pos, ix, iy, depth, CHARGE_STRENGTH)
+        pi, pj = _near_pairs(ix, iy, depth)
+        d = pos[pj] - pos[pi]
+        d2 = np.maximum((d * d).sum(axis=1), DISTANCE_MIN2)
+        _scatter_add(charge, pi, (CHARGE_STRENGTH / d2)[:, None] * d)
+        vel += charge * alpha
+
+        # collision between overlapping near pairs
+        dist = np.sqrt(d2)
+        overlap = radius[pi] + radius[pj] - dist
+        hit = overlap > 0
+        if hit.any():
+            push = (overlap[hit] / dist[hit] * 0.5)[:, None] * d[hit]
+            _scatter_add(vel, pi[hit], -push * 0.5)
+
+        # forceX / forceY towards the origin
+        vel -= pos * CENTER_STRENGTH * alpha
+
+        vel *= 1 - VELOCITY_DECAY
+        pos += vel
+
+    return {node_id: [round(float(x), 2), round(float(y), 2)] for node_id, (x, y) in zip(ids, pos)}
+
+
+def layout_graph(graph, previous=None):
+    """Attach x/y to every node of a build_graph() snapshot in place."""
+    positions = compute_layout(
+        [node["id"] for node in graph["nodes"]],
+        [node["type"] for node in graph["nodes"]],
+        [(link["source"], link["target"]) for link in graph["links"]],
+        previous=previous,
+    )
+    for node in graph["nodes"]:
+        node["x"], node["y"] = positions[node["id"]]
+    return positions
@@ -0,0 +1,369 @@
+"""
+Load tests for the read API.
+
+Starts server.py (or asgi.py with --asgi) against the embedded SQLite backend
+(sqlite_store.py), which stands in for Supabase. The database is seeded with a
+synthetic corpus of the requested size. Each endpoint is then driven at
+increasing concurrency by closed-loop client threads; each thread sends its
+next request as soon as the previous one returns. The run reports throughput,
+p50/p95/p99 latency, mean response size, errors and the server's resident
+memory, and can be compared against a stored baseline:
+
+    python loadtest.py --sizes 1k,100k --concurrency 1,8,32 --duration 10
+    python loadtest.py --sizes 1k --admission              # with the default admission limits on
+    python loadtest.py --sizes 1k --save-baseline          # refresh loadtest_baseline.json
+    python loadtest.py --sizes 1k --fail-on-regression     # exit 1 if >20% worse than baseline
+
+Admission control (admission.py) is off unless --admission is given. With it,
+each client thread sends its own X-Forwarded-For, so the server sees one client
+per thread. Answers with 429 (rate limited) and 503 (no free slot) are counted
+as throttled and shed rather than as errors, and ok_rps is the rate of admitted
+requests. Those results are stored under "<endpoint>@<concurrency>/admission".
+
+Seeded databases are kept in --data-dir and reused by later runs. Note that
+the load generator shares the machine (and Python's GIL) with the server, so
+absolute numbers are only comparable between runs on the same host.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import numpy as np
+import psutil
+
+from ingest import content_hash, cluster_fingerprint
+from sqlite_store import SqliteStore
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "loadtest_baseline.json")
+
+SOURCES = ["CNN", "BBC", "Fox News", "NYT", "Reuters", "AP", "WSJ", "Guardian", "NPR", "Al Jazeera"]
+ARTICLES_PER_CLUSTER = 5
+
+# name -> (path template, largest corpus it is run against)
+ENDPOINTS = {
+    "clusters_page": ("/api/clusters?limit=100", None),
+    "articles_page": ("/api/articles?limit=100&fields=article_id,cluster_id,title,source", None),
+    "articles_cursor": ("/api/articles?limit=100&fields=article_id,title&cursor={article_id}", None),
+    "articles_by_source": ("/api/articles?limit=100&fields=article_id,title&source={source}", None),
+    "article": ("/api/articles/{article_id}", None),
+    "cluster": ("/api/clusters/{cluster_id}", None),
+    "cluster_articles": ("/api/clusters/{cluster_id}/articles", None),
+    "search": ("/api/search?q={word}", None),
+    "changes": ("/api/changes?since=0", None),
+    # the force layout is rebuilt on a cold start; keep it to sizes where that takes seconds
+    "graph": ("/api/graph", 20_000),
+}
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def _words(rng, vocabulary, n):
+    return " ".join(rng.choices(vocabulary, k=n))
+
+
+def seed_database(path, n_articles, seed=0):
+    """
+    Create (or reuse) a SQLite database with n_articles synthetic articles in
+    clusters of ARTICLES_PER_CLUSTER.
+
+    Returns:
+        The database path
+    """
+    if os.path.exists(path):
+        with sqlite3.connect(path) as conn:
+            if conn.execute("select count(*) from articles").fetchone()[0] == n_articles:
+                return path
+        os.remove(path)
+
+    SqliteStore(path)  # creates the schema
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 9))) for _ in range(5000)]
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+
+    conn = sqlite3.connect(path)
+    conn.execute("pragma synchronous = off")
+    n_clusters = -(-n_articles // ARTICLES_PER_CLUSTER)
+    article_id = 0
+    for first in range(0, n_clusters, 10_000):
+        clusters = []
+        articles = []
+        for cluster_id in range(first + 1, min(n_clusters, first + 10_000) + 1):
+            created = (start + timedelta(seconds=cluster_id * 30 * 86400 / n_clusters)).isoformat()
+            hashes = []
+            for _ in range(min(ARTICLES_PER_CLUSTER, n_articles - article_id)):
+                article_id += 1
+                source = rng.choice(SOURCES)
+                url = f"https://example.com/{source.lower().replace(' ', '-')}/{article_id}"
+                text = _words(rng, vocabulary, 80)
+                hashes.append(content_hash(url, text))
+                articles.append((article_id, cluster_id, _words(rng, vocabulary, 8), text,
+                                 _words(rng, vocabulary, 30), source, url, hashes[-1], created))
+            clusters.append((cluster_id, _words(rng, vocabulary, 4), _words(rng, vocabulary, 40),
+                             cluster_fingerprint(hashes), created))
+        conn.executemany("insert into clusters (cluster_id, cluster_title, cluster_summary, fingerprint, created_at) "
+                         "values (?, ?, ?, ?, ?)", clusters)
+        conn.executemany("insert into articles (article_id, cluster_id, title, text, article_summary, source, url, "
+                         "content_hash, created_at) values (?, ?, ?, ?, ?, ?, ?, ?, ?)", articles)
+        conn.commit()
+    conn.execute("insert into changes (cluster_ids, article_ids) values ('[]', '[]')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+class ServerProcess:
+    """The API in a subprocess on the seeded database."""
+
+    def __init__(self, db_path, port, asgi=False, cache=True, admission=False):
+        # without admission the load generator is one unlimited client; with it, one client per thread
+        env = dict(os.environ, STORAGE_BACKEND="sqlite", SQLITE_PATH=db_path,
+                   ADMISSION_CONTROL="on" if admission else "off",
+                   LAYOUT_PATH=os.path.join(tempfile.gettempdir(), f"loadtest-layout-{port}.json"))
+        if admission:
+            env["TRUST_PROXY"] = "1"
+        if not cache:
+            env["CACHE_MAX_ENTRIES"] = "0"
+        if asgi:
+            command = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning"]
+        else:
+            command = [sys.executable, "-m", "flask", "--app", "server", "run", "--port", str(port),
+                       "--with-threads", "--no-reload", "--no-debugger"]
+        self.url = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.ps = psutil.Process(self.process.pid)
+
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            try:
+                if httpx.get(self.url + "/server", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("server did not start")
+
+    def rss(self):
+        """Resident memory of the server and its worker processes, in bytes."""
+        total = self.ps.memory_info().rss
+        for child in self.ps.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_level(server, template, params, concurrency, duration):
+    """Drive one endpoint at a fixed concurrency for duration seconds, one client address per thread."""
+    latencies = []
+    sizes = []
+    statuses = Counter()
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+    peak_rss = [server.rss()]
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local_latencies = []
+        local_sizes = []
+        local_statuses = Counter()
+        # only read by the server when TRUST_PROXY is set (--admission)
+        headers = {"X-Forwarded-For": f"10.0.{seed // 256}.{seed % 256}"}
+        with httpx.Client(base_url=server.url, timeout=60, headers=headers) as client:
+            while time.monotonic() < stop:
+                path = template.format(**{k: rng.choice(v) for k, v in params.items()})
+                start = time.perf_counter()
+                try:
+                    response = client.get(path)
+                    body = response.content
+                    status = response.status_code
+                except httpx.HTTPError:
+                    body = b""
+                    status = None
+                local_latencies.append(time.perf_counter() - start)
+                local_sizes.append(len(body))
+                local_statuses[status] += 1
+        with lock:
+            latencies.extend(local_latencies)
+            sizes.extend(local_sizes)
+            statuses.update(local_statuses)
+
+    def sample_memory():
+        while time.monotonic() < stop:
+            peak_rss[0] = max(peak_rss[0], server.rss())
+            time.sleep(0.25)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    threads.append(threading.Thread(target=sample_memory))
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    ms = np.array(latencies) * 1000
+    ok = sum(n for status, n in statuses.items() if status is not None and status < 400)
+    return {
+        "requests": len(latencies),
+        "errors": len(latencies) - ok - statuses[429] - statuses[503],
+        "throttled": statuses[429],
+        "shed": statuses[503],
+        "rps": round(len(latencies) / elapsed, 1),
+        "ok_rps": round(ok / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else None,
+        "p95_ms": round(float(np.percentile(ms, 95)), 2) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else None,
+        "mean_bytes": int(np.mean(sizes)) if sizes else 0,
+        "peak_rss_mb": round(peak_rss[0] / 2**20, 1),
+    }
+
+
+def run_corpus(size, args):
+    db_path = seed_database(os.path.join(args.data_dir, f"loadtest-{size}.db"), size)
+    n_clusters = -(-size // ARTICLES_PER_CLUSTER)
+    rng = random.Random(1)
+    with sqlite3.connect(db_path) as conn:
+        titles = [row[0] for row in conn.execute("select title from articles order by random() limit 200")]
+    params = {
+        "article_id": [rng.randint(1, size) for _ in range(1000)],
+        "cluster_id": [rng.randint(1, n_clusters) for _ in range(1000)],
+        "source": SOURCES,
+        "word": [t.split()[0] for t in titles],
+    }
+
+    server = ServerProcess(db_path, args.port, asgi=args.asgi, cache=not args.no_cache, admission=args.admission)
+    suffix = "/admission" if args.admission else ""
+    results = {}
+    try:
+        server.wait_ready()
+        results["_idle_rss_mb"] = round(server.rss() / 2**20, 1)
+        for name in args.endpoints:
+            template, max_size = ENDPOINTS[name]
+            if max_size is not None and size > max_size:
+                continue
+            # first request builds snapshots / indexes; not part of the measurement
+            start = time.perf_counter()
+            httpx.get(server.url + template.format(**{k: v[0] for k, v in params.items()}), timeout=3600)
+            results.setdefault("_warmup_s", {})[name] = round(time.perf_counter() - start, 2)
+            for concurrency in args.concurrency:
+                stats = run_level(server, template, params, concurrency, args.duration)
+                results[f"{name}@{concurrency}{suffix}"] = stats
+                admitted = (f"  {stats['ok_rps']:>9} ok rps  {stats['throttled']:>6} 429  {stats['shed']:>6} 503"
+                            if args.admission else "")
+                print(f"{size:>9} {name:<20} c={concurrency:<4} {stats['rps']:>9} rps  "
+                      f"p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms  "
+                      f"{stats['mean_bytes']:>9} B  {stats['errors']:>4} err  {stats['peak_rss_mb']:>7} MB{admitted}",
+                      flush=True)
+    finally:
+        server.stop()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the change against the baseline for every measurement both contain.
+
+    Returns:
+        List of regressions (throughput down or p95 up by more than threshold)
+    """
+    regressions = []
+    print(f"\nCompared with baseline (regression threshold {threshold:.0%}):")
+    for size, runs in results.items():
+        for key, stats in runs.items():
+            base = baseline.get(size, {}).get(key)
+            if key.startswith("_") or not base:
+                continue
+            rps = stats["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+            p95 = stats["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+            flag = ""
+            if rps < -threshold or p95 > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{size} {key}")
+            print(f"{size:>9} {key:<26} rps {rps:+7.1%}  p95 {p95:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k,100k,1m", help="corpus sizes, e.g. 1k,100k,1m")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="client threads per level")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint and level")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--asgi", action="store_true", help="serve with uvicorn asgi:app instead of Flask")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache")
+    parser.add_argument("--admission", action="store_true",
+                        help="run with admission control on, one client per thread")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--data-dir", default=tempfile.gettempdir(), help="where seeded databases are kept")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in args.endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    results = {}
+    for text in args.sizes.split(","):
+        size = parse_size(text)
+        print(f"\n=== {size} articles ===", flush=True)
+        results[str(size)] = run_corpus(size, args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        # merged per size, so a run with --admission keeps the runs without it and vice versa
+        for size, runs in results.items():
+            baseline.setdefault(size, {}).update(runs)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import time
 import sys
 import os
 import subprocess
+import tempfile
 
 def main():
     """Run the scraper to generate JSON files, then upload to database."""
@@ -10,15 +11,32 @@ def main():
     print("NEWS CLUSTERING AND UPLOAD PIPELINE")
     print("-"*50)
     
+    # Each run writes its output to a file in a directory of its own (RAWDATA_PATH,
+    # read by app.py, coordinator.py and transform_and_upload.py), so the
+    # rawdata.json kept in the repo is never overwritten or deleted, and a file
+    # left by an earlier failed run is never uploaded twice.
+    with tempfile.TemporaryDirectory(prefix="noogie-run-") as run_dir:
+        run_pipeline(os.path.join(run_dir, "rawdata.json"))
+
+
+def run_pipeline(rawdata_path):
+    """Steps 1-3 of main(), with the run's output written to rawdata_path."""
+    env = dict(os.environ, RAWDATA_PATH=rawdata_path)
     try:
-        # Step 1: Run app.py to generate the JSON files
-        print("\n1. Running app.py to generate clusters.json and articles.json...")
+        # Step 1: Run app.py to generate the output file
+        print(f"\n1. Running app.py to generate {rawdata_path}...")
         print("-"*50)
         
+        # INGEST_MODE=queue runs the batch through the job queue instead (coordinator.py, worker.py)
+        if os.getenv("INGEST_MODE") == "queue":
+            command = [sys.executable, "coordinator.py", "--workers", os.getenv("INGEST_WORKERS", "4")]
+        else:
+            command = [sys.executable, "app.py"]
         result = subprocess.run(
-            [sys.executable, "app.py"],
+            command,
             capture_output=False,  # Show output in real-time
-            text=True
+            text=True,
+            env=env
         )
         
         if result.returncode != 0:
@@ -28,52 +46,44 @@ def main():
         print("-"*50)
         print("app.py completed successfully")
         
-        # Step 2: Verify the JSON files were created
-        print("\n2. Verifying JSON files were created...")
-        
-        if not os.path.exists("clusters.json"):
-            print("Error: clusters.json was not created")
-            sys.exit(1)
+        # Step 2: Verify the JSON file was created
+        print(f"\n2. Verifying {rawdata_path} was created...")
         
-        if not os.path.exists("articles.json"):
-            print("Error: articles.json was not created")
+        if not os.path.exists(rawdata_path):
+            print(f"Error: {rawdata_path} was not created")
             sys.exit(1)
         
-        print("Both JSON files found")
+        print(f"{rawdata_path} found")
         
-        # Step 3: Run transform_and_upload.py to upload data to database
-        print("\n3. Running transform_and_upload.py to upload data to database...")
+        # Step 3: Run transform_and_upload.py to write the data to the database
+        # directly; running API servers pick the new rows up from the change log
+        print("\n3. Running transform_and_upload.py to write data to database...")
         print("-"*50)
         
         result = subprocess.run(
-            [sys.executable, "transform_and_upload.py"],
+            [sys.executable, "transform_and_upload.py", "--direct"],
             capture_output=False,  # Show output in real-time
-            text=True
+            text=True,
+            env=env
         )
         
         if result.returncode != 0:
             print("\nError: transform_and_upload.py failed")
             sys.exit(1)
         
+        # Step 3b: place the new clusters in the topic tree (topics.py); the
+        # upload already succeeded, so a failure here only leaves them unplaced
+        print("\n3b. Running topics.py to assign new clusters to topics...")
+        result = subprocess.run([sys.executable, "topics.py"], capture_output=False, text=True, env=env)
+        if result.returncode != 0:
+            print("Warning: topics.py failed; new clusters have no topic until the next run")
+        
         print("-"*50)
         print("\nPipeline completed successfully!")
         print("   - Clusters and articles scraped")
         print("   - Data uploaded to database")
         
-        # Step 4: Clean up JSON files
-        print("\n4. Cleaning up temporary JSON files...")
-        try:
-            os.remove("clusters.json")
-            print("   Deleted clusters.json")
-        except Exception as e:
-            print(f"   Warning: Could not delete clusters.json: {e}")
-        
-        try:
-            os.remove("articles.json")
-            print("   Deleted articles.json")
-        except Exception as e:
-            print(f"   Warning: Could not delete articles.json: {e}")
-        
+        # Step 4: the run's directory, with its JSON file, is removed by main()
         print("\nAll done! Data is now in the database.")
         
     except FileNotFoundError as e:
@@ -0,0 +1,192 @@
+"""
+Request metrics for the Flask API, exposed in Prometheus text format.
+
+install(app, stats) adds before/after-request hooks that record, per route
+template (e.g. /api/articles/<int:article_id>):
+
+- request counts by method and status code
+- latency, response size, database time and JSON serialisation time histograms
+
+Database time comes from the store's QueryStats, which tracks the queries run
+by the current thread; serialisation time from a timed JSON provider. Setting
+SLOW_REQUEST_MS logs every request slower than that with its query string,
+timings and the individual queries it ran.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_serialization = threading.local()
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, as Prometheus expects."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def lines(self, name):
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f'{name}_bucket{_labels(labels, le=bound)} {cumulative}'
+            yield f"{name}_sum{_labels(labels)} {total:.6f}"
+            yield f"{name}_count{_labels(labels)} {cumulative}"
+
+
+def _labels(pairs, **extra):
+    items = list(pairs) + list(extra.items())
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that adds the time spent in dumps() to the current request."""
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            _serialization.seconds = getattr(_serialization, "seconds", 0.0) + time.perf_counter() - start
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.in_flight = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.serialization_time = Histogram(LATENCY_BUCKETS)
+
+    def observe(self, route, method, status, seconds, size, db_seconds, serialization_seconds):
+        labels = (("route", route), ("method", method))
+        with self._lock:
+            key = labels + (("status", str(status)),)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.observe(labels, seconds)
+            if size is not None:
+                self.response_bytes.observe(labels, size)
+            # None: not measured (the ASGI app has no per-request database or serialization time)
+            if db_seconds is not None:
+                self.db_time.observe(labels, db_seconds)
+            if serialization_seconds is not None:
+                self.serialization_time.observe(labels, serialization_seconds)
+
+    def render(self, query_stats=None, gauges=None):
+        """The Prometheus text exposition of everything recorded so far."""
+        out = []
+        with self._lock:
+            out.append("# TYPE noogie_http_requests_total counter")
+            out.extend(f"noogie_http_requests_total{_labels(k)} {v}" for k, v in sorted(self.requests.items()))
+            out.append("# TYPE noogie_http_requests_in_flight gauge")
+            out.append(f"noogie_http_requests_in_flight {self.in_flight}")
+            for name, histogram in (
+                ("noogie_http_request_duration_seconds", self.latency),
+                ("noogie_http_response_size_bytes", self.response_bytes),
+                ("noogie_http_db_duration_seconds", self.db_time),
+                ("noogie_http_serialization_duration_seconds", self.serialization_time),
+            ):
+                out.append(f"# TYPE {name} histogram")
+                out.extend(histogram.lines(name))
+
+        if query_stats is not None:
+            snapshot = query_stats.snapshot()
+            out.append("# TYPE noogie_db_query_duration_seconds summary")
+            for name, s in sorted(snapshot.items()):
+                out.append(f'noogie_db_query_duration_seconds_sum{{query="{name}"}} {s["total_ms"] / 1000:.6f}')
+                out.append(f'noogie_db_query_duration_seconds_count{{query="{name}"}} {s["count"]}')
+            out.append("# TYPE noogie_db_query_max_seconds gauge")
+            out.extend(f'noogie_db_query_max_seconds{{query="{name}"}} {s["max_ms"] / 1000:.6f}'
+                       for name, s in sorted(snapshot.items()))
+
+        typed = set()
+        for name, value in sorted((gauges or {}).items()):
+            # names may carry labels: metric{label="value"}
+            base = name.split("{", 1)[0]
+            if base not in typed:
+                typed.add(base)
+                out.append(f"# TYPE {base} {'counter' if base.endswith('_total') else 'gauge'}")
+            out.append(f"{name} {value}")
+        return "\n".join(out) + "\n"
+
+
+def install(app, stats, slow_ms=None):
+    """
+    Instrument a Flask app.
+
+    Args:
+        app: the Flask app
+        stats: the store's QueryStats, for per-request database time
+        slow_ms: log requests slower than this many milliseconds (default: SLOW_REQUEST_MS, off if unset)
+
+    Returns:
+        The RequestMetrics being recorded into
+    """
+    metrics = RequestMetrics()
+    if slow_ms is None and os.getenv("SLOW_REQUEST_MS"):
+        slow_ms = float(os.getenv("SLOW_REQUEST_MS"))
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        _serialization.seconds = 0.0
+        stats.begin_request()
+        with metrics._lock:
+            metrics.in_flight += 1
+
+    @app.after_request
+    def record(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        queries = stats.end_request()
+        db_seconds = sum(seconds for _, seconds in queries)
+        serialization_seconds = getattr(_serialization, "seconds", 0.0)
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        # streamed responses (server-sent events) have no size up front
+        size = None if response.is_streamed else response.calculate_content_length()
+        metrics.observe(route, request.method, response.status_code, elapsed, size, db_seconds, serialization_seconds)
+
+        if slow_ms is not None and elapsed * 1000 >= slow_ms:
+            app.logger.warning("slow request %s", json.dumps({
+                "route": route,
+                "method": request.method,
+                "path": request.full_path.rstrip("?"),
+                "status": response.status_code,
+                "total_ms": round(elapsed * 1000, 2),
+                "db_ms": round(db_seconds * 1000, 2),
+                "serialization_ms": round(serialization_seconds * 1000, 2),
+                "queries": [{"name": name, "ms": round(seconds * 1000, 2)} for name, seconds in queries],
+            }))
+        return response
+
+    @app.teardown_request
+    def finish(exc):
+        # runs even when a view raised and after_request was skipped
+        stats.end_request()
+        with metrics._lock:
+            metrics.in_flight -= 1
+
+    return metrics
@@ -0,0 +1,105 @@
+"""
+Query-string parsing shared by the Flask (server.py) and ASGI (asgi.py) apps.
+
+Both frameworks' query-parameter objects support .get(), which is all that is
+used here.
+"""
+from datetime import datetime
+
+from db import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+
+def parse_limit(args, default, maximum):
+    """limit= as a positive integer, capped at maximum."""
+    try:
+        limit = int(args.get("limit", default))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, maximum)
+
+
+def parse_page_args(args, key, allowed_fields):
+    """
+    Read the shared list-endpoint query parameters.
+
+    Args:
+        args: request.args
+        key: primary key column used as the keyset cursor
+        allowed_fields: columns that may be requested with fields=
+
+    Returns:
+        Tuple of (select clause, limit, cursor)
+
+    Raises:
+        ValueError: if a parameter is malformed
+    """
+    limit = parse_limit(args, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+    cursor = args.get("cursor")
+    if cursor is not None:
+        try:
+            cursor = int(cursor)
+        except ValueError:
+            raise ValueError("cursor must be an integer")
+
+    fields = args.get("fields")
+    if fields:
+        columns = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [c for c in columns if c not in allowed_fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        # the cursor column is always returned so the next page can be requested
+        if key not in columns:
+            columns.insert(0, key)
+        select = ", ".join(columns)
+    else:
+        select = "*"
+
+    return select, limit, cursor
+
+
+def parse_ids(args):
+    """Parse an optional ids=1,2,3 batch lookup parameter."""
+    ids = args.get("ids")
+    if not ids:
+        return None
+    try:
+        return [int(i) for i in ids.split(",") if i.strip()][:MAX_PAGE_SIZE]
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of integers")
+
+
+def parse_time_range(args):
+    """
+    Read the optional since= / until= created_at bounds.
+
+    Returns:
+        Tuple of (since, until), each an ISO date / timestamp string or None
+
+    Raises:
+        ValueError: if either is not an ISO date or timestamp
+    """
+    bounds = []
+    for name in ("since", "until"):
+        value = args.get(name) or None
+        if value is not None:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"{name} must be an ISO date or timestamp")
+        bounds.append(value)
+    return tuple(bounds)
+
+
+def article_route_class(args):
+    """
+    Admission class of an /api/articles request (see admission.py): only lists
+    that return article text are "expensive"; fields= without text is "cheap".
+    """
+    fields = args.get("fields")
+    if not fields:
+        # every column, text included
+        return "expensive"
+    return "expensive" if "text" in [f.strip() for f in fields.split(",")] else "cheap"
@@ -0,0 +1,249 @@
+"""
+Building blocks shared by the single-process pipeline (app.py) and the
+queue-based one (worker.py and coordinator.py): the source lists, bounded
+downloads, OpenAI summaries and the clustering step.
+"""
+import multiprocessing
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import feedparser
+import numpy as np
+import requests
+from newspaper import Config
+from openai import OpenAI, APITimeoutError
+from sklearn.cluster import AgglomerativeClustering
+
+from budget import REQUEST_TIMEOUT
+
+RSS_FEEDS = {
+    "CNN": "http://rss.cnn.com/rss/cnn_latest.rss",
+    "Guardian": "https://www.theguardian.com/world/rss",
+    "NYPost": "https://nypost.com/feed/",
+    "BBC": "http://feeds.bbci.co.uk/news/world/rss.xml",
+    "Politico": "https://rss.politico.com/politics-news.xml",
+    "Politico - Congress": "https://rss.politico.com/congress.xml",
+    "AlJazeera": "https://www.aljazeera.com/xml/rss/all.xml",
+    "Fox": "https://feeds.foxnews.com/foxnews/latest",
+    "CBS": "https://www.cbsnews.com/latest/rss/main",
+    "ABC": "https://abcnews.go.com/abcnews/topstories"
+}
+
+NEWSPAPER_SOURCES = {
+    "CNN": "https://www.cnn.com",
+    "Guardian": "https://www.theguardian.com",
+    "NYT": "https://www.nytimes.com",
+    "NYPost": "https://nypost.com",
+}
+
+CUTOFF_HOURS = 72
+# articles with less text than this are dropped (RSS / newspaper pages)
+MIN_RSS_TEXT = 120
+MIN_PAGE_TEXT = 100
+
+# average-linkage distance below which articles are the same story
+CLUSTER_THRESHOLD = 1.2
+# summaries per encode call, so the encode step can stop at its deadline
+ENCODE_BATCH = 256
+
+USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/122.0 Safari/537.36"
+)
+
+
+def cutoff():
+    return datetime.now(timezone.utc) - timedelta(hours=CUTOFF_HOURS)
+
+
+def newspaper_config():
+    config = Config()
+    config.memoize_articles = False
+    config.request_timeout = REQUEST_TIMEOUT
+    config.browser_user_agent = USER_AGENT
+    return config
+
+
+def create_session():
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+def openai_client():
+    # a slow API period is bounded by the per-call timeouts below, not by retries
+    return OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=1)
+
+
+def download_html(session, url, deadline):
+    """One bounded GET, instead of newspaper's own download handling."""
+    r = session.get(url, timeout=deadline.timeout())
+    r.raise_for_status()
+    return r.text
+
+
+def feed_links(session, url, deadline, since):
+    """Links of a feed's entries published since `since`, fetched within deadline."""
+    r = session.get(url, timeout=deadline.timeout())
+    r.raise_for_status()
+    links = []
+    for e in feedparser.parse(r.content).entries:
+        pub = e.get("published_parsed") or e.get("updated_parsed")
+        if not pub:
+            continue
+        if datetime(*pub[:6], tzinfo=timezone.utc) < since:
+            continue
+        links.append(e.link)
+    return links
+
+
+def lead(text, sentences=3):
+    """The first few sentences, used when there is no time left for a model summary."""
+    parts = text.strip().replace("\n", " ").split(". ")
+    return ". ".join(parts[:sentences]).strip()[:600]
+
+
+def generate_summary(client, text, prompt_type="article", deadline=None):
+    if not text or len(text.strip()) < 100:
+        return "Not enough content to summarize."
+    if deadline is not None and deadline.expired():
+        return lead(text)
+
+    if prompt_type == "article":
+        system_prompt = "You are a helpful assistant that summarizes news articles concisely."
+        user_prompt = f"Summarize the following news article in 2-3 concise sentences:\n\n{text}"
+    else:  # cluster
+        system_prompt = "You are a helpful assistant that synthesizes multiple summaries into a coherent overview."
+        user_prompt = f"Synthesize the following summaries into 3-4 concise sentences:\n\n{text}"
+
+    try:
+        resp = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=0.5,
+            max_tokens=200,
+            timeout=deadline.timeout(60) if deadline is not None else 60,
+        )
+        return resp.choices[0].message.content.strip()
+    except APITimeoutError:
+        return lead(text)
+    except Exception as e:
+        return f"OpenAI summary error: {e}"
+
+
+def summarize_and_name_cluster(client, summaries, deadline):
+    """
+    Generate cluster summary and a meaningful cluster name from it.
+
+    Returns:
+        Tuple of (summary, name)
+    """
+    summary = generate_summary(client, " ".join(summaries), prompt_type="cluster", deadline=deadline)
+
+    # Generate a concise cluster name using OpenAI
+    name_prompt = f"Create a short, descriptive title (3-5 words) for the following news summary:\n\n{summary}"
+    try:
+        if deadline.expired():
+            raise TimeoutError("run budget spent")
+        resp = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant that creates concise titles."},
+                {"role": "user", "content": name_prompt},
+            ],
+            temperature=0.3,
+            max_tokens=20,
+            timeout=deadline.timeout(30),
+        )
+        cluster_name = resp.choices[0].message.content.strip()
+    except Exception:
+        cluster_name = " ".join(summary.split()[:5])  # fallback: first 5 words
+
+    return summary, cluster_name
+
+
+def encode_within(model, texts, deadline, batch_size=ENCODE_BATCH):
+    """
+    Encode texts in batches until the deadline passes.
+
+    Returns:
+        float32 array with one row for each of the first texts, fewer rows than texts if time ran out
+    """
+    parts = []
+    for start in range(0, len(texts), batch_size):
+        if deadline.expired():
+            break
+        parts.append(np.asarray(model.encode(texts[start:start + batch_size]), dtype=np.float32))
+    if not parts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return np.concatenate(parts)
+
+
+def _agglomerative_labels(vectors):
+    return AgglomerativeClustering(
+        n_clusters=None,
+        distance_threshold=CLUSTER_THRESHOLD,
+        linkage="average"
+    ).fit(vectors).labels_
+
+
+def leader_labels(vectors, threshold=CLUSTER_THRESHOLD):
+    """One pass: join the nearest cluster leader within threshold, else lead a new cluster."""
+    leaders = np.empty_like(vectors)
+    count = 0
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for i, vector in enumerate(vectors):
+        if count:
+            distances = ((leaders[:count] - vector) ** 2).sum(axis=1)
+            nearest = int(distances.argmin())
+            if distances[nearest] <= threshold ** 2:
+                labels[i] = nearest
+                continue
+        leaders[count] = vector
+        labels[i] = count
+        count += 1
+    return labels
+
+
+def cluster_labels(vectors, deadline=None):
+    """
+    Agglomerative cluster labels for vectors.
+
+    Average linkage is quadratic in the articles, so with a deadline it runs in a
+    child process that is stopped when the deadline passes, and the linear
+    leader_labels() clustering is used instead.
+    """
+    if deadline is None:
+        return _agglomerative_labels(vectors)
+    if not deadline.expired():
+        # forked: a spawned child would re-import app.py, which runs the pipeline on import
+        with multiprocessing.get_context("fork").Pool(1) as pool:
+            pending = pool.apply_async(_agglomerative_labels, (vectors,))
+            try:
+                return pending.get(timeout=deadline.remaining())
+            except multiprocessing.TimeoutError:
+                pass
+    print(f"[!] Clustering budget spent, grouping {len(vectors)} articles by nearest leader instead")
+    return leader_labels(vectors)
+
+
+def cluster_records(records, deadline=None):
+    """
+    Cluster an ArticleStore on its embeddings.
+
+    Args:
+        records: ArticleStore with embeddings
+        deadline: optional Deadline for the clustering; see cluster_labels
+
+    Returns:
+        List of article id lists, one article per source each
+    """
+    members = defaultdict(list)
+    for article_id, label in enumerate(cluster_labels(records.embeddings, deadline)):
+        members[label].append(article_id)
+    return [records.first_per_source(ids) for ids in members.values()]
@@ -0,0 +1,263 @@
+"""
+Compact in-memory article records for the pipeline (app.py).
+
+app.py used to carry every article through several containers at once: a list
+of texts, a dict of details keyed by (source, title, url) tuples, a list of
+per-article dicts and finally the cluster dicts written to rawdata.json, with
+each embedding as a list of 384 Python floats. ArticleStore keeps one copy of
+everything in columns instead:
+
+- an article is an integer id, its position in the store
+- title, url, text and summary are one list each, indexed by id
+- source names are interned to small integer codes in an array('H')
+- embeddings are one float32 matrix, row per id, set once after encoding
+
+Every stage passes ids around and reads fields on demand; the per-article
+dicts in rawdata.json's shape are only built one at a time while the file is
+written (write_rawdata). Downloaded pages are parsed as they arrive and only
+their text is stored, so the HTML of a stage's pages is never held at once.
+
+    python records.py --bench 10000   # peak RSS of the old and the new data flow
+"""
+import json
+import os
+import random
+import sys
+from array import array
+
+import numpy as np
+
+# where a run's output goes; main.py points each run at a temporary file
+RAWDATA_PATH = os.getenv("RAWDATA_PATH", "rawdata.json")
+
+
+class ArticleStore:
+    __slots__ = ("titles", "urls", "texts", "summaries", "source_codes", "source_names", "_codes", "embeddings")
+
+    def __init__(self):
+        self.titles = []
+        self.urls = []
+        self.texts = []
+        self.summaries = []
+        self.source_codes = array('H')
+        self.source_names = []
+        self._codes = {}
+        self.embeddings = None
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, source, title, url, text, summary=None):
+        """
+        Append an article.
+
+        Returns:
+            Its id
+        """
+        code = self._codes.get(source)
+        if code is None:
+            code = self._codes[source] = len(self.source_names)
+            self.source_names.append(source)
+        self.source_codes.append(code)
+        self.titles.append(title)
+        self.urls.append(url)
+        self.texts.append(text)
+        self.summaries.append(summary)
+        return len(self.titles) - 1
+
+    def source(self, article_id):
+        return self.source_names[self.source_codes[article_id]]
+
+    def set_embeddings(self, vectors):
+        """Store one embedding row per article, in id order, as float32."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) != len(self):
+            raise ValueError(f"Expected {len(self)} embeddings, got {len(vectors)}")
+        self.embeddings = vectors
+
+    def truncate(self, count):
+        """Drop every article from id count on."""
+        for column in (self.titles, self.urls, self.texts, self.summaries, self.source_codes):
+            del column[count:]
+        if self.embeddings is not None:
+            self.embeddings = self.embeddings[:count]
+
+    def first_per_source(self, article_ids):
+        """The first article of each source among article_ids, in order."""
+        seen = set()
+        kept = []
+        for article_id in article_ids:
+            code = self.source_codes[article_id]
+            if code not in seen:
+                seen.add(code)
+                kept.append(article_id)
+        return kept
+
+    def to_dict(self, article_id):
+        """An article in rawdata.json's shape (embedding rounded to 6 decimals)."""
+        article = {
+            "title": self.titles[article_id],
+            "article_summary": self.summaries[article_id],
+            "source": self.source(article_id),
+            "url": self.urls[article_id],
+            "text": self.texts[article_id],
+        }
+        if self.embeddings is not None:
+            article["embedding"] = [round(float(x), 6) for x in self.embeddings[article_id]]
+        return article
+
+
+def write_rawdata(path, store, clusters):
+    """
+    Write clusters to rawdata.json one article at a time.
+
+    Args:
+        path: output file
+        store: ArticleStore
+        clusters: list of (cluster_name, cluster_summary, article_ids)
+    """
+    with open(path, "w") as f:
+        f.write("{")
+        for i, (name, summary, article_ids) in enumerate(clusters, 1):
+            f.write(",\n" if i > 1 else "\n")
+            f.write(f'    {json.dumps(str(i))}: {{\n'
+                    f'        "cluster_name": {json.dumps(name)},\n'
+                    f'        "cluster_summary": {json.dumps(summary)},\n'
+                    f'        "articles": [')
+            for j, article_id in enumerate(article_ids):
+                f.write(",\n" if j else "\n")
+                f.write("            " + json.dumps(store.to_dict(article_id)))
+            f.write("\n        ]\n    }")
+        f.write("\n}\n")
+
+
+# --- benchmark ---
+
+# a news page is mostly markup around the article text
+PAGE_BYTES = 150_000
+
+def _synthetic(n, seed=0):
+    """(source, title, url, text, summary) tuples shaped like the pipeline's."""
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(5000)]
+    sources = ["CNN", "Guardian", "NYPost", "BBC", "Politico", "AlJazeera", "Fox", "CBS", "ABC", "NYT"]
+    for i in range(n):
+        text = " ".join(rng.choices(words, k=900))
+        summary = " ".join(rng.choices(words, k=50))
+        source = sources[i % len(sources)]
+        yield source, f"Headline {i} {words[i % 5000]}", f"https://example.com/{source}/{i}", text, summary
+
+
+def _page(text, size=PAGE_BYTES):
+    """The HTML a page of text is downloaded as."""
+    markup = '<div class="nav"><a href="/">Home</a></div>\n'
+    return "<html><body>" + markup * max(0, (size - len(text)) // len(markup)) + f"<p>{text}</p></body></html>"
+
+
+def _cluster_labels(n, seed=0):
+    return np.random.default_rng(seed).integers(0, max(1, n // 3), n)
+
+
+def _legacy_flow(n, path):
+    """The data structures app.py built before ArticleStore, minus network and model calls."""
+    from collections import defaultdict
+
+    # every downloaded page stayed referenced (by its newspaper Article) until the stage ended
+    pages = [(item, _page(item[3])) for item in _synthetic(n)]
+
+    articles, article_info, article_details = [], [], {}
+    for (source, title, url, text, summary), _ in pages:
+        ident = (source, title, url)
+        articles.append(text)
+        article_info.append(ident)
+        article_details[ident] = {"text": text, "summary": summary}
+
+    del pages
+
+    structured_articles = []
+    for ident in article_info:
+        info = article_details[ident]
+        structured_articles.append({"title": ident[1], "article_summary": info["summary"],
+                                    "source": ident[0], "url": ident[2], "text": info["text"]})
+    embs = np.random.default_rng(1).standard_normal((n, 384)).astype(np.float32)
+    for art, emb in zip(structured_articles, embs):
+        art["embedding"] = [round(float(x), 6) for x in emb]
+
+    clusters = defaultdict(list)
+    for art, label in zip(structured_articles, _cluster_labels(n)):
+        clusters[label].append(art)
+    unique_by_source = {}
+    for cid, arts in clusters.items():
+        keep = {}
+        for a in arts:
+            if a["source"] not in keep:
+                keep[a["source"]] = a
+        unique_by_source[cid] = list(keep.values())
+
+    output = {str(i): {"cluster_name": f"Cluster {i}", "cluster_summary": "summary", "articles": arts}
+              for i, arts in enumerate(unique_by_source.values(), 1)}
+    with open(path, "w") as f:
+        json.dump(output, f, indent=4)
+
+
+def _compact_flow(n, path):
+    """The same flow on an ArticleStore."""
+    from collections import defaultdict
+
+    store = ArticleStore()
+    for source, title, url, text, summary in _synthetic(n):
+        # parsed as it arrives; only the text is kept
+        html = _page(text)
+        store.add(source, title, url, text, summary)
+        del html
+    store.set_embeddings(np.random.default_rng(1).standard_normal((n, 384)).astype(np.float32))
+
+    members = defaultdict(list)
+    for article_id, label in enumerate(_cluster_labels(n)):
+        members[label].append(article_id)
+    clusters = [(f"Cluster {i}", "summary", store.first_per_source(ids))
+                for i, ids in enumerate(members.values(), 1)]
+    write_rawdata(path, store, clusters)
+
+
+def _peak_rss_mb():
+    import resource
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def bench(n):
+    """Run both flows in fresh interpreters and print their peak RSS."""
+    import os
+    import subprocess
+    import tempfile
+
+    results = {}
+    for flow in ("legacy", "compact"):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = subprocess.run([sys.executable, __file__, "--run", flow, str(n), os.path.join(tmp, "rawdata.json")],
+                                 capture_output=True, text=True, check=True)
+            results[flow] = json.loads(out.stdout.strip().splitlines()[-1])
+    for flow, r in results.items():
+        print(f"{flow:<8} {n} articles: peak RSS {r['peak_mb']:.0f} MB ({r['baseline_mb']:.0f} MB before), "
+              f"{r['seconds']:.1f}s")
+    legacy = results["legacy"]["peak_mb"] - results["legacy"]["baseline_mb"]
+    compact = results["compact"]["peak_mb"] - results["compact"]["baseline_mb"]
+    print(f"Pipeline data: {legacy:.0f} MB -> {compact:.0f} MB ({1 - compact / legacy:.0%} less)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--run":
+        import time
+        flow, n, path = sys.argv[2], int(sys.argv[3]), sys.argv[4]
+        baseline = _peak_rss_mb()
+        start = time.perf_counter()
+        (_legacy_flow if flow == "legacy" else _compact_flow)(n, path)
+        print(json.dumps({"peak_mb": _peak_rss_mb(), "baseline_mb": baseline,
+                          "seconds": time.perf_counter() - start}))
+    elif len(sys.argv) == 3 and sys.argv[1] == "--bench":
+        bench(int(sys.argv[2]))
+    else:
+        print("usage: python records.py --bench <articles>")
+        sys.exit(1)
@@ -0,0 +1,194 @@
+"""
+In-memory full-text search over articles.
+
+An inverted index maps every term of an article's title, summary and text to
+a postings list of (document, term frequency). Postings are stored as compact
+typed arrays (array('I') / array('H')) instead of Python lists of tuples, and
+are scored with BM25 in a few NumPy operations per query term, so a query never
+touches the articles table.
+
+The index is built once from the database and then kept current by adding the
+articles created by each upload. The last query term also matches as a prefix
+("trum" finds "trump"), so the endpoint works for search-as-you-type.
+"""
+import bisect
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# BM25 parameters (the usual Lucene defaults)
+K1 = 1.2
+B = 0.75
+# a term in the title counts as much as three in the body
+FIELD_WEIGHTS = {"title": 3, "article_summary": 2, "text": 1}
+# cap on the vocabulary terms a prefix expands to
+MAX_PREFIX_TERMS = 64
+# prefix completions score lower than the exact term
+PREFIX_WEIGHT = 0.5
+
+INDEX_FIELDS = "article_id, cluster_id, title, article_summary, text, source"
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his in is it its of on or "
+    "she that the their they this to was were will with".split()
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # term -> (doc numbers, term frequencies); doc numbers are positions in the arrays below
+        self._postings = {}
+        self._terms = []
+        self._terms_dirty = False
+        self._article_ids = array("q")
+        self._cluster_ids = array("q")
+        self._lengths = array("I")
+        self._total_length = 0
+        # per-document BM25 length normalisation, recomputed after adds
+        self._norm = None
+        self._titles = []
+        self._sources = array("H")
+        self._source_names = []
+        self._source_index = {}
+        self._indexed = set()
+
+    def __len__(self):
+        return len(self._article_ids)
+
+    def add_articles(self, articles):
+        """
+        Index articles (rows with article_id and the INDEX_FIELDS columns).
+
+        Articles that are already indexed are skipped, so it is safe to pass
+        every row an upload returned.
+
+        Returns:
+            Number of newly indexed articles
+        """
+        added = 0
+        with self._lock:
+            for article in articles:
+                article_id = article.get("article_id")
+                if article_id is None or article_id in self._indexed:
+                    continue
+                self._add(article)
+                added += 1
+        return added
+
+    def _add(self, article):
+        doc = len(self._article_ids)
+        counts = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            terms = Counter(tokenize(article.get(field)))
+            if weight != 1:
+                terms = {term: tf * weight for term, tf in terms.items()}
+            counts.update(terms)
+
+        postings_of = self._postings
+        for term, tf in counts.items():
+            postings = postings_of.get(term)
+            if postings is None:
+                postings = postings_of[term] = (array("I"), array("H"))
+                self._terms_dirty = True
+            postings[0].append(doc)
+            postings[1].append(tf if tf < 0xFFFF else 0xFFFF)
+
+        length = sum(counts.values())
+        source = article.get("source") or ""
+        if source not in self._source_index:
+            self._source_index[source] = len(self._source_names)
+            self._source_names.append(source)
+
+        self._article_ids.append(article["article_id"])
+        self._cluster_ids.append(article.get("cluster_id") or 0)
+        self._lengths.append(length)
+        self._total_length += length
+        self._norm = None
+        self._titles.append(article.get("title") or "")
+        self._sources.append(self._source_index[source])
+        self._indexed.add(article["article_id"])
+
+    def _expand(self, prefix):
+        """Vocabulary terms starting with prefix, from the sorted term list."""
+        if self._terms_dirty:
+            self._terms = sorted(self._postings)
+            self._terms_dirty = False
+        start = bisect.bisect_left(self._terms, prefix)
+        matches = []
+        for term in self._terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query, limit=20, prefix=True):
+        """
+        BM25-ranked articles for a free-text query.
+
+        Args:
+            query: search text; terms are OR-ed, documents matching more terms rank higher
+            limit: maximum number of results
+            prefix: also match vocabulary terms that start with the last query term
+
+        Returns:
+            Tuple of (results, total matches); results are dicts with
+            article_id, cluster_id, title, source and score, best first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0
+
+        with self._lock:
+            n = len(self._article_ids)
+            if n == 0:
+                return [], 0
+
+            weighted = [(term, 1.0) for term in terms]
+            completions = self._expand(terms[-1]) if prefix else []
+            if completions:
+                weighted[-1:] = [(term, 1.0 if term == terms[-1] else PREFIX_WEIGHT)
+                                 for term in completions if term not in terms[:-1]]
+
+            scores = self._score(weighted, n)
+            hits = np.nonzero(scores)[0]
+            total = len(hits)
+            if total > limit:
+                hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+            hits = hits[np.argsort(-scores[hits], kind="stable")]
+
+            results = [{
+                "article_id": self._article_ids[i],
+                "cluster_id": self._cluster_ids[i] or None,
+                "title": self._titles[i],
+                "source": self._source_names[self._sources[i]] or None,
+                "score": round(float(scores[i]), 4),
+            } for i in hits.tolist()]
+        return results, total
+
+    def _score(self, weighted_terms, n):
+        """BM25 score per document (0 for documents matching no term)."""
+        if self._norm is None or len(self._norm) != n:
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            self._norm = (K1 * (1 - B + B * lengths / (self._total_length / n))).astype(np.float32)
+            del lengths
+        scores = np.zeros(n, dtype=np.float32)
+        for term, weight in weighted_terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            # zero-copy views; they must not outlive the lock (arrays cannot grow while viewed)
+            docs = np.frombuffer(postings[0], dtype=np.uint32)
+            tf = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+            idf = weight * np.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (K1 + 1) / (tf + self._norm[docs])
+        return scores
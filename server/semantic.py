@@ -0,0 +1,180 @@
+"""
+Semantic search and related articles over the pipeline's MiniLM embeddings.
+
+app.py stores one embedding per article (of its summary, the same text it
+clusters on) in the article_embeddings table. The server loads them into a
+FAISS HNSW graph, which answers k-nearest-neighbour queries in well under a
+millisecond on hundreds of thousands of vectors, and adds the embeddings of
+newly uploaded articles as they arrive. Vectors are L2-normalised, so inner
+product is cosine similarity.
+
+Queries are encoded with the same model the pipeline used. The model is only
+loaded on the first semantic query, so plain API use does not pay for it.
+
+    python semantic.py --backfill   # embed articles stored before embeddings were persisted
+"""
+import threading
+from functools import lru_cache
+
+import faiss
+import numpy as np
+
+from ingest import EMBEDDING_DIM
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# HNSW graph degree and search breadth; efSearch trades recall for latency
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+
+EMBEDDING_FIELDS = "article_id, embedding, articles(cluster_id, title, source)"
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                # imported here: loading torch is only worth it once a query needs encoding
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(EMBEDDING_MODEL)
+    return _model
+
+
+@lru_cache(maxsize=1024)
+def encode_query(text):
+    return get_model().encode([text])[0].astype(np.float32)
+
+
+def embedding_rows(rows):
+    """Flatten fetch_all(EMBEDDING_FIELDS) rows into SemanticIndex.add_articles() input."""
+    return [dict(row.get('articles') or {}, article_id=row['article_id'], embedding=row['embedding'])
+            for row in rows]
+
+
+class SemanticIndex:
+    def __init__(self, dim=EMBEDDING_DIM):
+        self._lock = threading.Lock()
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+        # IDMap2 keys vectors by article_id and can hand a stored vector back for /related
+        self._index = faiss.IndexIDMap2(hnsw)
+        # article_id -> (cluster_id, title, source)
+        self._meta = {}
+
+    def __len__(self):
+        return len(self._meta)
+
+    def add_articles(self, articles):
+        """
+        Index articles that carry an "embedding"; others (and already
+        indexed ones) are skipped.
+
+        Returns:
+            Number of newly indexed articles
+        """
+        with self._lock:
+            new = [a for a in articles
+                   if a.get('embedding') is not None and a.get('article_id') not in self._meta]
+            if not new:
+                return 0
+            vectors = np.array([a['embedding'] for a in new], dtype=np.float32)
+            faiss.normalize_L2(vectors)
+            self._index.add_with_ids(vectors, np.array([a['article_id'] for a in new], dtype=np.int64))
+            for a in new:
+                self._meta[a['article_id']] = (a.get('cluster_id'), a.get('title'), a.get('source'))
+            return len(new)
+
+    def search(self, vector, k=10, exclude_id=None, exclude_cluster=None):
+        """
+        Nearest articles to a vector.
+
+        Args:
+            vector: query embedding (need not be normalised)
+            k: number of results
+            exclude_id: article to leave out (the query article itself)
+            exclude_cluster: leave out this cluster's articles
+
+        Returns:
+            List of dicts with article_id, cluster_id, title, source and score (cosine similarity)
+        """
+        query = np.array([vector], dtype=np.float32)
+        faiss.normalize_L2(query)
+        with self._lock:
+            if not self._meta:
+                return []
+            # over-fetch so that filtering still leaves k results, and widen the
+            # search while it does not (a large cluster, or many near-duplicates)
+            fetch = min(len(self._meta), k * 4 + 1 if exclude_cluster is not None else k + 1)
+            while True:
+                # the candidate list must be at least as long as the results for HNSW to find them all
+                params = faiss.SearchParametersHNSW(efSearch=max(HNSW_EF_SEARCH, fetch))
+                scores, ids = self._index.search(query, fetch, params=params)
+                results = []
+                for score, article_id in zip(scores[0].tolist(), ids[0].tolist()):
+                    if article_id == -1 or article_id == exclude_id:
+                        continue
+                    cluster_id, title, source = self._meta[article_id]
+                    if exclude_cluster is not None and cluster_id == exclude_cluster:
+                        continue
+                    results.append({
+                        "article_id": article_id,
+                        "cluster_id": cluster_id,
+                        "title": title,
+                        "source": source,
+                        "score": round(score, 4),
+                    })
+                    if len(results) == k:
+                        break
+                if len(results) == k or fetch >= len(self._meta):
+                    break
+                fetch = min(len(self._meta), fetch * 2)
+        return results
+
+    def related(self, article_id, k=10, same_cluster=False):
+        """
+        Nearest neighbours of a stored article, by default from other clusters.
+
+        Returns:
+            List as for search(), or None if the article has no embedding
+        """
+        with self._lock:
+            if article_id not in self._meta:
+                return None
+            vector = self._index.reconstruct(article_id)
+            cluster_id = self._meta[article_id][0]
+        return self.search(vector, k, exclude_id=article_id,
+                           exclude_cluster=None if same_cluster else cluster_id)
+
+
+def backfill_embeddings(store, batch_size=256):
+    """
+    Embed and store articles that have no row in article_embeddings yet.
+
+    Returns:
+        Number of articles embedded
+    """
+    done = {row['article_id'] for row in store.fetch_all('article_embeddings', "article_id", 'article_id')}
+    articles = [a for a in store.fetch_all('articles', "article_id, article_summary, text", 'article_id')
+                if a['article_id'] not in done]
+    model = get_model()
+    for i in range(0, len(articles), batch_size):
+        batch = articles[i:i + batch_size]
+        vectors = model.encode([a.get('article_summary') or a.get('text') or "" for a in batch])
+        store.save_embeddings({a['article_id']: v.tolist() for a, v in zip(batch, vectors)})
+    return len(articles)
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+    from db import create_store
+
+    if "--backfill" not in sys.argv:
+        print("usage: python semantic.py --backfill")
+        sys.exit(1)
+    load_dotenv()
+    print(f"Embedded {backfill_embeddings(create_store())} articles")
@@ -1,8 +1,23 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, make_response, stream_with_context
 from flask_cors import CORS
-from supabase import create_client, Client
+from werkzeug.http import http_date
+from functools import wraps
 import os
 from dotenv import load_dotenv
+from cache import ResponseCache, cache_key, not_modified
+from db import create_store, NotFound, CLUSTER_FIELDS, ARTICLE_FIELDS, TOPIC_FIELDS, TOPIC_SELECT
+from params import article_route_class, parse_page_args, parse_ids, parse_limit, parse_time_range
+from ingest import (ValidationError, clean_articles, clean_batch, clean_bulk, iter_ndjson_batches,
+                    read_spool, spool_batches, summarize, write_batches, write_stream)
+from graph import build_graph, CLUSTER_GRAPH_FIELDS, ARTICLE_GRAPH_FIELDS
+from layout import layout_graph, load_positions, save_positions
+from search import SearchIndex, INDEX_FIELDS
+from snapshot import Snapshot
+from changes import ChangeFeed, changed_ids
+from semantic import SemanticIndex, EMBEDDING_FIELDS, embedding_rows, encode_query
+import metrics
+from admission import Admission
+import threading
 load_dotenv()
 
 
@@ -10,9 +25,86 @@ app = Flask(__name__)
 # allow cross-origin requests from the front-end dev server
 CORS(app)
 
-url: str = os.getenv("SUPABASE_URL")
-key: str = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+# shared data-access layer (Supabase or SQLite, see STORAGE_BACKEND in db.py)
+store = create_store()
+
+# per-route latency / size / status / DB-time metrics, served at /metrics;
+# SLOW_REQUEST_MS turns on the slow-request log (see metrics.py)
+request_metrics = metrics.install(app, store.stats)
+
+# per-client rate limits and concurrency gates by route class; see admission.py.
+# Cheap: id lookups and summary lists. Expensive: full-text lists, search and
+# the graph. Streams are rate limited but take no slot (they are held open).
+admission = Admission.from_env()
+
+# versioned log of what each upload changed; see changes.py
+feed = ChangeFeed(store)
+
+# Reads are cached until the next write; see cache.py
+cache = ResponseCache(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024")),
+    redis_url=os.getenv("REDIS_URL"),
+)
+
+
+def cached(view):
+    """Serve a GET view from the response cache, with ETag/Last-Modified revalidation."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = cache.version
+        key = cache_key(request.path, request.args.items(multi=True))
+        etag = cache.etag(key, version)
+        last_modified = int(cache.last_modified)
+
+        if not_modified(etag, last_modified,
+                        request.headers.get("If-None-Match"),
+                        request.headers.get("If-Modified-Since")):
+            response = make_response("", 304)
+        else:
+            entry = cache.get(key, version)
+            if entry is not None:
+                response = make_response(entry[0], 200)
+                response.mimetype = entry[1]
+                response.headers["X-Cache"] = "HIT"
+            else:
+                response = make_response(view(*args, **kwargs))
+                if g.get("stale_snapshot"):
+                    response.headers["Cache-Control"] = "no-store"
+                # no-store: a stand-in answer (e.g. the previous graph) that must not be cached or revalidated
+                if response.status_code != 200 or response.cache_control.no_store:
+                    return response
+                cache.set(key, version, response.get_data(), response.mimetype)
+                response.headers["X-Cache"] = "MISS"
+
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = http_date(last_modified)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return wrapper
+
+
+def invalidates_cache(view):
+    """
+    Bump the dataset version after a write endpoint creates rows (201), or
+    fails part way (500, it may have written some). Validation errors and
+    uploads that only found existing rows leave the cache alone.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            cache.bump_version()
+            raise
+        if response.status_code == 201:
+            cache.bump_version()
+            # load the new snapshot and lay out the new graph now rather than on the next reader's request
+            data_refresh.schedule()
+            graph_refresh.schedule()
+        elif response.status_code >= 500:
+            cache.bump_version()
+        return response
+    return wrapper
 
 
 @app.route("/server", methods=["GET"])
@@ -23,48 +115,525 @@ def home():
 @app.route("/health", methods=["GET"])
 def health():
     try:
-        response = "hello"
+        store.ping()
         return jsonify({"status": "ok", "supabase_connected": True}), 200
     except Exception as e:
-        return jsonify({"status": "error", "supabase_connected": False, "error": str(e)}), 500
+        return jsonify({"status": "error", "supabase_connected": False, "error": str(e)}), 503
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Request and query metrics in Prometheus text format."""
+    snapshot = _data_snapshot[1]
+    gauges = {
+        "noogie_cache_version": cache.version,
+        "noogie_snapshot_articles": len(snapshot) if snapshot is not None else 0,
+        **admission.gauges(),
+    }
+    body = request_metrics.render(store.stats, gauges)
+    return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+class BackgroundRefresh:
+    """
+    Runs build() in one background thread at a time. schedule() while it runs
+    queues at most one more run, so a burst of writes costs two builds.
+    """
+
+    def __init__(self, build, name):
+        self._build = build
+        self._name = name
+        self._cond = threading.Condition()
+        self._running = False
+        self._pending = False
+
+    def schedule(self):
+        """Start a background build, or queue one behind the running build."""
+        with self._cond:
+            if self._running:
+                self._pending = True
+                return
+            self._running = True
+        threading.Thread(target=self._run, name=self._name, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self._build()
+            except Exception as e:
+                app.logger.warning("%s failed: %s", self._name, e)
+            with self._cond:
+                self._cond.notify_all()
+                if not self._pending:
+                    self._running = False
+                    return
+                self._pending = False
+
+    def wait_for(self, predicate):
+        """Block until predicate() holds, or until no build is running or queued."""
+        with self._cond:
+            self._cond.wait_for(lambda: predicate() or not self._running)
+
+
+# (version, Snapshot) of clusters and articles without text. Loading one reads
+# every row, so after a write it is loaded in a background thread while readers
+# keep getting the previous snapshot, then swapped in whole; see snapshot.py
+_data_snapshot = (None, None)
+
+
+def build_data_snapshot():
+    """Load a snapshot of the current data and swap it in (only ever run by the refresh thread)."""
+    global _data_snapshot
+    version = cache.version
+    if _data_snapshot[0] == version:
+        return
+    _data_snapshot = (version, Snapshot.load(store))
+
+
+data_refresh = BackgroundRefresh(build_data_snapshot, "snapshot refresh")
+
+
+def get_data_snapshot(fresh=False):
+    """
+    The latest (version, Snapshot), which may be older than the data while a
+    refresh runs. Only the first request, with no snapshot yet, waits.
+
+    Args:
+        fresh: wait for a snapshot of the current version
+
+    Raises:
+        RuntimeError: if there is no snapshot and loading it failed
+    """
+    snapshot = _data_snapshot
+    if snapshot[0] == cache.version:
+        return snapshot
+    data_refresh.schedule()
+    if snapshot[1] is None or fresh:
+        data_refresh.wait_for(lambda: _data_snapshot[1] is not None
+                              and (not fresh or _data_snapshot[0] == cache.version))
+        snapshot = _data_snapshot
+        if snapshot[1] is None:
+            raise RuntimeError("Loading the data snapshot failed; see the server log")
+    return snapshot
+
+
+def reader(table, select):
+    """
+    The data snapshot if it holds every selected column, else the database.
+    An answer from a snapshot older than the data is marked not to be cached.
+    """
+    version, snapshot = get_data_snapshot()
+    if not snapshot.covers(table, select):
+        return store
+    if version != cache.version:
+        g.stale_snapshot = True
+    return snapshot
 
 @app.route("/api/clusters", methods=["GET"])
+@admission.limit("cheap")
+@cached
+@admission.gate("cheap")
 def get_all_clusters():
     try:
-        result = supabase.table('clusters').select("*").execute()
-        data = result.data or []
+        select, limit, cursor = parse_page_args(request.args, "cluster_id", CLUSTER_FIELDS)
+        since, until = parse_time_range(request.args)
+        ids = parse_ids(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        backend = reader('clusters', select)
+        if ids is not None:
+            data, next_cursor = backend.get_clusters(ids, select), None
+        else:
+            data, next_cursor = backend.list_clusters(
+                select, limit, cursor,
+                since=since,
+                until=until,
+            )
         return jsonify({
             "clusters": data,
-            "total": len(data)
+            "total": len(data),
+            "next_cursor": next_cursor
         }), 200
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/articles', methods=["GET"])
+@admission.limit(article_route_class)
+@cached
+@admission.gate(article_route_class)
 def get_all_articles():
     try:
-        result = supabase.table('articles').select("*").execute()
-        data = result.data or []
+        select, limit, cursor = parse_page_args(request.args, "article_id", ARTICLE_FIELDS)
+        since, until = parse_time_range(request.args)
+        ids = parse_ids(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cluster_id = request.args.get('cluster_id')
+    if cluster_id is not None and not cluster_id.isdigit():
+        return jsonify({"error": "cluster_id must be an integer"}), 400
+
+    try:
+        backend = reader('articles', select)
+        if ids is not None:
+            data, next_cursor = backend.get_articles(ids, select), None
+        else:
+            data, next_cursor = backend.list_articles(
+                select, limit, cursor,
+                cluster_id=int(cluster_id) if cluster_id is not None else None,
+                source=request.args.get('source'),
+                since=since,
+                until=until,
+            )
         return jsonify({
             "articles": data,
-            "total": len(data)
+            "total": len(data),
+            "next_cursor": next_cursor
         }), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+# topics -> clusters -> articles (topics.py): clients draw the topics first and
+# load a topic's clusters, then a cluster's articles, as they are expanded
+@app.route('/api/topics', methods=["GET"])
+@admission.limit("cheap")
+@cached
+@admission.gate("cheap")
+def get_all_topics():
+    try:
+        select, limit, cursor = parse_page_args(request.args, "topic_id", TOPIC_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        data, next_cursor = store.list_topics(TOPIC_SELECT if select == "*" else select, limit, cursor)
+        return jsonify({
+            "topics": data,
+            "total": len(data),
+            "next_cursor": next_cursor
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/topics/<int:topic_id>/clusters', methods=["GET"])
+@admission.limit("cheap")
+@cached
+@admission.gate("cheap")
+def get_clusters_by_topic(topic_id):
+    try:
+        select, limit, cursor = parse_page_args(request.args, "cluster_id", CLUSTER_FIELDS)
+        since, until = parse_time_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        topic = store.get_topic(topic_id, TOPIC_SELECT)
+        if not topic:
+            return jsonify({"error": "Topic not found"}), 404
+
+        data, next_cursor = reader('clusters', select).list_clusters(
+            select, limit, cursor,
+            since=since,
+            until=until,
+            topic_id=topic_id,
+        )
+        return jsonify(dict(topic, **{
+            "clusters": data,
+            "total": len(data),
+            "next_cursor": next_cursor
+        })), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
     
+# (version, graph) snapshot, rebuilt after every write. Node positions are
+# seeded from the previous layout so the graph does not reshuffle each run.
+# The layout takes seconds on large graphs, so it runs in the background while
+# readers keep getting the previous graph.
+_graph_snapshot = (None, None)
+_layout_positions = None
+
+
+def build_graph_snapshot():
+    """Lay out the graph of the current data and swap it in (only ever run by the refresh thread)."""
+    global _graph_snapshot, _layout_positions
+    if _graph_snapshot[0] == cache.version:
+        return
+    version, data = get_data_snapshot(fresh=True)
+    clusters = data.fetch_all('clusters', CLUSTER_GRAPH_FIELDS, 'cluster_id')
+    articles = data.fetch_all('articles', ARTICLE_GRAPH_FIELDS, 'article_id')
+    graph = build_graph(clusters, articles)
+    if _layout_positions is None:
+        _layout_positions = load_positions()
+    _layout_positions = layout_graph(graph, _layout_positions)
+    save_positions(_layout_positions)
+    _graph_snapshot = (version, graph)
+
+
+graph_refresh = BackgroundRefresh(build_graph_snapshot, "graph refresh")
+
+
+def get_graph_snapshot():
+    """
+    The latest laid-out (version, graph), which may be older than the data
+    while a refresh runs. Only the first request, with no graph yet, waits.
+
+    Raises:
+        RuntimeError: if there is no graph and the layout failed
+    """
+    snapshot = _graph_snapshot
+    if snapshot[0] == cache.version:
+        return snapshot
+    graph_refresh.schedule()
+    if snapshot[1] is None:
+        graph_refresh.wait_for(lambda: _graph_snapshot[1] is not None)
+        snapshot = _graph_snapshot
+        if snapshot[1] is None:
+            raise RuntimeError("Graph layout failed; see the server log")
+    return snapshot
+
+
+@app.route('/api/graph', methods=["GET"])
+@admission.limit("expensive")
+@cached
+@admission.gate("expensive")
+def get_graph():
+    try:
+        version, graph = get_graph_snapshot()
+        response = jsonify({
+            "nodes": graph["nodes"],
+            "links": graph["links"],
+            "version": version,
+            "node_count": len(graph["nodes"]),
+            "link_count": len(graph["links"])
+        })
+        if version != cache.version:
+            # the previous graph while the new one is laid out; not cached under the new version
+            response.headers["Cache-Control"] = "no-store"
+        return response, 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Full-text (search.py) and embedding (semantic.py) indexes over all articles,
+# each built on its first query and then extended with the articles each
+# upload creates
+_search_lock = threading.Lock()
+_semantic_lock = threading.Lock()
+_search_index = None
+_semantic_index = None
+
+
+def get_search_index():
+    global _search_index
+    if _search_index is None:
+        with _search_lock:
+            if _search_index is None:
+                index = SearchIndex()
+                index.add_articles(store.fetch_all('articles', INDEX_FIELDS, 'article_id'))
+                _search_index = index
+    return _search_index
+
+
+def get_semantic_index():
+    global _semantic_index
+    if _semantic_index is None:
+        with _semantic_lock:
+            if _semantic_index is None:
+                index = SemanticIndex()
+                index.add_articles(embedding_rows(store.fetch_all('article_embeddings', EMBEDDING_FIELDS, 'article_id')))
+                _semantic_index = index
+    return _semantic_index
+
+
+def index_articles(articles):
+    """
+    Add newly created articles to the search indexes that have been built,
+    then drop their embeddings so responses stay small.
+    """
+    if not articles:
+        return
+    if _search_index is not None:
+        _search_index.add_articles(articles)
+    if _semantic_index is not None:
+        _semantic_index.add_articles(articles)
+    for article in articles:
+        article.pop('embedding', None)
+
+
+def on_external_change(cluster_ids, article_ids):
+    """
+    Rows written by another process (another worker, or the pipeline through
+    writer.py): drop cached responses and snapshots, index the new articles
+    and lay the graph out again. A shared (Redis) version was already bumped
+    by the process that wrote the rows; bumping it again here would do so
+    once per worker.
+    """
+    if not cache.shared:
+        cache.bump_version()
+    if article_ids and _search_index is not None:
+        _search_index.add_articles(store.get_articles(article_ids, INDEX_FIELDS))
+    if article_ids and _semantic_index is not None:
+        _semantic_index.add_articles(embedding_rows(store.get_embeddings(article_ids, EMBEDDING_FIELDS)))
+    data_refresh.schedule()
+    graph_refresh.schedule()
+
+
+# notice writes made outside this process; WATCH_CHANGES=off to disable
+if os.getenv("WATCH_CHANGES", "on").lower() not in ("off", "0", "false"):
+    feed.watch(on_external_change)
+
+
+@app.route('/api/search', methods=["GET"])
+@admission.limit("expensive")
+@cached
+@admission.gate("expensive")
+def search_articles():
+    """
+    Ranked full-text search over article titles, summaries and text.
+
+    Query params: q (required), limit (default 20, max 100). The last term of
+    q also matches as a prefix.
+    """
+    query = (request.args.get('q') or "").strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit = parse_limit(request.args, 20, 100)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        if hasattr(store, 'search_articles'):
+            # the SQLite backend answers from its own FTS5 index
+            results, total = store.search_articles(query, limit=limit)
+        else:
+            results, total = get_search_index().search(query, limit=limit)
+        return jsonify({
+            "query": query,
+            "results": results,
+            "total": total
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/search/semantic', methods=["GET"])
+@admission.limit("expensive")
+@cached
+@admission.gate("expensive")
+def semantic_search_articles():
+    """
+    Articles closest in meaning to q, by cosine similarity of MiniLM
+    embeddings. Query params: q (required), limit (default 10, max 100).
+    """
+    query = (request.args.get('q') or "").strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit = parse_limit(request.args, 10, 100)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        results = get_semantic_index().search(encode_query(query), k=limit)
+        return jsonify({
+            "query": query,
+            "results": results,
+            "total": len(results)
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/articles/<int:article_id>/related', methods=["GET"])
+@admission.limit("expensive")
+@cached
+@admission.gate("expensive")
+def get_related_articles(article_id):
+    """
+    Nearest neighbours of an article by embedding, from other clusters unless
+    same_cluster=1. Query params: limit (default 10, max 100).
+    """
+    try:
+        limit = parse_limit(request.args, 10, 100)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        related = get_semantic_index().related(
+            article_id, k=limit, same_cluster=request.args.get('same_cluster') == "1")
+        if related is None:
+            return jsonify({"error": "Article not found or has no embedding"}), 404
+        return jsonify({
+            "article_id": article_id,
+            "related": related,
+            "total": len(related)
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def parse_version(value, name):
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise ValueError(f"{name} must be a non-negative integer")
+    return int(value)
+
+
+@app.route('/api/changes', methods=["GET"])
+@admission.limit("cheap")
+@admission.gate("cheap")
+def get_changes():
+    """
+    Clusters and articles added or updated after change version since
+    (default 0, i.e. everything). Article text is not included.
+
+    Pass the returned "version" as since on the next call; while "has_more" is
+    true there are further changes to fetch straight away.
+    """
+    try:
+        since = parse_version(request.args.get('since', "0"), "since")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        return jsonify(feed.changes_since(since)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/changes/stream', methods=["GET"])
+@admission.limit("cheap")
+def stream_changes():
+    """
+    Server-sent events: a "change" event carrying the new version whenever an
+    upload lands. Resumes from Last-Event-ID (or ?since=) after a reconnect.
+    """
+    try:
+        since = parse_version(request.headers.get("Last-Event-ID") or request.args.get('since'), "since")
+        if since is None:
+            since = feed.version
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return Response(
+        stream_with_context(feed.stream(since)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.route('/api/clusters/<int:cluster_id>/articles', methods=["GET"])
+@admission.limit("cheap")
+@cached
+@admission.gate("cheap")
 def get_articles_by_cluster(cluster_id):
     try:
-        cluster_result = supabase.table('clusters').select("*").eq('cluster_id', cluster_id).execute()
-        if not cluster_result.data:
+        cluster = store.get_cluster_with_articles(cluster_id)
+        if not cluster:
             return jsonify({"error": "Cluster not found"}), 404
 
-        cluster = cluster_result.data[0]
-
-        articles_result = supabase.table('articles').select("*").eq('cluster_id', cluster_id).execute()
-        articles = articles_result.data or []
+        articles = cluster.get('articles') or []
 
         return jsonify({
             "cluster_id": cluster_id,
@@ -76,13 +645,15 @@ def get_articles_by_cluster(cluster_id):
         return jsonify({"error": str(e)}), 500
     
 @app.route('/api/clusters/<int:cluster_id>', methods=["GET"])
+@admission.limit("cheap")
+@cached
+@admission.gate("cheap")
 def get_cluster_by_id(cluster_id):
     try:
-        result = supabase.table('clusters').select("cluster_id, cluster_summary").eq('cluster_id', cluster_id).execute()
-        if not result.data:
+        cluster = reader('clusters', "cluster_id, cluster_summary").get_cluster(cluster_id, "cluster_id, cluster_summary")
+        if not cluster:
             return jsonify({"error": "Cluster not found"}), 404
         
-        cluster = result.data[0]
         return jsonify({
             "cluster_id": cluster.get("cluster_id"),
             "cluster_title": cluster.get("cluster_summary")
@@ -91,18 +662,24 @@ def get_cluster_by_id(cluster_id):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/articles/<int:article_id>', methods=["GET"])
+@admission.limit("cheap")
+@cached
+@admission.gate("cheap")
 def get_article_by_id(article_id):
     try:
-        result = supabase.table('articles').select("*").eq('article_id', article_id).execute()
-        if not result.data:
+        article = store.get_article(article_id)
+        if not article:
             return jsonify({"error": "Article not found"}), 404
 
         return jsonify({
-            "article": result.data[0]
+            "article": article
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 @app.route('/api/clusters/batch', methods=["POST"])
+@admission.limit("write")
+@admission.gate("write")
+@invalidates_cache
 def create_cluster_with_articles():
     try:
         data = request.get_json()
@@ -110,78 +687,41 @@ def create_cluster_with_articles():
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
-        cluster_data = data.get('cluster')
-        articles_data = data.get('articles', [])
-        
-        if not cluster_data:
+        if not data.get('cluster'):
             return jsonify({"error": "Cluster data is required"}), 400
         
-        if not cluster_data.get('cluster_summary'):
+        if not data['cluster'].get('cluster_summary'):
             return jsonify({"error": "cluster_summary is required"}), 400
+
+        try:
+            batch = clean_batch(data, article_prefix="")
+        except ValidationError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Create cluster
-        cluster_insert_data = {
-            'cluster_summary': cluster_data.get('cluster_summary')
-        }
-        
-        if cluster_data.get('cluster_id'):
-            cluster_insert_data['cluster_id'] = cluster_data.get('cluster_id')
-        
-        if cluster_data.get('cluster_title'):
-            cluster_insert_data['cluster_title'] = cluster_data.get('cluster_title')
-        
-        cluster_result = supabase.table('clusters').insert(cluster_insert_data).execute()
-        
-        if not cluster_result.data:
-            return jsonify({
-                "success": False,
-                "error": "Failed to create cluster"
-            }), 500
-        
-        created_cluster = cluster_result.data[0]
+        # cluster and articles are written together in one transaction;
+        # a cluster or articles that already exist are left untouched
+        result = write_batches(store, [batch])[0]
+        created_cluster = result["cluster"]
+        created_articles = result["articles"]
+        index_articles(created_articles)
+        feed.record(*changed_ids([result]))
         cluster_id = created_cluster.get('cluster_id')
         
-        # Create articles
-        created_articles = []
-        if articles_data:
-            for i, article in enumerate(articles_data):
-                if not article.get('title') or not article.get('text'):
-                    return jsonify({
-                        "error": f"Article {i+1} missing required fields (title, text)"
-                    }), 400
-            
-            articles_insert_data = []
-            for article in articles_data:
-                article_data = {
-                    'cluster_id': cluster_id,
-                    'title': article.get('title'),
-                    'text': article.get('text'),
-                    'article_summary': article.get('article_summary'),
-                    'source': article.get('source')
-                }
-                
-                if article.get('article_id'):
-                    article_data['article_id'] = article.get('article_id')
-                
-                article_data = {k: v for k, v in article_data.items() if v is not None}
-                articles_insert_data.append(article_data)
-            
-            articles_result = supabase.table('articles').insert(articles_insert_data).execute()
-            
-            if articles_result.data:
-                created_articles = articles_result.data
-        
         return jsonify({
             "success": True,
             "cluster": created_cluster,
             "articles": created_articles,
             "summary": {
                 "cluster_id": cluster_id,
+                "cluster_created": result["created"],
                 "articles_created": len(created_articles),
-                "total_items": 1 + len(created_articles)
+                "articles_unchanged": result["articles_unchanged"],
+                "total_items": int(result["created"]) + len(created_articles)
             },
             "message": f"Successfully created cluster {cluster_id} with {len(created_articles)} articles"
-        }), 201
+            if result["created"] else
+            f"Cluster {cluster_id} already exists; added {len(created_articles)} new articles"
+        }), 201 if result["created"] or created_articles else 200
         
     except Exception as e:
         return jsonify({
@@ -190,108 +730,61 @@ def create_cluster_with_articles():
         }), 500
 
 @app.route('/api/data/bulk', methods=["POST"])
+@admission.limit("bulk")
+@admission.gate("bulk")
+@invalidates_cache
 def create_multiple_clusters_with_articles():
+    """
+    Create many clusters with their articles.
+
+    Accepts either a JSON body {"clusters": [batch, ...]} or, with
+    Content-Type: application/x-ndjson, one batch per line. The whole payload
+    is validated before anything is written. JSON bodies are written in a
+    single transaction; NDJSON bodies are streamed in STREAM_CHUNK_SIZE
+    cluster transactions.
+    """
     try:
-        data = request.get_json()
-        
-        if not data or 'clusters' not in data:
-            return jsonify({"error": "No clusters data provided"}), 400
-        
-        clusters_data = data.get('clusters', [])
-        
-        if not clusters_data:
-            return jsonify({"error": "Clusters array is empty"}), 400
-        
-        results = []
-        total_clusters_created = 0
-        total_articles_created = 0
-        
-        for i, cluster_batch in enumerate(clusters_data):
+        if request.mimetype == "application/x-ndjson":
             try:
-                cluster_info = cluster_batch.get('cluster')
-                articles_info = cluster_batch.get('articles', [])
-                
-                if not cluster_info or not cluster_info.get('cluster_summary'):
-                    return jsonify({
-                        "error": f"Cluster {i+1} missing required cluster data"
-                    }), 400
-                
-                cluster_insert_data = {
-                    'cluster_summary': cluster_info.get('cluster_summary')
-                }
-                
-                if cluster_info.get('cluster_id'):
-                    cluster_insert_data['cluster_id'] = cluster_info.get('cluster_id')
-                
-                if cluster_info.get('cluster_title'):
-                    cluster_insert_data['cluster_title'] = cluster_info.get('cluster_title')
-                
-                cluster_result = supabase.table('clusters').insert(cluster_insert_data).execute()
-                
-                if not cluster_result.data:
-                    return jsonify({
-                        "success": False,
-                        "error": f"Failed to create cluster {i+1}",
-                        "partial_results": results
-                    }), 500
-                
-                created_cluster = cluster_result.data[0]
-                cluster_id = created_cluster.get('cluster_id')
-                total_clusters_created += 1
-                
-                created_articles = []
-                if articles_info:
-                    for j, article in enumerate(articles_info):
-                        if not article.get('title') or not article.get('text'):
-                            return jsonify({
-                                "error": f"Cluster {i+1}, Article {j+1} missing required fields"
-                            }), 400
-                    
-                    articles_insert_data = []
-                    for article in articles_info:
-                        article_data = {
-                            'cluster_id': cluster_id,
-                            'title': article.get('title'),
-                            'text': article.get('text'),
-                            'article_summary': article.get('article_summary'),
-                            'source': article.get('source')
-                        }
-                        
-                        if article.get('article_id'):
-                            article_data['article_id'] = article.get('article_id')
-                        
-                        article_data = {k: v for k, v in article_data.items() if v is not None}
-                        articles_insert_data.append(article_data)
-                    
-                    articles_result = supabase.table('articles').insert(articles_insert_data).execute()
-                    
-                    if articles_result.data:
-                        created_articles = articles_result.data
-                        total_articles_created += len(created_articles)
-                
-                results.append({
-                    "cluster": created_cluster,
-                    "articles": created_articles,
-                    "articles_count": len(created_articles)
-                })
-                
-            except Exception as cluster_error:
-                return jsonify({
-                    "success": False,
-                    "error": f"Error processing cluster {i+1}: {str(cluster_error)}",
-                    "partial_results": results
-                }), 500
+                spool, count = spool_batches(iter_ndjson_batches(request.stream))
+            except ValidationError as e:
+                return jsonify({"error": str(e)}), 400
+            if not count:
+                return jsonify({"error": "Clusters array is empty"}), 400
+            with spool:
+                chunks = list(write_stream(store, read_spool(spool)))
+            results = [r for chunk in chunks for r in chunk]
+        else:
+            data = request.get_json()
+            
+            if not data or 'clusters' not in data:
+                return jsonify({"error": "No clusters data provided"}), 400
+            
+            if not data.get('clusters'):
+                return jsonify({"error": "Clusters array is empty"}), 400
+
+            try:
+                batches = clean_bulk(data['clusters'])
+            except ValidationError as e:
+                return jsonify({"error": str(e)}), 400
+
+            results = write_batches(store, batches)
+
+        index_articles([a for r in results for a in r["articles"]])
+        feed.record(*changed_ids(results))
+        summary = summarize(results)
+        summary["total_batches_processed"] = len(results)
+        changed = summary["total_clusters_created"] or summary["total_articles_created"]
         
         return jsonify({
             "success": True,
             "results": results,
-            "summary": {
-                "total_clusters_created": total_clusters_created,
-                "total_articles_created": total_articles_created,
-                "total_batches_processed": len(results)
-            },
-            "message": f"Successfully created {total_clusters_created} clusters with {total_articles_created} articles"
-        }), 201
+            "summary": summary,
+            "message": f"Successfully created {summary['total_clusters_created']} clusters with "
+                       f"{summary['total_articles_created']} articles "
+                       f"({summary['total_clusters_unchanged']} clusters and "
+                       f"{summary['total_articles_unchanged']} articles unchanged)"
+        }), 201 if changed else 200
         
     except Exception as e:
         return jsonify({
@@ -300,6 +793,9 @@ def create_multiple_clusters_with_articles():
         }), 500
 
 @app.route('/api/clusters/<int:cluster_id>/articles/batch', methods=["POST"])
+@admission.limit("write")
+@admission.gate("write")
+@invalidates_cache
 def add_articles_to_existing_cluster(cluster_id):
     try:
         data = request.get_json()
@@ -312,47 +808,27 @@ def add_articles_to_existing_cluster(cluster_id):
         if not articles_data:
             return jsonify({"error": "Articles array is empty"}), 400
         
-        cluster_check = supabase.table('clusters').select("cluster_id").eq('cluster_id', cluster_id).execute()
-        if not cluster_check.data:
-            return jsonify({"error": "Cluster not found"}), 404
-        
-        for i, article in enumerate(articles_data):
-            if not article.get('title') or not article.get('text'):
-                return jsonify({
-                    "error": f"Article {i+1} missing required fields (title, text)"
-                }), 400
+        try:
+            articles_insert_data = clean_articles(articles_data)
+        except ValidationError as e:
+            return jsonify({"error": str(e)}), 400
         
-        articles_insert_data = []
-        for article in articles_data:
-            article_data = {
-                'cluster_id': cluster_id,
-                'title': article.get('title'),
-                'text': article.get('text'),
-                'article_summary': article.get('article_summary'),
-                'source': article.get('source')
-            }
-            
-            if article.get('article_id'):
-                article_data['article_id'] = article.get('article_id')
-            
-            article_data = {k: v for k, v in article_data.items() if v is not None}
-            articles_insert_data.append(article_data)
-        
-        result = supabase.table('articles').insert(articles_insert_data).execute()
+        try:
+            created = store.add_articles_to_cluster(cluster_id, articles_insert_data)
+        except NotFound:
+            return jsonify({"error": "Cluster not found"}), 404
+        index_articles(created)
+        feed.record([cluster_id] if created else [], [a['article_id'] for a in created])
         
-        if result.data:
-            return jsonify({
-                "success": True,
-                "articles": result.data,
-                "cluster_id": cluster_id,
-                "articles_added": len(result.data),
-                "message": f"Successfully added {len(result.data)} articles to cluster {cluster_id}"
-            }), 201
-        else:
-            return jsonify({
-                "success": False,
-                "error": "Failed to add articles to cluster"
-            }), 500
+        # articles whose content_hash already exists are skipped, not re-inserted
+        return jsonify({
+            "success": True,
+            "articles": created,
+            "cluster_id": cluster_id,
+            "articles_added": len(created),
+            "articles_unchanged": len(articles_insert_data) - len(created),
+            "message": f"Successfully added {len(created)} articles to cluster {cluster_id}"
+        }), 201 if created else 200
         
     except Exception as e:
         return jsonify({
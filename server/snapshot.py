@@ -0,0 +1,268 @@
+"""
+Read-optimised in-memory snapshot of clusters and articles.
+
+The list and lookup endpoints are served from a Snapshot instead of the
+database. A snapshot stores every column as a flat array (NumPy for numbers,
+plain lists for strings) rather than one dict per row. Sources are interned to
+small integer codes, and article text, URLs and hashes are left out entirely;
+requests that need them still go to the database.
+
+Articles are kept sorted by (cluster, article_id), with a start offset per
+cluster, so a cluster's articles are one slice. A second permutation sorted by
+(source, article_id), with per-source offsets, does the same for source
+filters, and id -> row lookups go through direct-address tables (or a
+binary search over the sorted ids when ids are too sparse for one). Missing
+cluster and topic ids are stored as -1, since 0 is a valid id. A snapshot
+is immutable once built: the server builds a new one after each write and
+swaps the reference, so readers never see a half-updated dataset.
+
+Snapshot mirrors the read methods of db.Store (list_clusters, list_articles,
+get_clusters, get_articles, get_cluster, fetch_all) for the columns it holds;
+covers() tells whether a select can be answered from it.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+
+from db import DEFAULT_PAGE_SIZE
+
+# a direct-address table is used while it has at most this many slots per id
+MAX_DIRECT_SLOTS_PER_ID = 4
+
+CLUSTER_COLUMNS = ("cluster_id", "cluster_title", "cluster_summary", "fingerprint", "topic_id", "created_at")
+ARTICLE_COLUMNS = ("article_id", "cluster_id", "title", "article_summary", "source", "created_at")
+
+SNAPSHOT_CLUSTER_FIELDS = ", ".join(CLUSTER_COLUMNS)
+SNAPSHOT_ARTICLE_FIELDS = ", ".join(ARTICLE_COLUMNS)
+
+
+def _columns(select, table_columns):
+    """Columns of a plain select string, or None if it asks for anything not in table_columns."""
+    if select.strip() == "*":
+        return list(table_columns)
+    columns = [c.strip() for c in select.split(",") if c.strip()]
+    return columns if all(c in table_columns for c in columns) else None
+
+
+def _timestamp(value):
+    """ISO timestamp / date string -> epoch seconds (naive values are UTC)."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class _IdIndex:
+    """
+    id -> row position. A direct-address table when the ids are dense enough,
+    else a binary search over the sorted ids, so a few large ids do not
+    allocate a table of max(id) entries.
+    """
+
+    def __init__(self, ids):
+        self._table = None
+        if len(ids) and ids.min() >= 0 and ids.max() < MAX_DIRECT_SLOTS_PER_ID * len(ids):
+            self._table = np.full(int(ids.max()) + 1, -1, dtype=np.int32)
+            self._table[ids] = np.arange(len(ids), dtype=np.int32)
+        else:
+            self._order = np.argsort(ids, kind="stable").astype(np.int32)
+            self._sorted = ids[self._order]
+
+    def positions(self, ids):
+        """Row position of each id in an int64 array (-1 where absent)."""
+        if self._table is not None:
+            found = (ids >= 0) & (ids < len(self._table))
+            positions = np.full(len(ids), -1, dtype=np.int32)
+            positions[found] = self._table[ids[found]]
+            return positions
+        if not len(self._sorted):
+            return np.full(len(ids), -1, dtype=np.int32)
+        at = np.minimum(np.searchsorted(self._sorted, ids), len(self._sorted) - 1)
+        return np.where(self._sorted[at] == ids, self._order[at], -1).astype(np.int32)
+
+    def position(self, id_):
+        return int(self.positions(np.array([id_], dtype=np.int64))[0])
+
+
+def _id_array(rows, column):
+    """An int64 column with -1 where the id is missing."""
+    return np.array([-1 if r.get(column) is None else r[column] for r in rows], dtype=np.int64)
+
+
+def _id_or_none(value):
+    return int(value) if value >= 0 else None
+
+
+def _offsets(sorted_codes, n_codes):
+    """Start of each code's run in a sorted code array, plus a final end offset."""
+    return np.searchsorted(sorted_codes, np.arange(n_codes + 1))
+
+
+class Snapshot:
+    def __init__(self, clusters, articles):
+        """
+        Args:
+            clusters: rows with SNAPSHOT_CLUSTER_FIELDS
+            articles: rows with SNAPSHOT_ARTICLE_FIELDS
+        """
+        clusters = sorted(clusters, key=lambda c: c["cluster_id"])
+        self.cluster_ids = np.array([c["cluster_id"] for c in clusters], dtype=np.int64)
+        self.cluster_topics = _id_array(clusters, "topic_id")
+        self._cluster_strings = {column: [c.get(column) for c in clusters]
+                                 for column in CLUSTER_COLUMNS if column not in ("cluster_id", "topic_id")}
+        self._cluster_times = np.array([_timestamp(t) if t else 0.0 for t in self._cluster_strings["created_at"]])
+        self._cluster_pos = _IdIndex(self.cluster_ids)
+        n_clusters = len(clusters)
+
+        # cluster position per article; articles without a known cluster sort last
+        article_clusters = _id_array(articles, "cluster_id")
+        positions = self._cluster_pos.positions(article_clusters).astype(np.int64)
+        positions[positions < 0] = n_clusters
+        article_ids = np.array([a["article_id"] for a in articles], dtype=np.int64)
+        order = np.lexsort((article_ids, positions))
+        articles = [articles[i] for i in order]
+        positions = positions[order]
+        self.source_names = sorted({a.get("source") or "" for a in articles})
+        codes = {name: i for i, name in enumerate(self.source_names)}
+
+        self.article_ids = article_ids[order]
+        self.article_clusters = article_clusters[order]
+        self.article_sources = np.array([codes[a.get("source") or ""] for a in articles], dtype=np.uint16)
+        self._article_strings = {column: [a.get(column) for a in articles]
+                                 for column in ("title", "article_summary", "created_at")}
+        self._article_times = np.array([_timestamp(t) if t else 0.0 for t in self._article_strings["created_at"]])
+        self._article_pos = _IdIndex(self.article_ids)
+
+        self._cluster_start = _offsets(positions, n_clusters)
+        self._by_id = np.argsort(self.article_ids, kind="stable")
+        self._ids_by_id = self.article_ids[self._by_id]
+        self._by_source = np.lexsort((self.article_ids, self.article_sources))
+        self._ids_by_source = self.article_ids[self._by_source]
+        self._source_start = _offsets(self.article_sources[self._by_source], len(self.source_names))
+
+    def __len__(self):
+        return len(self.article_ids)
+
+    @classmethod
+    def load(cls, store):
+        return cls(store.fetch_all('clusters', SNAPSHOT_CLUSTER_FIELDS, 'cluster_id'),
+                   store.fetch_all('articles', SNAPSHOT_ARTICLE_FIELDS, 'article_id'))
+
+    def covers(self, table, select):
+        if table == "clusters":
+            return _columns(select, CLUSTER_COLUMNS) is not None
+        # "*" on articles includes text, which the snapshot does not hold
+        return select.strip() != "*" and _columns(select, ARTICLE_COLUMNS) is not None
+
+    # --- row materialisation ---
+
+    def _cluster_rows(self, positions, select):
+        columns = _columns(select, CLUSTER_COLUMNS)
+        rows = []
+        for i in positions:
+            row = {}
+            for column in columns:
+                if column == "cluster_id":
+                    row[column] = int(self.cluster_ids[i])
+                elif column == "topic_id":
+                    row[column] = _id_or_none(self.cluster_topics[i])
+                else:
+                    row[column] = self._cluster_strings[column][i]
+            rows.append(row)
+        return rows
+
+    def _article_rows(self, positions, select):
+        columns = _columns(select, ARTICLE_COLUMNS)
+        rows = []
+        for i in positions:
+            row = {}
+            for column in columns:
+                if column == "article_id":
+                    row[column] = int(self.article_ids[i])
+                elif column == "cluster_id":
+                    row[column] = _id_or_none(self.article_clusters[i])
+                elif column == "source":
+                    row[column] = self.source_names[self.article_sources[i]] or None
+                else:
+                    row[column] = self._article_strings[column][i]
+            rows.append(row)
+        return rows
+
+    # --- keyset pages over an id-sorted position array ---
+
+    @staticmethod
+    def _page(order, order_ids, times, limit, cursor, since, until):
+        """
+        Up to limit + 1 positions from order (whose ids, ascending, are
+        order_ids) after cursor, optionally restricted to since <= created_at < until.
+        """
+        start = np.searchsorted(order_ids, cursor, side="right") if cursor is not None else 0
+        candidates = order[start:]
+        if since or until:
+            mask = np.ones(len(candidates), dtype=bool)
+            if since:
+                mask &= times[candidates] >= _timestamp(since)
+            if until:
+                mask &= times[candidates] < _timestamp(until)
+            candidates = candidates[mask]
+        return candidates[:limit + 1].tolist()
+
+    @staticmethod
+    def _split(rows, positions, ids, limit):
+        """(page, next_cursor) from a limit + 1 look-ahead, like db.split_page."""
+        if len(rows) > limit:
+            return rows[:limit], int(ids[positions[limit - 1]])
+        return rows, None
+
+    def list_clusters(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None, since=None, until=None,
+                      topic_id=None):
+        order, order_ids = np.arange(len(self.cluster_ids)), self.cluster_ids
+        if topic_id is not None:
+            # a topic has a few dozen to a few hundred clusters, so a scan is cheap
+            order = np.flatnonzero(self.cluster_topics == topic_id)
+            order_ids = self.cluster_ids[order]
+        positions = self._page(order, order_ids, self._cluster_times, limit, cursor, since, until)
+        return self._split(self._cluster_rows(positions, select), positions, self.cluster_ids, limit)
+
+    def list_articles(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None,
+                      cluster_id=None, source=None, since=None, until=None):
+        order, order_ids = self._by_id, self._ids_by_id
+        if cluster_id is not None:
+            pos = self._cluster_pos.position(cluster_id)
+            start, end = (self._cluster_start[pos], self._cluster_start[pos + 1]) if pos >= 0 else (0, 0)
+            order, order_ids = np.arange(start, end), self.article_ids[start:end]
+        if source:
+            code = self.source_names.index(source) if source in self.source_names else -1
+            if code < 0:
+                order, order_ids = order[:0], order_ids[:0]
+            elif cluster_id is None:
+                start, end = self._source_start[code], self._source_start[code + 1]
+                order, order_ids = self._by_source[start:end], self._ids_by_source[start:end]
+            else:
+                same = self.article_sources[order] == code
+                order, order_ids = order[same], order_ids[same]
+
+        positions = self._page(order, order_ids, self._article_times, limit, cursor, since, until)
+        return self._split(self._article_rows(positions, select), positions, self.article_ids, limit)
+
+    def fetch_all(self, table, select, key):
+        if table == "clusters":
+            return self._cluster_rows(range(len(self.cluster_ids)), select)
+        return self._article_rows(self._by_id.tolist(), select)
+
+    # --- lookups by id ---
+
+    @staticmethod
+    def _lookup(index, ids):
+        positions = index.positions(np.array(list(dict.fromkeys(ids)), dtype=np.int64))
+        return positions[positions >= 0].tolist()
+
+    def get_clusters(self, cluster_ids, select="*"):
+        return self._cluster_rows(self._lookup(self._cluster_pos, cluster_ids), select)
+
+    def get_articles(self, article_ids, select="*"):
+        return self._article_rows(self._lookup(self._article_pos, article_ids), select)
+
+    def get_cluster(self, cluster_id, select="*"):
+        rows = self.get_clusters([cluster_id], select)
+        return rows[0] if rows else None
@@ -0,0 +1,51 @@
+-- Bulk ingest used by POST /api/data/bulk and /api/clusters/batch.
+--
+-- Takes a JSON array of {"cluster": {...}, "articles": [...]} batches (already
+-- validated by ingest.py) and writes every cluster and article in a single
+-- statement. PostgREST runs each rpc call in its own transaction, so a failure
+-- leaves nothing half-written.
+--
+-- Apply with the Supabase SQL editor or: psql "$DATABASE_URL" -f sql/001_ingest_bulk.sql
+
+create or replace function ingest_bulk(payload jsonb)
+returns jsonb
+language sql
+as $$
+  with src as materialized (
+    select
+      t.ord,
+      t.batch,
+      coalesce(
+        (t.batch->'cluster'->>'cluster_id')::bigint,
+        nextval(pg_get_serial_sequence('clusters', 'cluster_id'))
+      ) as cluster_id
+    from jsonb_array_elements(payload) with ordinality as t(batch, ord)
+  ),
+  new_clusters as (
+    insert into clusters (cluster_id, cluster_summary, cluster_title)
+    select cluster_id, batch->'cluster'->>'cluster_summary', batch->'cluster'->>'cluster_title'
+    from src
+    returning *
+  ),
+  new_articles as (
+    insert into articles (article_id, cluster_id, title, text, article_summary, source)
+    select
+      coalesce((a.article->>'article_id')::bigint, nextval(pg_get_serial_sequence('articles', 'article_id'))),
+      src.cluster_id,
+      a.article->>'title',
+      a.article->>'text',
+      a.article->>'article_summary',
+      a.article->>'source'
+    from src
+    cross join lateral jsonb_array_elements(coalesce(src.batch->'articles', '[]'::jsonb)) as a(article)
+    returning *
+  )
+  select jsonb_build_object(
+    -- clusters come back in payload order so callers can zip them with their batches
+    'clusters', (
+      select coalesce(jsonb_agg(to_jsonb(c) order by s.ord), '[]'::jsonb)
+      from new_clusters c join src s using (cluster_id)
+    ),
+    'articles', (select coalesce(jsonb_agg(to_jsonb(a) order by a.article_id), '[]'::jsonb) from new_articles a)
+  );
+$$;
@@ -0,0 +1,80 @@
+-- Idempotent ingest: articles are keyed by content_hash (normalised URL + text
+-- hash) and clusters by fingerprint (hash of their members' content hashes),
+-- both computed in ingest.py. Rows whose key already exists are skipped, so a
+-- retried or overlapping upload writes nothing twice.
+--
+-- Existing rows keep a NULL key until backfilled with: python ingest.py --backfill
+
+alter table articles add column if not exists url text;
+alter table articles add column if not exists content_hash text;
+alter table clusters add column if not exists fingerprint text;
+
+create unique index if not exists articles_content_hash_key on articles (content_hash);
+create unique index if not exists clusters_fingerprint_key on clusters (fingerprint);
+
+create or replace function ingest_bulk(payload jsonb)
+returns jsonb
+language sql
+as $$
+  with src as materialized (
+    select t.ord, t.batch, existing.cluster_id as existing_id
+    from jsonb_array_elements(payload) with ordinality as t(batch, ord)
+    left join clusters existing on existing.fingerprint = t.batch->'cluster'->>'fingerprint'
+  ),
+  ids as materialized (
+    select
+      src.*,
+      -- coalesce stops at the first non-null, so known clusters do not consume ids
+      coalesce(
+        existing_id,
+        (batch->'cluster'->>'cluster_id')::bigint,
+        nextval(pg_get_serial_sequence('clusters', 'cluster_id'))
+      ) as cluster_id
+    from src
+  ),
+  new_clusters as (
+    insert into clusters (cluster_id, cluster_summary, cluster_title, fingerprint)
+    select cluster_id, batch->'cluster'->>'cluster_summary', batch->'cluster'->>'cluster_title', batch->'cluster'->>'fingerprint'
+    from ids
+    where existing_id is null
+    on conflict do nothing
+    returning *
+  ),
+  incoming as (
+    select ids.cluster_id, a.article
+    from ids
+    cross join lateral jsonb_array_elements(coalesce(ids.batch->'articles', '[]'::jsonb)) as a(article)
+    where not exists (select 1 from articles e where e.content_hash = a.article->>'content_hash')
+  ),
+  new_articles as (
+    insert into articles (article_id, cluster_id, title, text, article_summary, source, url, content_hash)
+    select
+      coalesce((article->>'article_id')::bigint, nextval(pg_get_serial_sequence('articles', 'article_id'))),
+      cluster_id,
+      article->>'title',
+      article->>'text',
+      article->>'article_summary',
+      article->>'source',
+      article->>'url',
+      article->>'content_hash'
+    from incoming
+    on conflict do nothing
+    returning *
+  )
+  select jsonb_build_object(
+    -- every submitted cluster, in payload order, flagged with whether it was new
+    'clusters', (
+      select coalesce(jsonb_agg(
+        coalesce(to_jsonb(n), to_jsonb(e)) || jsonb_build_object(
+          'created', n.cluster_id is not null,
+          'submitted_articles', jsonb_array_length(coalesce(ids.batch->'articles', '[]'::jsonb))
+        )
+        order by ids.ord), '[]'::jsonb)
+      from ids
+      left join new_clusters n on n.cluster_id = ids.cluster_id
+      left join clusters e on e.cluster_id = ids.existing_id
+    ),
+    -- only the articles that were actually inserted
+    'articles', (select coalesce(jsonb_agg(to_jsonb(a) order by a.article_id), '[]'::jsonb) from new_articles a)
+  );
+$$;
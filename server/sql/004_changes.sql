@@ -0,0 +1,10 @@
+-- Change log for incremental sync (changes.py): one row per upload that
+-- created or updated rows, with a monotonically increasing version.
+-- Served by /api/changes?since=<version> and /api/changes/stream.
+
+create table if not exists changes (
+  version bigint generated always as identity primary key,
+  cluster_ids bigint[] not null default '{}',
+  article_ids bigint[] not null default '{}',
+  created_at timestamptz not null default now()
+);
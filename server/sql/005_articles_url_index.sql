@@ -0,0 +1,4 @@
+-- Lookup index for the pipeline's pre-download URL filter (url_filter.py),
+-- which asks which discovered URLs already have an article.
+
+create index if not exists articles_url_idx on articles (url);
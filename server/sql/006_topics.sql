@@ -0,0 +1,51 @@
+-- Topics: a coarser clustering level over cluster centroids (topics.py), so
+-- the graph can be loaded topic by topic. Each cluster belongs to at most one
+-- topic; the centroid (mean of its clusters' article embeddings) is what new
+-- clusters are matched against. Served by /api/topics and
+-- /api/topics/<id>/clusters.
+--
+-- Build the first tree with: python topics.py --rebuild
+
+create table if not exists topics (
+  topic_id bigint primary key,
+  topic_title text,
+  cluster_count integer not null default 0,
+  article_count integer not null default 0,
+  centroid real[] not null,
+  created_at timestamptz not null default now()
+);
+
+alter table clusters add column if not exists topic_id bigint references topics (topic_id) on delete set null;
+
+create index if not exists clusters_topic_id_idx on clusters (topic_id, cluster_id);
+
+-- Upserts the topics in payload, moves the clusters in assignments
+-- ({"<cluster_id>": topic_id}) and, with replace, drops every other topic,
+-- all in one transaction.
+create or replace function save_topics(payload jsonb, assignments jsonb, replace boolean default false)
+returns void
+language sql
+as $$
+  insert into topics (topic_id, topic_title, cluster_count, article_count, centroid)
+  select
+    (t->>'topic_id')::bigint,
+    t->>'topic_title',
+    coalesce((t->>'cluster_count')::integer, 0),
+    coalesce((t->>'article_count')::integer, 0),
+    array(select jsonb_array_elements_text(t->'centroid')::real)
+  from jsonb_array_elements(payload) as t
+  on conflict (topic_id) do update set
+    topic_title = excluded.topic_title,
+    cluster_count = excluded.cluster_count,
+    article_count = excluded.article_count,
+    centroid = excluded.centroid;
+
+  update clusters c
+  set topic_id = a.value::bigint
+  from jsonb_each_text(assignments) as a
+  where c.cluster_id = a.key::bigint;
+
+  delete from topics
+  where replace
+    and topic_id not in (select (t->>'topic_id')::bigint from jsonb_array_elements(payload) as t);
+$$;
@@ -0,0 +1,87 @@
+-- ingest_bulk reports a submitted cluster whose client-supplied cluster_id
+-- already exists (with a different fingerprint) as that existing, unchanged
+-- cluster instead of as null. The insert is skipped as before and its
+-- articles join the existing cluster, as they do in sqlite_store.ingest_bulk.
+
+create or replace function ingest_bulk(payload jsonb)
+returns jsonb
+language sql
+as $$
+  with src as materialized (
+    select t.ord, t.batch, existing.cluster_id as existing_id
+    from jsonb_array_elements(payload) with ordinality as t(batch, ord)
+    left join clusters existing on existing.fingerprint = t.batch->'cluster'->>'fingerprint'
+  ),
+  ids as materialized (
+    select
+      src.*,
+      -- coalesce stops at the first non-null, so known clusters do not consume ids
+      coalesce(
+        existing_id,
+        (batch->'cluster'->>'cluster_id')::bigint,
+        nextval(pg_get_serial_sequence('clusters', 'cluster_id'))
+      ) as cluster_id
+    from src
+  ),
+  new_clusters as (
+    insert into clusters (cluster_id, cluster_summary, cluster_title, fingerprint)
+    select cluster_id, batch->'cluster'->>'cluster_summary', batch->'cluster'->>'cluster_title', batch->'cluster'->>'fingerprint'
+    from ids
+    where existing_id is null
+    on conflict do nothing
+    returning *
+  ),
+  incoming as (
+    select ids.cluster_id, a.article
+    from ids
+    cross join lateral jsonb_array_elements(coalesce(ids.batch->'articles', '[]'::jsonb)) as a(article)
+    where not exists (select 1 from articles e where e.content_hash = a.article->>'content_hash')
+  ),
+  new_articles as (
+    insert into articles (article_id, cluster_id, title, text, article_summary, source, url, content_hash)
+    select
+      coalesce((article->>'article_id')::bigint, nextval(pg_get_serial_sequence('articles', 'article_id'))),
+      cluster_id,
+      article->>'title',
+      article->>'text',
+      article->>'article_summary',
+      article->>'source',
+      article->>'url',
+      article->>'content_hash'
+    from incoming
+    on conflict do nothing
+    returning *
+  ),
+  new_embeddings as (
+    insert into article_embeddings (article_id, embedding)
+    select a.article_id, array(select jsonb_array_elements_text(i.article->'embedding')::real)
+    from new_articles a
+    join incoming i on i.article->>'content_hash' = a.content_hash
+    where jsonb_typeof(i.article->'embedding') = 'array'
+    returning article_id, embedding
+  )
+  select jsonb_build_object(
+    -- every submitted cluster, in payload order, flagged with whether it was new
+    'clusters', (
+      select coalesce(jsonb_agg(
+        coalesce(to_jsonb(n), to_jsonb(e)) || jsonb_build_object(
+          'created', n.cluster_id is not null,
+          'submitted_articles', jsonb_array_length(coalesce(ids.batch->'articles', '[]'::jsonb))
+        )
+        order by ids.ord), '[]'::jsonb)
+      from ids
+      left join new_clusters n on n.cluster_id = ids.cluster_id
+      -- by fingerprint or by a client-supplied id that was already taken
+      left join clusters e on e.cluster_id = ids.cluster_id
+    ),
+    -- only the articles that were actually inserted, with their embedding if one was given
+    'articles', (
+      select coalesce(jsonb_agg(
+        case when e.article_id is null then to_jsonb(a)
+             else to_jsonb(a) || jsonb_build_object('embedding', to_jsonb(e.embedding)) end
+        order by a.article_id), '[]'::jsonb)
+      from new_articles a
+      left join new_embeddings e on e.article_id = a.article_id
+    )
+  );
+$$;
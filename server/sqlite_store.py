@@ -0,0 +1,497 @@
+"""
+Embedded SQLite storage backend.
+
+A drop-in replacement for db.Store that keeps the clusters, articles,
+article_embeddings and topics tables in a local SQLite file, so the pipeline and the API
+can run offline, in tests or in benchmarks without a Supabase project. Select
+with STORAGE_BACKEND=sqlite (and optionally SQLITE_PATH); see db.create_store.
+
+The database runs in WAL mode so readers never block the writer, with indexes
+for every filter the API uses and an FTS5 index over title, summary and text
+kept in sync by triggers. Each thread gets its own connection.
+
+Select strings use the same PostgREST syntax as Store, including one level of
+embedded resources ("*, articles(*)"), so callers do not need to know which
+backend they talk to.
+"""
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+from db import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, IN_BATCH_SIZE, QueryStats, NotFound, Conflict,
+                chunks, split_page)
+from search import tokenize, FIELD_WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+create table if not exists clusters (
+  cluster_id integer primary key,
+  cluster_title text,
+  cluster_summary text,
+  fingerprint text unique,
+  topic_id integer references topics (topic_id) on delete set null,
+  created_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+
+create table if not exists topics (
+  topic_id integer primary key,
+  topic_title text,
+  cluster_count integer not null default 0,
+  article_count integer not null default 0,
+  centroid blob not null,
+  created_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+
+create table if not exists articles (
+  article_id integer primary key,
+  cluster_id integer references clusters (cluster_id) on delete cascade,
+  title text,
+  text text,
+  article_summary text,
+  source text,
+  url text,
+  content_hash text unique,
+  created_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+
+create table if not exists article_embeddings (
+  article_id integer primary key references articles (article_id) on delete cascade,
+  embedding blob not null
+);
+
+create table if not exists changes (
+  version integer primary key autoincrement,
+  cluster_ids text not null default '[]',
+  article_ids text not null default '[]',
+  created_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+
+create index if not exists articles_cluster_id_idx on articles (cluster_id, article_id);
+create index if not exists articles_title_idx on articles (title);
+create index if not exists articles_url_idx on articles (url);
+create index if not exists articles_source_idx on articles (source, article_id);
+create index if not exists articles_created_at_idx on articles (created_at);
+create index if not exists clusters_created_at_idx on clusters (created_at);
+
+create virtual table if not exists articles_fts using fts5 (
+  title, article_summary, text,
+  content = 'articles', content_rowid = 'article_id'
+);
+
+create trigger if not exists articles_fts_insert after insert on articles begin
+  insert into articles_fts (rowid, title, article_summary, text)
+  values (new.article_id, new.title, new.article_summary, new.text);
+end;
+
+create trigger if not exists articles_fts_delete after delete on articles begin
+  insert into articles_fts (articles_fts, rowid, title, article_summary, text)
+  values ('delete', old.article_id, old.title, old.article_summary, old.text);
+end;
+
+create trigger if not exists articles_fts_update after update of title, article_summary, text on articles begin
+  insert into articles_fts (articles_fts, rowid, title, article_summary, text)
+  values ('delete', old.article_id, old.title, old.article_summary, old.text);
+  insert into articles_fts (rowid, title, article_summary, text)
+  values (new.article_id, new.title, new.article_summary, new.text);
+end;
+"""
+
+COLUMNS = {
+    "clusters": ("cluster_id", "cluster_title", "cluster_summary", "fingerprint", "topic_id", "created_at"),
+    "articles": ("article_id", "cluster_id", "title", "text", "article_summary", "source", "url",
+                 "content_hash", "created_at"),
+    "article_embeddings": ("article_id", "embedding"),
+    "topics": ("topic_id", "topic_title", "cluster_count", "article_count", "centroid", "created_at"),
+}
+
+# (table, embedded table) -> (join column, whether the embed is a list of rows or a single row)
+RELATIONS = {
+    ("clusters", "articles"): ("cluster_id", True),
+    ("articles", "clusters"): ("cluster_id", False),
+    ("articles", "article_embeddings"): ("article_id", False),
+    ("article_embeddings", "articles"): ("article_id", False),
+}
+
+_EMBED = re.compile(r"^(\w+)\((.*)\)$")
+
+
+def parse_select(table, select):
+    """
+    Split a PostgREST select string into columns and embedded resources.
+
+    Returns:
+        Tuple of (columns, {embedded table: columns})
+
+    Raises:
+        ValueError: for unknown tables, columns or relations
+    """
+    columns = []
+    embeds = {}
+    depth = 0
+    item = ""
+    items = []
+    for ch in select + ",":
+        if ch == "," and depth == 0:
+            items.append(item.strip())
+            item = ""
+            continue
+        depth += (ch == "(") - (ch == ")")
+        item += ch
+
+    for item in filter(None, items):
+        match = _EMBED.match(item)
+        if match:
+            other = match.group(1)
+            if (table, other) not in RELATIONS:
+                raise ValueError(f"No relation between {table} and {other}")
+            embeds[other] = parse_select(other, match.group(2))[0]
+        elif item == "*":
+            columns.extend(COLUMNS[table])
+        elif item in COLUMNS[table]:
+            columns.append(item)
+        else:
+            raise ValueError(f"Unknown column {table}.{item}")
+    return list(dict.fromkeys(columns)), embeds
+
+
+def _decode(row):
+    row = dict(row)
+    for column in ("embedding", "centroid"):
+        if isinstance(row.get(column), bytes):
+            row[column] = array("f", row[column]).tolist()
+    return row
+
+
+def _encode_embedding(vector):
+    return array("f", vector).tobytes()
+
+
+class SqliteStore:
+    def __init__(self, path="noogie.db"):
+        self.path = path
+        self.stats = QueryStats()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # databases created before topics (server/sql/006) lack clusters.topic_id
+            if "topic_id" not in {row["name"] for row in conn.execute("pragma table_info(clusters)")}:
+                conn.execute("alter table clusters add column topic_id integer "
+                             "references topics (topic_id) on delete set null")
+            conn.execute("create index if not exists clusters_topic_id_idx on clusters (topic_id, cluster_id)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("pragma journal_mode = wal")
+            conn.execute("pragma synchronous = normal")
+            conn.execute("pragma foreign_keys = on")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, name, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return self._connect().execute(sql, params).fetchall()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.record(name, elapsed)
+            logger.debug("query %s took %.1fms", name, elapsed * 1000)
+
+    def _select(self, name, table, select, where="", params=(), order=None, limit=None):
+        """Run a select with PostgREST-style column / embed syntax and return dicts."""
+        columns, embeds = parse_select(table, select)
+        # join columns are fetched for embedding and dropped again if not asked for
+        extra = [RELATIONS[(table, other)][0] for other in embeds
+                 if RELATIONS[(table, other)][0] not in columns]
+        sql = f"select {', '.join(columns + extra)} from {table}"
+        if where:
+            sql += f" where {where}"
+        if order:
+            sql += f" order by {order}"
+        if limit is not None:
+            sql += f" limit {int(limit)}"
+        rows = [_decode(row) for row in self._execute(name, sql, params)]
+
+        for other, other_columns in embeds.items():
+            key, many = RELATIONS[(table, other)]
+            keys = list({row[key] for row in rows if row[key] is not None})
+            related = {}
+            for batch in chunks(keys, IN_BATCH_SIZE):
+                for child in self._select(f"{name}_{other}", other, ", ".join(dict.fromkeys(other_columns + [key])),
+                                          f"{key} in ({', '.join('?' * len(batch))})", batch,
+                                          order=COLUMNS[other][0]):
+                    if many:
+                        related.setdefault(child[key], []).append(child)
+                    else:
+                        related[child[key]] = child
+            for row in rows:
+                found = related.get(row[key], [] if many else None)
+                if key not in other_columns:
+                    for child in (found if many else [found] if found else []):
+                        child.pop(key, None)
+                row[other] = found
+        for row in rows:
+            for column in extra:
+                row.pop(column, None)
+        return rows
+
+    # --- reads ---
+
+    def list_clusters(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None, since=None, until=None,
+                      topic_id=None):
+        where, params = self._filters(topic_id=topic_id, since=since, until=until)
+        return self._page('list_clusters', 'clusters', select, 'cluster_id', limit, cursor, where, params)
+
+    def list_articles(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None,
+                      cluster_id=None, source=None, since=None, until=None):
+        where, params = self._filters(cluster_id=cluster_id, source=source, since=since, until=until)
+        return self._page('list_articles', 'articles', select, 'article_id', limit, cursor, where, params)
+
+    @staticmethod
+    def _filters(cluster_id=None, source=None, since=None, until=None, topic_id=None):
+        where = []
+        params = []
+        if cluster_id is not None:
+            where.append("cluster_id = ?")
+            params.append(cluster_id)
+        if topic_id is not None:
+            where.append("topic_id = ?")
+            params.append(topic_id)
+        if source:
+            where.append("source = ?")
+            params.append(source)
+        if since:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until:
+            where.append("created_at < ?")
+            params.append(until)
+        return where, params
+
+    def _page(self, name, table, select, key, limit, cursor, where=(), params=()):
+        where = list(where)
+        params = list(params)
+        if cursor is not None:
+            where.append(f"{key} > ?")
+            params.append(cursor)
+        rows = self._select(name, table, select, " and ".join(where), params, order=key, limit=limit + 1)
+        return split_page(rows, key, limit)
+
+    def fetch_all(self, table, select, key):
+        rows = []
+        cursor = None
+        while True:
+            page, cursor = self._page(f'fetch_all_{table}', table, select, key, MAX_PAGE_SIZE, cursor)
+            rows.extend(page)
+            if cursor is None:
+                return rows
+
+    def _first(self, name, table, select, key, value):
+        rows = self._select(name, table, select, f"{key} = ?", [value])
+        return rows[0] if rows else None
+
+    def list_topics(self, select="*", limit=DEFAULT_PAGE_SIZE, cursor=None):
+        return self._page('list_topics', 'topics', select, 'topic_id', limit, cursor)
+
+    def get_topic(self, topic_id, select="*"):
+        return self._first('get_topic', 'topics', select, 'topic_id', topic_id)
+
+    def get_cluster(self, cluster_id, select="*"):
+        return self._first('get_cluster', 'clusters', select, 'cluster_id', cluster_id)
+
+    def get_cluster_with_articles(self, cluster_id):
+        return self._first('get_cluster_with_articles', 'clusters', "*, articles(*)", 'cluster_id', cluster_id)
+
+    def get_article(self, article_id, select="*"):
+        return self._first('get_article', 'articles', select, 'article_id', article_id)
+
+    def get_clusters(self, cluster_ids, select="*"):
+        return self._get_many('clusters', 'cluster_id', cluster_ids, select)
+
+    def get_articles(self, article_ids, select="*"):
+        return self._get_many('articles', 'article_id', article_ids, select)
+
+    def get_embeddings(self, article_ids, select="*"):
+        return self._get_many('article_embeddings', 'article_id', article_ids, select)
+
+    def _get_many(self, table, key, ids, select):
+        rows = []
+        for batch in chunks(list(dict.fromkeys(ids)), IN_BATCH_SIZE):
+            rows.extend(self._select(f'get_many_{table}', table, select,
+                                     f"{key} in ({', '.join('?' * len(batch))})", batch))
+        return rows
+
+    def existing_titles(self, titles):
+        found = set()
+        for batch in chunks(list(dict.fromkeys(titles)), IN_BATCH_SIZE):
+            rows = self._execute('existing_titles',
+                                 f"select title from articles where title in ({', '.join('?' * len(batch))})", batch)
+            found.update(row["title"] for row in rows)
+        return found
+
+    def existing_urls(self, urls):
+        found = set()
+        for batch in chunks(list(dict.fromkeys(urls)), IN_BATCH_SIZE):
+            rows = self._execute('existing_urls',
+                                 f"select url from articles where url in ({', '.join('?' * len(batch))})", batch)
+            found.update(row["url"] for row in rows)
+        return found
+
+    def article_exists(self, title):
+        return bool(self.existing_titles([title]))
+
+    def search_articles(self, query, limit=20):
+        """
+        BM25-ranked full-text search through the FTS5 index, with the same
+        query semantics as search.SearchIndex (terms OR-ed, last term as a prefix).
+
+        Returns:
+            Tuple of (results, total matches)
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0
+        match = " OR ".join([f'"{t}"' for t in terms[:-1]] + [f'"{terms[-1]}"*'])
+        weights = ", ".join(str(float(w)) for w in FIELD_WEIGHTS.values())
+        rows = self._execute('search_articles', f"""
+            select a.article_id, a.cluster_id, a.title, a.source, -bm25(articles_fts, {weights}) as score
+            from articles_fts join articles a on a.article_id = articles_fts.rowid
+            where articles_fts match ?
+            order by score desc
+            limit ?""", (match, limit))
+        total = self._execute('search_articles_count',
+                              "select count(*) from articles_fts where articles_fts match ?", (match,))[0][0]
+        return [dict(row, score=round(row["score"], 4)) for row in rows], total
+
+    # --- writes ---
+
+    def _insert(self, conn, table, row):
+        row = {k: v for k, v in row.items() if k in COLUMNS[table]}
+        sql = (f"insert into {table} ({', '.join(row)}) values ({', '.join('?' * len(row))}) "
+               f"returning {', '.join(COLUMNS[table])}")
+        return dict(conn.execute(sql, list(row.values())).fetchone())
+
+    def insert_cluster(self, row):
+        with self._connect() as conn:
+            return self._insert(conn, 'clusters', row)
+
+    def insert_articles(self, rows):
+        with self._connect() as conn:
+            return [self._insert(conn, 'articles', row) for row in rows]
+
+    def update_row(self, table, key, row_id, values):
+        """
+        Raises:
+            Conflict: if the update would duplicate a unique key
+        """
+        values = {k: v for k, v in values.items() if k in COLUMNS[table]}
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(f"update {table} set {assignments} where {key} = ? returning *",
+                                    [*values.values(), row_id]).fetchall()
+        except sqlite3.IntegrityError as e:
+            raise Conflict(str(e))
+        return [_decode(row) for row in rows]
+
+    def _write_articles(self, conn, cluster_id, articles):
+        """Insert articles (and embeddings) whose content_hash is new; returns the inserted rows."""
+        created = []
+        for article in articles:
+            if conn.execute("select 1 from articles where content_hash = ?", (article['content_hash'],)).fetchone():
+                continue
+            row = self._insert(conn, 'articles', dict(article, cluster_id=cluster_id))
+            if article.get('embedding') is not None:
+                conn.execute("insert into article_embeddings (article_id, embedding) values (?, ?)",
+                             (row['article_id'], _encode_embedding(article['embedding'])))
+                row['embedding'] = article['embedding']
+            created.append(row)
+        return created
+
+    def ingest_bulk(self, batches):
+        """
+        Python counterpart of the ingest_bulk SQL function: the whole payload
+        is written in one transaction, skipping clusters and articles whose
+        fingerprint / content_hash (or supplied cluster_id) already exist.
+        """
+        start = time.perf_counter()
+        clusters = []
+        articles = []
+        try:
+            with self._connect() as conn:
+                for batch in batches:
+                    cluster = batch['cluster']
+                    existing = conn.execute("select * from clusters where fingerprint = ?",
+                                            (cluster['fingerprint'],)).fetchone()
+                    if existing is None and cluster.get('cluster_id') is not None:
+                        # a supplied id that is already taken: skip the insert, as ON CONFLICT DO NOTHING does
+                        existing = conn.execute("select * from clusters where cluster_id = ?",
+                                                (cluster['cluster_id'],)).fetchone()
+                    row = dict(existing) if existing else self._insert(conn, 'clusters', cluster)
+                    clusters.append(dict(row, created=existing is None, submitted_articles=len(batch['articles'])))
+                    articles.extend(self._write_articles(conn, row['cluster_id'], batch['articles']))
+        finally:
+            self.stats.record('ingest_bulk', time.perf_counter() - start)
+        return {"clusters": clusters, "articles": sorted(articles, key=lambda a: a['article_id'])}
+
+    def add_articles_to_cluster(self, cluster_id, rows):
+        """
+        Raises:
+            NotFound: if the cluster does not exist
+        """
+        start = time.perf_counter()
+        try:
+            with self._connect() as conn:
+                if not conn.execute("select 1 from clusters where cluster_id = ?", (cluster_id,)).fetchone():
+                    raise NotFound(f"Cluster {cluster_id} not found")
+                return self._write_articles(conn, cluster_id, rows)
+        finally:
+            self.stats.record('add_articles_to_cluster', time.perf_counter() - start)
+
+    def save_embeddings(self, embeddings):
+        with self._connect() as conn:
+            conn.executemany("insert or replace into article_embeddings (article_id, embedding) values (?, ?)",
+                             [(article_id, _encode_embedding(v)) for article_id, v in embeddings.items()])
+
+    def save_topics(self, topics, assignments, replace=False):
+        """Python counterpart of the save_topics SQL function, in one transaction."""
+        with self._connect() as conn:
+            conn.executemany(
+                "insert into topics (topic_id, topic_title, cluster_count, article_count, centroid) "
+                "values (?, ?, ?, ?, ?) on conflict (topic_id) do update set "
+                "topic_title = excluded.topic_title, cluster_count = excluded.cluster_count, "
+                "article_count = excluded.article_count, centroid = excluded.centroid",
+                [(t['topic_id'], t.get('topic_title'), t.get('cluster_count', 0), t.get('article_count', 0),
+                  _encode_embedding(t['centroid'])) for t in topics])
+            conn.executemany("update clusters set topic_id = ? where cluster_id = ?",
+                             [(topic_id, cluster_id) for cluster_id, topic_id in assignments.items()])
+            if replace:
+                keep = [t['topic_id'] for t in topics]
+                conn.execute(f"delete from topics where topic_id not in ({', '.join('?' * len(keep))})", keep)
+
+    # --- change log ---
+
+    def record_change(self, cluster_ids, article_ids):
+        with self._connect() as conn:
+            return conn.execute("insert into changes (cluster_ids, article_ids) values (?, ?) returning version",
+                                (json.dumps(cluster_ids), json.dumps(article_ids))).fetchone()[0]
+
+    def ping(self):
+        self._execute('ping', "select 1")
+
+    def latest_change_version(self):
+        return self._execute('latest_change_version', "select coalesce(max(version), 0) from changes")[0][0]
+
+    def changes_since(self, version, limit=MAX_PAGE_SIZE):
+        rows = self._execute('changes_since',
+                             "select version, cluster_ids, article_ids from changes where version > ? "
+                             "order by version limit ?", (version, limit))
+        return [{"version": row["version"], "cluster_ids": json.loads(row["cluster_ids"]),
+                 "article_ids": json.loads(row["article_ids"])} for row in rows]
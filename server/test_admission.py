@@ -0,0 +1,148 @@
+import asyncio
+import threading
+
+import pytest
+from flask import Flask
+
+from admission import Admission, Gate, TokenBuckets, parse_rate
+from params import article_route_class
+
+
+def test_parse_rate():
+    assert parse_rate("50/100") == (50.0, 100.0)
+    assert parse_rate("2") == (2.0, 2.0)
+    assert parse_rate("0.5") == (0.5, 1.0)
+    assert parse_rate("off") is None and parse_rate("0") is None
+    with pytest.raises(ValueError):
+        parse_rate("-1/5")
+
+
+def test_token_bucket_allows_a_burst_then_reports_the_wait(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("admission.time.monotonic", lambda: now[0])
+    buckets = TokenBuckets(rate=2, burst=3)
+    assert [buckets.take("a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("a") == pytest.approx(0.5)
+    # other clients have buckets of their own
+    assert buckets.take("b") == 0
+    now[0] += 0.5
+    assert buckets.take("a") == 0
+
+
+def test_token_buckets_evict_the_least_recently_used():
+    buckets = TokenBuckets(rate=1, burst=1, max_buckets=2)
+    for key in ("a", "b", "c"):
+        buckets.take(key)
+    assert buckets.take("a") == 0
+    assert buckets.take("c") > 0
+
+
+def test_gate_fails_fast_when_full():
+    gate = Gate(slots=1, wait=0.01)
+    assert gate.acquire()
+    assert not gate.acquire()
+    assert gate.rejected == 1
+    gate.release()
+    assert gate.acquire()
+
+
+def limited_app(admission, route_class="write"):
+    app = Flask(__name__)
+    entered = threading.Event()
+    release = threading.Event()
+
+    @app.route("/slow")
+    @admission.limit(route_class)
+    @admission.gate(route_class)
+    def slow():
+        entered.set()
+        release.wait(5)
+        return "ok"
+
+    @app.route("/fast")
+    @admission.limit(route_class)
+    def fast():
+        return "ok"
+
+    return app, entered, release
+
+
+def test_limit_answers_429_with_retry_after():
+    app, _, _ = limited_app(Admission(rates={"write": (1, 2)}))
+    client = app.test_client()
+    assert [client.get("/fast").status_code for _ in range(3)] == [200, 200, 429]
+    response = client.get("/fast")
+    assert response.headers["Retry-After"] == "1"
+    assert response.get_json() == {"error": "Rate limit exceeded"}
+
+
+def test_gate_answers_503_while_the_slots_are_taken():
+    admission = Admission(slots={"write": 1}, wait=0.01)
+    app, entered, release = limited_app(admission)
+    first = threading.Thread(target=app.test_client().get, args=("/slow",))
+    first.start()
+    assert entered.wait(5)
+    response = app.test_client().get("/slow")
+    release.set()
+    first.join()
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+    assert admission.gauges()['noogie_admission_rejected_total{class="write"}'] == 1
+
+
+def test_from_env_defaults_fit_the_uploader(monkeypatch):
+    import transform_and_upload
+    for name in ("RATE_LIMIT_BULK", "RATE_LIMIT_WRITE", "BULK_CONCURRENCY", "ADMISSION_CONTROL"):
+        monkeypatch.delenv(name, raising=False)
+    admission = Admission.from_env()
+    assert admission.enabled
+    assert transform_and_upload.UPLOAD_PARALLELISM <= admission.gates["bulk"].slots
+    assert transform_and_upload.UPLOAD_RATE <= admission.limits["bulk"].rate
+    assert transform_and_upload.UPLOAD_RATE <= admission.limits["write"].rate
+
+
+def test_disabled_admission_lets_everything_through():
+    app, _, _ = limited_app(Admission(rates={"write": (1, 1)}, enabled=False))
+    client = app.test_client()
+    assert {client.get("/fast").status_code for _ in range(5)} == {200}
+
+
+def test_async_gate_fails_fast_when_full():
+    gate = Gate(1, wait=0.01)
+
+    async def run():
+        assert await gate.acquire_async()
+        assert not await gate.acquire_async()
+        gate.release()
+        return await gate.acquire_async()
+
+    assert asyncio.run(run())
+    assert gate.rejected == 1
+
+
+def test_only_article_lists_with_text_are_expensive():
+    assert article_route_class({}) == "expensive"
+    assert article_route_class({"fields": "article_id, text"}) == "expensive"
+    assert article_route_class({"fields": "article_id,title,source"}) == "cheap"
+
+
+def test_asgi_middleware_answers_429(monkeypatch):
+    pytest.importorskip("starlette")
+    pytest.importorskip("faiss")
+    from starlette.testclient import TestClient
+
+    import asgi
+
+    class Store:
+        async def get_articles(self, ids, select):
+            return []
+
+    monkeypatch.setattr(asgi, "store", Store())
+    monkeypatch.setattr(asgi, "admission", Admission(rates={"cheap": (1, 2), "expensive": (1, 1)}))
+    client = TestClient(asgi.app)
+    statuses = [client.get("/api/articles?ids=1&fields=article_id,title").status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    # full text is the expensive class, with a bucket of its own
+    assert client.get("/api/articles?ids=1").status_code == 200
+    response = client.get("/api/articles?ids=1")
+    assert response.status_code == 429 and response.headers["Retry-After"] == "1"
+    assert client.get("/server").status_code == 200
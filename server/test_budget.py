@@ -0,0 +1,27 @@
+import time
+
+from budget import Deadline, RunBudget, SourceDeadline
+
+
+def test_stages_leave_the_later_stages_their_share():
+    budget = RunBudget(seconds=100)
+    assert budget.stage("naming").at == budget.deadline.at
+    assert budget.stage("cluster").at == budget.deadline.at - 10
+    assert budget.stage("rss").at < budget.stage("newspaper").at < budget.stage("summaries").at
+
+
+def test_a_source_deadline_starts_with_its_first_request():
+    stage = Deadline.after(60)
+    clock = SourceDeadline(stage, seconds=0.05)
+    time.sleep(0.1)
+    # queued work did not use up the source's time
+    deadline = clock.start()
+    assert not deadline.expired() and clock.start() is deadline and not clock.timed_out()
+    time.sleep(0.1)
+    assert clock.timed_out()
+
+
+def test_a_source_stopped_by_the_stage_did_not_time_out():
+    clock = SourceDeadline(Deadline.after(0), seconds=60)
+    assert clock.start().expired()
+    assert not clock.timed_out()
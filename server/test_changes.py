@@ -0,0 +1,70 @@
+import threading
+
+from cache import ResponseCache
+from changes import ChangeFeed, changed_ids
+from conftest import make_batch
+from ingest import clean_bulk, write_batches
+from writer import write_clusters
+
+
+def test_changed_ids_counts_clusters_that_gained_articles():
+    results = [
+        {"cluster": {"cluster_id": 1}, "created": True, "articles": [{"article_id": 1}]},
+        {"cluster": {"cluster_id": 2}, "created": False, "articles": [{"article_id": 2}]},
+        {"cluster": {"cluster_id": 3}, "created": False, "articles": []},
+    ]
+    assert changed_ids(results) == ([1, 2], [1, 2])
+
+
+def test_changes_since_returns_rows_added_after_a_version(store):
+    feed = ChangeFeed(store)
+    assert feed.version == 0
+    first = feed.record(*changed_ids(write_batches(store, clean_bulk([make_batch("Storm", 2)]))))
+    second = feed.record(*changed_ids(write_batches(store, clean_bulk([make_batch("Flood", 1)]))))
+    assert feed.record([], []) is None
+
+    changes = feed.changes_since(first)
+    assert changes["version"] == second and not changes["has_more"]
+    assert [c["cluster_title"] for c in changes["clusters"]] == ["Flood"]
+    assert [a["title"] for a in changes["articles"]] == ["Flood article 0"]
+    assert "text" not in changes["articles"][0]
+    assert feed.changes_since(second)["clusters"] == []
+
+
+def test_changes_since_pages_whole_entries(store):
+    feed = ChangeFeed(store)
+    for i in range(3):
+        feed.record(*changed_ids(write_batches(store, clean_bulk([make_batch(f"Story {i}", 2)]))))
+    page = feed.changes_since(0, max_rows=3)
+    # the second entry would take the articles past max_rows, so it waits for the next call
+    assert page["has_more"] and page["version"] == 1 and len(page["articles"]) == 2
+    rest = feed.changes_since(page["version"], max_rows=3)
+    assert rest["version"] == 2 and rest["has_more"]
+
+
+def test_writer_records_each_chunk_and_watch_reports_it(store):
+    feed = ChangeFeed(store, poll_interval=0.05)
+    seen = []
+    done = threading.Event()
+
+    def callback(cluster_ids, article_ids):
+        seen.extend(article_ids)
+        if len(seen) == 3:
+            done.set()
+
+    feed.watch(callback)
+    # written without the feed, as the pipeline's direct writes are
+    results, summary = write_clusters(store, [make_batch("Storm", 2), make_batch("Flood", 1)], chunk_size=1)
+    assert summary["total_articles_created"] == 3
+    assert store.latest_change_version() == 2
+    assert done.wait(5)
+    assert seen == [a["article_id"] for r in results for a in r["articles"]]
+
+
+def test_writer_invalidates_the_cache_once_per_write(store):
+    cache = ResponseCache()
+    write_clusters(store, [make_batch("Storm", 2), make_batch("Flood", 1)], chunk_size=1, cache=cache)
+    assert cache.version == 2
+    # nothing new to write
+    write_clusters(store, [make_batch("Storm", 2)], cache=cache)
+    assert cache.version == 2
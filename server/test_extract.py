@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+pytest.importorskip("newspaper")
+
+from extract import MIN_TEXT_LENGTH, extract, selector_for
+from extract_eval import FIXTURES_DIR, compare_fixtures, load_fixtures
+
+BODY = "The storm made landfall overnight and thousands are without power. " * 5
+
+
+def page(ld=None, body=""):
+    script = f'<script type="application/ld+json">{json.dumps(ld)}</script>' if ld else ""
+    return f"<html><head><title>Page title</title>{script}</head><body><h1>Storm hits coast</h1>{body}</body></html>"
+
+
+def test_json_ld_article_body():
+    title, text, method = extract(page({"@type": "NewsArticle", "headline": "Storm hits", "articleBody": BODY}),
+                                  "https://example.com/a")
+    assert (title, method) == ("Storm hits", "json-ld")
+    assert text == BODY.strip() and len(text) >= MIN_TEXT_LENGTH
+
+
+def test_html_article_body_is_reduced_to_text():
+    ld = {"@type": "NewsArticle", "headline": "Storm hits", "articleBody": f"<p>{BODY}</p><p>More.</p>"}
+    _, text, method = extract(page(ld), "https://example.com/a")
+    assert method == "json-ld" and "<p>" not in text and text.endswith("More.")
+
+
+@pytest.mark.parametrize("article_body", [
+    "</  ",  # parses to an empty document
+    '<?xml version="1.0" encoding="utf-8"?><p>x</p>',  # lxml refuses str input with an encoding declaration
+])
+def test_unparseable_html_article_body_falls_through(article_body):
+    ld = {"@type": "NewsArticle", "headline": "Storm hits", "articleBody": article_body}
+    assert extract(page(ld), "https://example.com/a") is None
+
+
+def test_unparseable_article_body_falls_back_to_the_outlet_selector():
+    url = "https://www.cnn.com/2025/01/01/storm"
+    assert selector_for(url)
+    ld = {"@type": "NewsArticle", "headline": "Storm hits", "articleBody": "</  "}
+    body = f'<div class="article__content"><p class="paragraph">{BODY}</p></div>'
+    title, text, method = extract(page(ld, body), url)
+    assert (title, method) == ("Storm hits", "selector")
+    assert text == BODY.strip()
+
+
+def test_short_pages_return_none():
+    assert extract(page({"@type": "NewsArticle", "articleBody": "Too short."}), "https://example.com/a") is None
+    assert extract("", "https://example.com/a") is None
+
+
+def test_fixture_pages_match_their_references_at_least_as_well_as_newspaper():
+    fixtures = list(load_fixtures(FIXTURES_DIR))
+    assert fixtures and all(reference for _, _, _, reference in fixtures)
+    report = compare_fixtures(FIXTURES_DIR, repeat=1)
+    for host, scores in report.items():
+        assert scores["title_match_rate"] == 1.0, host
+        assert scores["mean_f1"] >= max(0.95, scores["newspaper_f1"]), host
+    # every outlet with selectors is parsed without newspaper
+    assert report["all"]["methods"].get("newspaper", 0) == sum(
+        1 for _, url, _, _ in fixtures if not selector_for(url))
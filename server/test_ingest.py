@@ -0,0 +1,74 @@
+import pytest
+
+from conftest import make_batch
+from ingest import (ValidationError, clean_batch, clean_bulk, cluster_fingerprint, content_hash, dedupe,
+                    normalize_url, summarize, write_batches)
+
+
+@pytest.mark.parametrize("payload, message", [
+    ({"clusters": []}, "clusters must be a list"),
+    ([{"cluster": {}, "articles": []}], "Cluster 1 missing required cluster data"),
+    ([make_batch("ok"), {"cluster": {"cluster_summary": "s"}, "articles": [{"title": "t"}]}],
+     "Cluster 2, Article 1 missing required fields"),
+    ([{"cluster": {"cluster_summary": "s"}, "articles": [{"title": "t", "text": "x", "embedding": [1.0]}]}],
+     "embedding must be a list of 384 numbers"),
+])
+def test_clean_bulk_rejects_malformed_payloads(payload, message):
+    with pytest.raises(ValidationError, match=message):
+        clean_bulk(payload)
+
+
+def test_normalize_url_drops_scheme_www_tracking_and_trailing_slash():
+    assert normalize_url("https://www.Example.com/a/b/?utm_source=x&id=2&fbclid=y#top") == "example.com/a/b?id=2"
+    assert normalize_url("http://example.com/a/b") == normalize_url("https://www.example.com/a/b/")
+    assert normalize_url(None) == ""
+
+
+def test_content_hash_ignores_whitespace_and_case_of_the_text():
+    assert content_hash("https://example.com/a", "Some  story\ntext") == \
+        content_hash("https://www.example.com/a/", "some story text")
+    assert content_hash("https://example.com/a", "text") != content_hash("https://example.com/b", "text")
+
+
+def test_cluster_fingerprint_is_order_insensitive_and_falls_back_to_the_summary():
+    assert cluster_fingerprint(["b", "a"]) == cluster_fingerprint(["a", "b", "a"])
+    assert cluster_fingerprint([], "One") == cluster_fingerprint([], " one ")
+    assert cluster_fingerprint([], "One") != cluster_fingerprint([], "Two")
+
+
+def test_clean_batch_keys_articles_and_cluster():
+    batch = clean_batch(make_batch("Storm"))
+    hashes = [a["content_hash"] for a in batch["articles"]]
+    assert len(set(hashes)) == 2
+    assert batch["cluster"]["fingerprint"] == cluster_fingerprint(hashes)
+
+
+def test_dedupe_drops_repeats_within_a_payload():
+    batch = clean_batch(make_batch("Storm"))
+    other = clean_batch(make_batch("Flood"))
+    other["articles"].append(batch["articles"][0])
+    unique = dedupe([batch, batch, other])
+    assert [b["cluster"]["fingerprint"] for b in unique] == [batch["cluster"]["fingerprint"],
+                                                             other["cluster"]["fingerprint"]]
+    assert len(unique[1]["articles"]) == 2
+
+
+def test_write_batches_is_idempotent(store):
+    batches = clean_bulk([make_batch("Storm", 3), make_batch("Flood", 2)])
+    first = summarize(write_batches(store, batches))
+    assert first == {"total_clusters_created": 2, "total_clusters_unchanged": 0,
+                     "total_articles_created": 5, "total_articles_unchanged": 0}
+
+    again = summarize(write_batches(store, clean_bulk([make_batch("Storm", 3), make_batch("Flood", 2)])))
+    assert again == {"total_clusters_created": 0, "total_clusters_unchanged": 2,
+                     "total_articles_created": 0, "total_articles_unchanged": 5}
+    assert len(store.fetch_all("articles", "article_id", "article_id")) == 5
+
+
+def test_write_batches_adds_only_the_new_articles_of_a_grown_cluster(store):
+    write_batches(store, clean_bulk([make_batch("Storm", 2)]))
+    results = write_batches(store, clean_bulk([make_batch("Storm", 3)]))
+    # three articles make a different fingerprint, so this is a new cluster holding only the new article
+    assert [r["created"] for r in results] == [True]
+    assert [a["title"] for a in results[0]["articles"]] == ["Storm article 2"]
+    assert results[0]["articles_unchanged"] == 2
@@ -0,0 +1,108 @@
+import pytest
+
+import jobqueue
+from jobqueue import JobQueue
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("jobqueue.time.time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / "jobs.db"), lease_seconds=10, max_attempts=2)
+    queue.create_batch("b1")
+    return queue
+
+
+def test_enqueue_is_unique_per_batch_kind_and_key(queue):
+    assert queue.enqueue_many("b1", "article", [("u1", {"url": "u1"}), ("u2", {"url": "u2"})]) == 2
+    assert queue.enqueue_many("b1", "article", [("u1", {"url": "u1"})]) == 0
+    assert queue.pending("b1") == 2
+
+
+def test_lease_complete_and_lost_lease(queue, clock):
+    queue.enqueue_many("b1", "feed", [("cnn", {"url": "x"})])
+    job = queue.lease("w1")
+    assert job["payload"] == {"url": "x"} and job["attempts"] == 1
+    assert queue.lease("w2") is None
+
+    # the lease runs out and another worker takes the job over
+    clock[0] += 11
+    retaken = queue.lease("w2")
+    assert retaken["job_id"] == job["job_id"] and retaken["attempts"] == 2
+    assert not queue.heartbeat(job, "w1")
+    assert not queue.complete(job, "w1")
+    assert queue.complete(retaken, "w2")
+    assert queue.counts("b1") == {"feed": {"done": 1}}
+
+
+def test_heartbeat_keeps_the_lease(queue, clock):
+    queue.enqueue_many("b1", "feed", [("cnn", {})])
+    job = queue.lease("w1")
+    clock[0] += 8
+    assert queue.heartbeat(job, "w1")
+    clock[0] += 8
+    assert queue.lease("w2") is None
+
+
+def test_failed_jobs_back_off_then_stay_failed(queue, clock):
+    queue.enqueue_many("b1", "article", [("u1", {})])
+    queue.fail(queue.lease("w1"), "w1", "timeout")
+    assert queue.lease("w1") is None
+    clock[0] += jobqueue.RETRY_BACKOFF
+    job = queue.lease("w1")
+    assert job["attempts"] == 2
+    queue.fail(job, "w1", "timeout again")
+    assert queue.job_status("b1", ["article"]) == {("article", "u1"): ("failed", "timeout again")}
+    assert queue.pending("b1") == 0
+
+
+def test_expired_lease_on_the_last_attempt_fails(queue, clock):
+    queue.enqueue_many("b1", "article", [("u1", {})])
+    queue.lease("w1")
+    clock[0] += 11
+    queue.lease("w2")
+    clock[0] += 11
+    assert queue.lease("w3") is None
+    assert queue.job_status("b1", ["article"])[("article", "u1")] == ("failed", "lease expired")
+
+
+def test_cancel_and_kinds(queue):
+    queue.enqueue_many("b1", "feed", [("cnn", {})])
+    queue.enqueue_many("b1", "summarize", [("0", {})])
+    assert queue.lease("w1", kinds=["summarize"])["kind"] == "summarize"
+    assert queue.cancel("b1", ["feed"]) == 1
+    assert queue.pending("b1", ["feed"]) == 0
+
+
+def test_staging_is_unique_per_url_and_title(queue):
+    assert queue.stage_article("b1", "CNN", "Title", "https://a", "text")
+    assert not queue.stage_article("b1", "CNN", "Title", "https://b", "text")
+    assert not queue.stage_article("b1", "BBC", "Other", "https://a", "text")
+    article_id = queue.unsummarized("b1")[0]
+    queue.set_summaries([(article_id, "summary", [0.5] * 4)])
+    assert [(row["summary"], row["embedding"]) for row in queue.iter_staged("b1")] == [("summary", [0.5] * 4)]
+
+
+def test_a_second_host_is_refused_while_the_first_is_active(tmp_path, clock, monkeypatch):
+    path = str(tmp_path / "jobs.db")
+    first = JobQueue(path, lease_seconds=10)
+    monkeypatch.setattr("jobqueue.socket.gethostname", lambda: "other-host")
+    with pytest.raises(RuntimeError, match="in use by host"):
+        JobQueue(path, lease_seconds=10)
+
+    # once the first host has been idle for a lease period the queue can move
+    clock[0] += 11
+    JobQueue(path, lease_seconds=10)
+    with pytest.raises(RuntimeError, match="taken over"):
+        first.lease("w1")
+
+
+def test_network_filesystems_are_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr("jobqueue.filesystem_type", lambda path: "nfs4")
+    with pytest.raises(RuntimeError, match="local disk"):
+        JobQueue(str(tmp_path / "jobs.db"))
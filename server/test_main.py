@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("apscheduler")
+
+import main
+
+
+@pytest.fixture
+def runs(tmp_path, monkeypatch):
+    """Record main.py's subprocess commands; the scraper step writes RAWDATA_PATH unless told not to."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("INGEST_MODE", raising=False)
+    commands = []
+    outputs = {"write": True, "paths": []}
+
+    def run(command, env=None, **kwargs):
+        script = command[1]
+        commands.append([script, *command[2:]])
+        path = env["RAWDATA_PATH"]
+        outputs["paths"].append(path)
+        if script in ("app.py", "coordinator.py") and outputs["write"]:
+            with open(path, "w") as f:
+                f.write("{}")
+        if script == "transform_and_upload.py":
+            with open(path) as f:
+                assert f.read() == "{}"
+        return subprocess.CompletedProcess(command, 0)
+
+    monkeypatch.setattr(main.subprocess, "run", run)
+    return commands, outputs, tmp_path
+
+
+def test_direct_upload_flow(runs):
+    commands, outputs, directory = runs
+    # the rawdata.json kept in the repo is neither read nor removed
+    (directory / "rawdata.json").write_text('{"kept": true}')
+    main.main()
+    assert commands == [["app.py"], ["transform_and_upload.py", "--direct"], ["topics.py"]]
+    assert len(set(outputs["paths"])) == 1
+    assert not os.path.exists(outputs["paths"][0])
+    assert (directory / "rawdata.json").read_text() == '{"kept": true}'
+
+
+def test_queue_mode_runs_the_coordinator(runs, monkeypatch):
+    commands, _, _ = runs
+    monkeypatch.setenv("INGEST_MODE", "queue")
+    monkeypatch.setenv("INGEST_WORKERS", "2")
+    main.main()
+    assert commands[0] == ["coordinator.py", "--workers", "2"]
+    assert commands[1] == ["transform_and_upload.py", "--direct"]
+
+
+def test_stops_when_rawdata_was_not_written(runs):
+    commands, outputs, directory = runs
+    # a file from an earlier run must not be uploaded again
+    (directory / "rawdata.json").write_text('{"stale": true}')
+    outputs["write"] = False
+    with pytest.raises(SystemExit) as exit_info:
+        main.main()
+    assert exit_info.value.code == 1
+    assert commands == [["app.py"]]
+
+
+def test_uses_the_running_interpreter(runs, monkeypatch):
+    seen = []
+    monkeypatch.setattr(main.subprocess, "run",
+                        lambda command, **kwargs: seen.append(command[0]) or subprocess.CompletedProcess(command, 1))
+    with pytest.raises(SystemExit):
+        main.main()
+    assert seen == [sys.executable]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+pytest.importorskip("newspaper")
+
+from budget import Deadline
+from pipeline import cluster_labels, encode_within, leader_labels
+
+
+class Model:
+    def __init__(self, deadline=None):
+        self.calls = 0
+        self.deadline = deadline
+
+    def encode(self, texts):
+        self.calls += 1
+        if self.deadline:
+            self.deadline.at = 0
+        return np.ones((len(texts), 4))
+
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+
+def vectors(seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(3, 8)) * 5
+    return np.concatenate([centre + 0.05 * rng.normal(size=(4, 8)) for centre in centres])
+
+
+def test_encode_stops_at_the_deadline():
+    model = Model()
+    assert encode_within(model, ["a"] * 5, Deadline.after(60), batch_size=2).shape == (5, 4)
+    assert model.calls == 3
+    # the deadline passes during the first batch
+    deadline = Deadline.after(60)
+    assert encode_within(Model(deadline), ["a"] * 5, deadline, batch_size=2).shape == (2, 4)
+    assert encode_within(Model(), ["a"] * 5, Deadline.after(0)).shape == (0, 4)
+
+
+def test_clustering_within_the_deadline_matches_the_unbounded_one():
+    data = vectors()
+    labels = cluster_labels(data, Deadline.after(60))
+    assert list(labels) == list(cluster_labels(data))
+    assert len(set(labels)) == 3
+
+
+def test_clustering_falls_back_to_leaders_once_the_deadline_passes():
+    data = vectors()
+    labels = cluster_labels(data, Deadline.after(0))
+    assert list(labels) == list(leader_labels(data)) == [0] * 4 + [1] * 4 + [2] * 4
@@ -0,0 +1,48 @@
+from search import SearchIndex, tokenize
+
+ARTICLES = [
+    {"article_id": 1, "cluster_id": 1, "title": "Volcano erupts in Iceland", "article_summary": "Lava flows.",
+     "text": "Ash closes airports.", "source": "BBC"},
+    {"article_id": 2, "cluster_id": 1, "title": "Airports reopen", "article_summary": "Flights resume.",
+     "text": "The volcano is quiet again after the eruption.", "source": "CNN"},
+    {"article_id": 3, "cluster_id": 2, "title": "Election results", "article_summary": "Votes counted.",
+     "text": "Turnout was high.", "source": "NPR"},
+]
+
+
+def index(articles=ARTICLES):
+    search_index = SearchIndex()
+    search_index.add_articles(articles)
+    return search_index
+
+
+def test_tokenize_lowercases_splits_and_drops_stopwords():
+    assert tokenize("Volcano-erupts, IN the Iceland!") == ["volcano", "erupts", "iceland"]
+
+
+def test_bm25_ranks_title_matches_above_text_matches():
+    results, total = index().search("volcano")
+    assert total == 2
+    assert [r["article_id"] for r in results] == [1, 2]
+    assert results[0]["score"] > results[1]["score"] > 0
+    assert results[0]["source"] == "BBC" and results[0]["cluster_id"] == 1
+
+
+def test_more_matching_terms_rank_higher():
+    results, _ = index().search("airports volcano")
+    assert {r["article_id"] for r in results} == {1, 2}
+    results, _ = index().search("election volcano")
+    assert {r["article_id"] for r in results} == {1, 2, 3}
+
+
+def test_last_term_matches_as_prefix():
+    assert index().search("elect")[1] == 1
+    assert index().search("elect", prefix=False)[1] == 0
+    assert index().search("")[0] == []
+
+
+def test_adding_articles_is_incremental_and_skips_known_ones():
+    search_index = index(ARTICLES[:2])
+    assert search_index.add_articles(ARTICLES) == 1
+    assert len(search_index) == 3
+    assert search_index.search("election", limit=1)[0][0]["article_id"] == 3
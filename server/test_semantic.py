@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from semantic import SemanticIndex, embedding_rows
+
+DIM = 16
+
+
+def articles(n_clusters, per_cluster, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for c in range(n_clusters):
+        centre = rng.normal(size=DIM)
+        for i in range(per_cluster):
+            rows.append({"article_id": len(rows) + 1, "cluster_id": c + 1, "title": f"c{c} a{i}", "source": "CNN",
+                         "embedding": (centre + 0.05 * rng.normal(size=DIM)).tolist()})
+    return rows
+
+
+def test_search_returns_nearest_first():
+    index = SemanticIndex(dim=DIM)
+    rows = articles(3, 4)
+    assert index.add_articles(rows) == 12
+    assert index.add_articles(rows) == 0
+    results = index.search(rows[0]["embedding"], k=4)
+    assert results[0]["article_id"] == 1 and results[0]["score"] == pytest.approx(1.0, abs=1e-4)
+    assert {r["cluster_id"] for r in results} == {1}
+
+
+def test_related_skips_the_article_and_its_cluster():
+    index = SemanticIndex(dim=DIM)
+    index.add_articles(articles(3, 4))
+    related = index.related(1, k=5)
+    assert len(related) == 5
+    assert all(r["cluster_id"] != 1 for r in related)
+    same = index.related(1, k=3, same_cluster=True)
+    assert {r["cluster_id"] for r in same} == {1} and 1 not in {r["article_id"] for r in same}
+    assert index.related(999) is None
+
+
+def test_related_finds_every_article_from_other_clusters_behind_a_large_cluster():
+    # one big cluster crowds the neighbourhood; the search has to widen to fill k
+    index = SemanticIndex(dim=DIM)
+    rows = articles(1, 200) + articles(6, 5, seed=1)
+    for i, row in enumerate(rows):
+        row["article_id"] = i + 1
+        row["cluster_id"] = row["cluster_id"] if i < 200 else row["cluster_id"] + 1
+    index.add_articles(rows)
+    related = index.related(1, k=50)
+    assert len(related) == 30
+    assert len({r["article_id"] for r in related}) == 30
+
+
+def test_embedding_rows_flattens_the_join():
+    rows = [{"article_id": 1, "embedding": [0.0], "articles": {"cluster_id": 2, "title": "t", "source": "s"}}]
+    assert embedding_rows(rows) == [{"cluster_id": 2, "title": "t", "source": "s", "article_id": 1,
+                                     "embedding": [0.0]}]
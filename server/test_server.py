@@ -0,0 +1,111 @@
+import sys
+import threading
+
+from conftest import make_batch
+
+
+def post_bulk(client, *batches):
+    response = client.post("/api/data/bulk", json={"clusters": list(batches)})
+    # reads get the previous snapshot until the new one is loaded in the background
+    sys.modules["server"].get_data_snapshot(fresh=True)
+    return response
+
+
+def test_invalid_payload_writes_nothing(client, server):
+    before = server.cache.version
+    response = post_bulk(client, make_batch("Server valid", 1), {"cluster": {}, "articles": []})
+    assert response.status_code == 400
+    assert "Cluster 2" in response.get_json()["error"]
+    assert server.cache.version == before
+    search = client.get("/api/search?q=valid").get_json()
+    assert all("Server valid" not in r["title"] for r in search["results"])
+
+
+def test_list_pages_follow_the_cursor(client):
+    post_bulk(client, *[make_batch(f"Server page {i}", 2) for i in range(6)])
+    seen = []
+    url = "/api/articles?limit=5&fields=article_id,title"
+    cursor = None
+    while True:
+        body = client.get(url + (f"&cursor={cursor}" if cursor else "")).get_json()
+        seen.extend(row["article_id"] for row in body["articles"])
+        cursor = body.get("next_cursor")
+        if not cursor:
+            break
+    assert seen == sorted(set(seen)) and len(seen) >= 12
+    assert client.get("/api/articles?limit=0").status_code == 400
+
+
+def test_missing_rows_are_404(client):
+    assert client.get("/api/clusters/999999").status_code == 404
+    assert client.get("/api/articles/999999").status_code == 404
+
+
+def test_reads_are_cached_with_etags_until_a_write(client):
+    first = client.get("/api/clusters?limit=5")
+    etag = first.headers["ETag"]
+    assert first.headers["X-Cache"] == "MISS"
+    assert client.get("/api/clusters?limit=5").headers["X-Cache"] == "HIT"
+    assert client.get("/api/clusters?limit=5", headers={"If-None-Match": etag}).status_code == 304
+
+    post_bulk(client, make_batch("Server cache", 1))
+    after = client.get("/api/clusters?limit=5", headers={"If-None-Match": etag})
+    assert after.status_code == 200 and after.headers["ETag"] != etag
+
+
+def test_bulk_upload_is_idempotent(client):
+    response = post_bulk(client, make_batch("Server storm", 2), make_batch("Server flood", 1))
+    assert response.status_code == 201
+    summary = response.get_json()["summary"]
+    assert (summary["total_clusters_created"], summary["total_articles_created"]) == (2, 3)
+
+    again = post_bulk(client, make_batch("Server storm", 2), make_batch("Server flood", 1))
+    assert again.status_code == 200
+    summary = again.get_json()["summary"]
+    assert (summary["total_clusters_created"], summary["total_articles_unchanged"]) == (0, 3)
+
+
+def test_search_sees_new_articles(client):
+    post_bulk(client, make_batch("Server quake", 1))
+    results = client.get("/api/search?q=quake").get_json()["results"]
+    assert [r["title"] for r in results] == ["Server quake article 0"]
+
+
+def test_changes_report_new_articles(client):
+    version = client.get("/api/changes?since=0").get_json()["version"]
+    post_bulk(client, make_batch("Server tremor", 1))
+    changes = client.get(f"/api/changes?since={version}").get_json()
+    assert [a["title"] for a in changes["articles"]] == ["Server tremor article 0"]
+
+
+def test_malformed_time_bounds_are_400(client):
+    response = client.get("/api/articles?fields=article_id&since=yesterday")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "since must be an ISO date or timestamp"
+    assert client.get("/api/clusters?until=2025-13-01").status_code == 400
+    assert client.get("/api/clusters?since=2025-01-01&until=2025-01-02T00:00:00Z").status_code == 200
+
+
+def test_reads_during_a_snapshot_reload_get_the_previous_snapshot(client, server, monkeypatch):
+    post_bulk(client, make_batch("Server before", 1))
+    loading, release = threading.Event(), threading.Event()
+    load = server.Snapshot.load
+
+    def slow_load(store):
+        loading.set()
+        release.wait(5)
+        return load(store)
+
+    monkeypatch.setattr(server.Snapshot, "load", slow_load)
+    client.post("/api/data/bulk", json={"clusters": [make_batch("Server during", 1)]})
+    assert loading.wait(5)
+    try:
+        response = client.get("/api/clusters?fields=cluster_title&limit=100")
+        assert response.status_code == 200 and response.headers["Cache-Control"] == "no-store"
+        titles = [c["cluster_title"] for c in response.get_json()["clusters"]]
+        assert "Server before" in titles and "Server during" not in titles
+    finally:
+        release.set()
+    server.get_data_snapshot(fresh=True)
+    response = client.get("/api/clusters?fields=cluster_title&limit=100")
+    assert "Server during" in [c["cluster_title"] for c in response.get_json()["clusters"]]
@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import make_batch
+from ingest import clean_bulk, write_batches
+from snapshot import Snapshot
+
+ARTICLE_SELECT = "article_id, cluster_id, title, source"
+
+
+@pytest.fixture
+def seeded(store):
+    write_batches(store, clean_bulk([make_batch(f"Story {i}", 1 + i % 4) for i in range(12)]))
+    return store, Snapshot.load(store)
+
+
+def pages(reader, method, **kwargs):
+    rows, cursor = [], None
+    while True:
+        page, cursor = getattr(reader, method)(cursor=cursor, **kwargs)
+        rows.extend(page)
+        if cursor is None:
+            return rows
+
+
+@pytest.mark.parametrize("filters", [{}, {"source": "BBC"}, {"source": "Nowhere"}, {"cluster_id": 3},
+                                     {"cluster_id": 3, "source": "CNN"}, {"cluster_id": 10_000}])
+def test_article_pages_match_the_database(seeded, filters):
+    store, snapshot = seeded
+    assert pages(snapshot, "list_articles", select=ARTICLE_SELECT, limit=5, **filters) == \
+        pages(store, "list_articles", select=ARTICLE_SELECT, limit=5, **filters)
+
+
+def test_cluster_pages_and_lookups_match_the_database(seeded):
+    store, snapshot = seeded
+    select = "cluster_id, cluster_title, cluster_summary"
+    assert pages(snapshot, "list_clusters", select=select, limit=4) == \
+        pages(store, "list_clusters", select=select, limit=4)
+    # lookups by id come back in request order from the snapshot and in id order from the database
+    assert snapshot.get_clusters([5, 2, 99], select) == store.get_clusters([5, 2, 99], select)[::-1]
+    assert snapshot.get_articles([7, 1], ARTICLE_SELECT) == store.get_articles([7, 1], ARTICLE_SELECT)[::-1]
+    assert snapshot.get_cluster(10_000) is None
+
+
+def test_article_text_is_not_covered(seeded):
+    _, snapshot = seeded
+    assert snapshot.covers("articles", "article_id, title")
+    assert not snapshot.covers("articles", "*")
+    assert not snapshot.covers("articles", "article_id, text")
+    assert snapshot.covers("clusters", "*")
+
+
+def test_sparse_ids_and_id_zero():
+    clusters = [{"cluster_id": 0, "cluster_title": "zero", "topic_id": 0},
+                {"cluster_id": 10**12, "cluster_title": "far", "topic_id": None}]
+    articles = [{"article_id": 2**40, "cluster_id": 0, "title": "a"},
+                {"article_id": 3, "cluster_id": 10**12, "title": "b"},
+                {"article_id": 5, "cluster_id": None, "title": "c"}]
+    snapshot = Snapshot(clusters, articles)
+    assert snapshot.get_clusters([10**12, 0, 7], "cluster_id, topic_id") == \
+        [{"cluster_id": 10**12, "topic_id": None}, {"cluster_id": 0, "topic_id": 0}]
+    assert snapshot.list_clusters("cluster_id", topic_id=0)[0] == [{"cluster_id": 0}]
+    assert snapshot.list_articles("article_id, cluster_id", cluster_id=0)[0] == \
+        [{"article_id": 2**40, "cluster_id": 0}]
+    assert snapshot.get_articles([5, 2**40, 4], "article_id, cluster_id") == \
+        [{"article_id": 5, "cluster_id": None}, {"article_id": 2**40, "cluster_id": 0}]
@@ -0,0 +1,102 @@
+import pytest
+
+from conftest import make_batch
+from db import NotFound
+from ingest import clean_bulk, group_results, write_batches
+from sqlite_store import SqliteStore
+
+
+def seed(store, clusters=7, articles=3):
+    return write_batches(store, clean_bulk([make_batch(f"Story {i}", articles) for i in range(clusters)]))
+
+
+def test_schema_is_created_and_reopened(tmp_path):
+    path = str(tmp_path / "noogie.db")
+    seed(SqliteStore(path), clusters=1)
+    assert len(SqliteStore(path).fetch_all("clusters", "cluster_id", "cluster_id")) == 1
+
+
+def test_ingest_bulk_skips_existing_fingerprints_and_content_hashes(store):
+    batches = clean_bulk([make_batch("Storm", 2)])
+    written = store.ingest_bulk(batches)
+    assert [c["created"] for c in written["clusters"]] == [True]
+    assert len(written["articles"]) == 2
+
+    again = store.ingest_bulk(clean_bulk([make_batch("Storm", 2)]))
+    assert [(c["created"], c["submitted_articles"]) for c in again["clusters"]] == [(False, 2)]
+    assert again["articles"] == []
+    assert again["clusters"][0]["cluster_id"] == written["clusters"][0]["cluster_id"]
+
+
+def test_ingest_bulk_reuses_a_supplied_cluster_id_that_already_exists(store):
+    cluster_id = seed(store, clusters=1)[0]["cluster"]["cluster_id"]
+    written = store.ingest_bulk(clean_bulk([make_batch("Other", 1, cluster_id=cluster_id)]))
+    assert written["clusters"][0]["cluster_id"] == cluster_id
+    assert written["clusters"][0]["created"] is False
+    assert [a["cluster_id"] for a in written["articles"]] == [cluster_id]
+    result = group_results(written)[0]
+    assert result["created"] is False and result["articles_count"] == 1
+    assert len(store.fetch_all("clusters", "cluster_id", "cluster_id")) == 1
+
+
+def test_ingest_bulk_stores_embeddings(store):
+    written = store.ingest_bulk(clean_bulk([make_batch("Storm", 2, embedding=lambda i: [float(i + 1)] * 384)]))
+    ids = [a["article_id"] for a in written["articles"]]
+    rows = store.get_embeddings(ids, "article_id, embedding")
+    assert sorted(row["embedding"][0] for row in rows) == [1.0, 2.0]
+
+
+def test_keyset_pagination_visits_every_row_once(store):
+    seed(store)
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = store.list_articles("article_id, title", limit=4, cursor=cursor)
+        assert len(page) <= 4
+        seen.extend(row["article_id"] for row in page)
+        if cursor is None:
+            break
+    assert seen == sorted(seen) == sorted(set(seen))
+    assert len(seen) == 21
+
+
+def test_list_filters_and_embedded_selects(store):
+    results = seed(store)
+    cluster_id = results[2]["cluster"]["cluster_id"]
+    page, cursor = store.list_articles("article_id, cluster_id", cluster_id=cluster_id)
+    assert cursor is None and {row["cluster_id"] for row in page} == {cluster_id}
+    page, _ = store.list_articles("article_id, source", source="BBC")
+    assert page and {row["source"] for row in page} == {"BBC"}
+
+    cluster = store.get_cluster_with_articles(cluster_id)
+    assert cluster["cluster_title"] == "Story 2"
+    assert len(cluster["articles"]) == 3
+    assert store.get_cluster(10_000) is None
+
+
+def test_add_articles_to_missing_cluster(store):
+    with pytest.raises(NotFound):
+        store.add_articles_to_cluster(10_000, [])
+
+
+def test_full_text_search_ranks_title_matches_first(store):
+    seed(store, clusters=3)
+    store.ingest_bulk(clean_bulk([{
+        "cluster": {"cluster_summary": "Volcano"},
+        "articles": [{"title": "Volcano erupts", "text": "Lava flows.", "url": "https://example.com/v1"},
+                     {"title": "Weather", "text": "A volcano nearby is quiet.", "url": "https://example.com/v2"}],
+    }]))
+    results, total = store.search_articles("volcano")
+    assert total == 2
+    assert [r["title"] for r in results] == ["Volcano erupts", "Weather"]
+    # the last term also matches as a prefix
+    assert store.search_articles("volc")[1] == 2
+    assert store.search_articles("") == ([], 0)
+
+
+def test_change_log_versions(store):
+    assert store.latest_change_version() == 0
+    first = store.record_change([1], [1, 2])
+    second = store.record_change([2], [3])
+    assert store.latest_change_version() == second > first
+    assert store.changes_since(first) == [{"version": second, "cluster_ids": [2], "article_ids": [3]}]
@@ -0,0 +1,198 @@
+"""
+Topic tree: a coarser clustering level over the clusters.
+
+Topics contain clusters, which contain articles, so a client can draw a few
+dozen topic nodes first and load a topic's clusters (/api/topics/<id>/clusters)
+and a cluster's articles only when they are expanded. The first payload then
+stays the same size however many clusters are stored.
+
+A cluster's centroid is the normalised mean of its articles' embeddings
+(article_embeddings). A rebuild groups all centroids into TOPIC_COUNT topics
+with k-means, weighting each cluster by its article count, and names each
+topic after the member cluster nearest its centre. Between rebuilds, each run
+assigns clusters that have no topic yet to the nearest topic centre, so topic
+ids stay stable while the pipeline adds clusters. A run rebuilds anyway when
+there are no topics yet, or when the embedded articles of clusters waiting for
+a topic outnumber the placed ones by TOPIC_REBUILD_GROWTH (the corpus has
+outgrown the tree).
+Rebuilt topics get new ids; old ones are deleted.
+
+Clusters without any embedded article stay outside the tree until they are
+embedded (python semantic.py --backfill). main.py runs this after each upload.
+
+    python topics.py              # assign new clusters (or rebuild when due)
+    python topics.py --rebuild    # regroup every cluster
+    python topics.py --rebuild --count 40
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+TOPIC_COUNT = int(os.getenv("TOPIC_COUNT", "30"))
+TOPIC_REBUILD_GROWTH = float(os.getenv("TOPIC_REBUILD_GROWTH", "1.0"))
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def cluster_centroids(store, article_clusters, cluster_ids=None):
+    """
+    Normalised mean embedding per cluster.
+
+    Args:
+        store: db.Store or sqlite_store.SqliteStore
+        article_clusters: {article_id: cluster_id}
+        cluster_ids: only these clusters (default: every cluster, read from the whole table)
+
+    Returns:
+        Tuple of (cluster ids, centroid matrix, article counts), clusters with no embedding left out
+    """
+    if cluster_ids is None:
+        rows = store.fetch_all('article_embeddings', "article_id, embedding", 'article_id')
+    else:
+        wanted = set(cluster_ids)
+        rows = store.get_embeddings([a for a, c in article_clusters.items() if c in wanted],
+                                    "article_id, embedding")
+    sums = {}
+    counts = Counter()
+    for row in rows:
+        cluster_id = article_clusters.get(row['article_id'])
+        if cluster_id is None or not row.get('embedding'):
+            continue
+        vector = np.asarray(row['embedding'], dtype=np.float32)
+        sums[cluster_id] = sums[cluster_id] + vector if cluster_id in sums else vector
+        counts[cluster_id] += 1
+    ids = sorted(sums)
+    if not ids:
+        return [], np.zeros((0, 0), dtype=np.float32), np.zeros(0)
+    centroids = _normalize(np.stack([sums[c] / counts[c] for c in ids]))
+    return ids, centroids, np.array([counts[c] for c in ids], dtype=np.float64)
+
+
+def group_clusters(centroids, weights, count):
+    """
+    k-means over cluster centroids.
+
+    Returns:
+        Tuple of (topic label per cluster, normalised topic centres)
+    """
+    count = min(count, len(centroids))
+    kmeans = KMeans(n_clusters=count, n_init=4, random_state=0)
+    labels = kmeans.fit_predict(centroids, sample_weight=weights)
+    return labels, _normalize(kmeans.cluster_centers_.astype(np.float32))
+
+
+def topic_rows(topic_ids, centres, topic_titles, members, article_counts):
+    """
+    Topic rows for save_topics().
+
+    Args:
+        topic_ids: id per topic centre
+        centres: normalised topic centres
+        topic_titles: {topic_id: title}
+        members: {topic_id: [cluster_id, ...]}
+        article_counts: {cluster_id: articles in the cluster}
+    """
+    return [{
+        'topic_id': topic_id,
+        'topic_title': topic_titles.get(topic_id),
+        'cluster_count': len(members.get(topic_id, [])),
+        'article_count': sum(article_counts.get(c, 0) for c in members.get(topic_id, [])),
+        'centroid': centre.tolist(),
+    } for topic_id, centre in zip(topic_ids, centres)]
+
+
+def build_topics(store, count=TOPIC_COUNT, rebuild=False):
+    """
+    Rebuild the topic tree, or assign clusters without a topic to the nearest one.
+
+    Args:
+        store: db.Store or sqlite_store.SqliteStore
+        count: topics in a rebuild
+        rebuild: regroup every cluster even if the tree is not due for a rebuild
+
+    Returns:
+        Dict with "rebuilt", "topics" and "assigned" (clusters whose topic changed)
+    """
+    clusters = store.fetch_all('clusters', "cluster_id, cluster_title, topic_id", 'cluster_id')
+    article_clusters = {row['article_id']: row['cluster_id']
+                        for row in store.fetch_all('articles', "article_id, cluster_id", 'article_id')
+                        if row['cluster_id'] is not None}
+    article_counts = Counter(article_clusters.values())
+    current = {c['cluster_id']: c['topic_id'] for c in clusters}
+    topics = store.fetch_all('topics', "topic_id, topic_title, centroid", 'topic_id')
+
+    # clusters without embeddings cannot be placed, so they do not count towards a rebuild either
+    unassigned = [c for c, topic_id in current.items() if topic_id is None]
+    cluster_ids, centroids, weights = cluster_centroids(store, article_clusters, unassigned)
+    old_articles = sum(article_counts[c] for c, topic_id in current.items() if topic_id is not None)
+    rebuild = rebuild or not topics or float(weights.sum()) > TOPIC_REBUILD_GROWTH * old_articles
+
+    if rebuild:
+        cluster_ids, centroids, weights = cluster_centroids(store, article_clusters)
+        if not cluster_ids:
+            return {"rebuilt": False, "topics": 0, "assigned": 0}
+        labels, centres = group_clusters(centroids, weights, count)
+        # new ids never reuse old ones, so a client holding an old id gets a 404, not another topic
+        first_id = max((t['topic_id'] for t in topics), default=0) + 1
+        topic_ids = [first_id + i for i in range(len(centres))]
+        assignments = {c: topic_ids[label] for c, label in zip(cluster_ids, labels)}
+        # each topic is named after its member cluster nearest the centre
+        similarity = np.einsum('ij,ij->i', centroids, centres[labels])
+        titles = {c['cluster_id']: c['cluster_title'] for c in clusters}
+        topic_titles = {}
+        for label in range(len(centres)):
+            in_topic = np.flatnonzero(labels == label)
+            if len(in_topic):
+                topic_titles[topic_ids[label]] = titles.get(cluster_ids[in_topic[similarity[in_topic].argmax()]])
+        placed = assignments
+    else:
+        topic_ids = [t['topic_id'] for t in topics]
+        centres = np.array([t['centroid'] for t in topics], dtype=np.float32)
+        assignments = {}
+        if cluster_ids:
+            nearest = (centroids @ centres.T).argmax(axis=1)
+            assignments = {c: topic_ids[i] for c, i in zip(cluster_ids, nearest)}
+        topic_titles = {t['topic_id']: t['topic_title'] for t in topics}
+        placed = {c: t for c, t in current.items() if t is not None}
+        placed.update(assignments)
+
+    members = {}
+    for cluster_id, topic_id in placed.items():
+        members.setdefault(topic_id, []).append(cluster_id)
+    rows = topic_rows(topic_ids, centres, topic_titles, members, article_counts)
+    changed = [c for c, topic_id in assignments.items() if current.get(c) != topic_id]
+    store.save_topics(rows, assignments, replace=rebuild)
+    if changed:
+        # running servers drop cached pages and reload their snapshot
+        store.record_change(changed, [])
+    return {"rebuilt": rebuild, "topics": len(rows), "assigned": len(changed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="regroup every cluster into new topics")
+    parser.add_argument("--count", type=int, default=TOPIC_COUNT, help="topics in a rebuild (TOPIC_COUNT)")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from db import create_store
+
+    load_dotenv()
+    start = time.perf_counter()
+    result = build_topics(create_store(), args.count, args.rebuild)
+    action = "Rebuilt" if result["rebuilt"] else "Updated"
+    print(f"{action} {result['topics']} topics, {result['assigned']} clusters assigned "
+          f"in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
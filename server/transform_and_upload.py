@@ -1,9 +1,66 @@
+import hashlib
 import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Any
 
 # Configuration
-API_BASE_URL = "http://localhost:5000"
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:5000")
+# largest request body the chunked uploader sends (a single bigger cluster goes alone)
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(2 * 1024 * 1024)))
+# chunks in flight at once; at most BULK_CONCURRENCY, or the server answers 503
+UPLOAD_PARALLELISM = int(os.getenv("UPLOAD_PARALLELISM", "4"))
+# requests sent per second (0 for unpaced); at most the rate of RATE_LIMIT_BULK and
+# RATE_LIMIT_WRITE, or the server answers 429
+UPLOAD_RATE = float(os.getenv("UPLOAD_RATE", "2"))
+UPLOAD_RETRIES = int(os.getenv("UPLOAD_RETRIES", "5"))
+UPLOAD_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT", "120"))
+UPLOAD_CHECKPOINT = os.getenv("UPLOAD_CHECKPOINT", "upload_checkpoint.json")
+# the pipeline output to upload (main.py sets it to the run's temporary file)
+RAWDATA_PATH = os.getenv("RAWDATA_PATH", "rawdata.json")
+# statuses worth retrying: rate limited, server busy or failing
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+
+def create_session(pool_size=UPLOAD_PARALLELISM):
+    """A keep-alive session whose connection pool fits pool_size concurrent uploads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class RequestPacer:
+    """Spaces requests, across threads, at most rate per second apart."""
+
+    def __init__(self, rate=UPLOAD_RATE):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        """Block until the next request may be sent."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(start - now)
+
+
+_session = create_session()
+_pacer = RequestPacer()
 
 def transform_raw_data(raw_data):
     transformed_clusters = []
@@ -26,18 +83,25 @@ def transform_raw_data(raw_data):
                 "article_summary": article["article_summary"],
                 "source": article["source"]
             }
+            # used with the text to key the article for idempotent uploads
+            if article.get("url"):
+                article_data["url"] = article["url"]
+            # MiniLM embedding from app.py, for semantic search and related articles
+            if article.get("embedding"):
+                article_data["embedding"] = article["embedding"]
             cluster_info["articles"].append(article_data)
         
         transformed_clusters.append(cluster_info)
     
     return transformed_clusters
 
-def upload_single_cluster(cluster_data):
+def upload_single_cluster(cluster_data, session=None):
     """
     Upload a single cluster with its articles using the batch endpoint.
     
     Args:
         cluster_data: Dictionary containing cluster and articles data
+        session: requests session to send it on (default: the shared pooled session)
         
     Returns:
         Response from the API
@@ -45,10 +109,12 @@ def upload_single_cluster(cluster_data):
     endpoint = f"{API_BASE_URL}/api/clusters/batch"
     
     try:
-        response = requests.post(
+        _pacer.wait()
+        response = (session or _session).post(
             endpoint,
             json=cluster_data,
-            headers={"Content-Type": "application/json"}
+            headers={"Content-Type": "application/json"},
+            timeout=UPLOAD_TIMEOUT
         )
         response.raise_for_status()
         return response.json()
@@ -58,12 +124,13 @@ def upload_single_cluster(cluster_data):
             print(f"Response: {e.response.text}")
         raise
 
-def upload_all_clusters_bulk(clusters_data):
+def upload_all_clusters_bulk(clusters_data, session=None):
     """
     Upload all clusters at once using the bulk endpoint.
     
     Args:
         clusters_data: List of cluster dictionaries
+        session: requests session to send it on (default: the shared pooled session)
         
     Returns:
         Response from the API
@@ -75,10 +142,12 @@ def upload_all_clusters_bulk(clusters_data):
     }
     
     try:
-        response = requests.post(
+        _pacer.wait()
+        response = (session or _session).post(
             endpoint,
             json=payload,
-            headers={"Content-Type": "application/json"}
+            headers={"Content-Type": "application/json"},
+            timeout=UPLOAD_TIMEOUT
         )
         response.raise_for_status()
         return response.json()
@@ -88,6 +157,193 @@ def upload_all_clusters_bulk(clusters_data):
             print(f"Response: {e.response.text}")
         raise
 
+def chunk_clusters(clusters_data, max_bytes=UPLOAD_CHUNK_BYTES):
+    """
+    Pack clusters, in order, into chunks whose JSON body stays under max_bytes.
+
+    Chunking is deterministic, so the same data and max_bytes always give the
+    same chunks; the upload checkpoint relies on that.
+
+    Args:
+        clusters_data: List of cluster dictionaries
+        max_bytes: Largest serialised chunk; a cluster bigger than this is sent alone
+
+    Returns:
+        List of lists of clusters
+    """
+    chunks = []
+    current = []
+    size = 0
+    for cluster in clusters_data:
+        # +1 for the separating comma inside the "clusters" array
+        cluster_size = len(json.dumps(cluster).encode("utf-8")) + 1
+        if current and size + cluster_size > max_bytes:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(cluster)
+        size += cluster_size
+    if current:
+        chunks.append(current)
+    return chunks
+
+def chunk_digest(chunk):
+    """Content hash identifying a chunk in the checkpoint."""
+    return hashlib.sha256(json.dumps(chunk, sort_keys=True).encode("utf-8")).hexdigest()
+
+class UploadCheckpoint:
+    """
+    Digests of the chunks the server has acknowledged, saved to a JSON file
+    after every acknowledgement so an interrupted upload resumes where it left off.
+    """
+
+    def __init__(self, path=UPLOAD_CHECKPOINT):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.done = set(json.load(f).get("acknowledged", []))
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Ignoring unreadable checkpoint {path}: {e}")
+
+    def acknowledge(self, digest):
+        with self._lock:
+            self.done.add(digest)
+            if not self.path:
+                return
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"acknowledged": sorted(self.done)}, f)
+            os.replace(tmp, self.path)
+
+    def clear(self):
+        with self._lock:
+            self.done = set()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+def _retry_delay(attempt, response=None):
+    """Seconds to wait before retry number attempt: Retry-After if given, else exponential backoff with jitter."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+def upload_chunk(session, chunk, retries=UPLOAD_RETRIES):
+    """
+    Upload one chunk to the bulk endpoint, retrying network errors, 429 and 5xx.
+
+    Uploads are idempotent on the server (clusters are fingerprinted and
+    articles keyed by URL and text), so resending a chunk whose response was
+    lost does not duplicate anything.
+
+    Args:
+        session: requests session
+        chunk: List of cluster dictionaries
+        retries: Retries after the first attempt
+
+    Returns:
+        The API's JSON response
+
+    Raises:
+        requests.exceptions.RequestException: once retries are exhausted, or at once for other 4xx
+    """
+    endpoint = f"{API_BASE_URL}/api/data/bulk"
+    for attempt in range(retries + 1):
+        response = None
+        try:
+            _pacer.wait()
+            response = session.post(endpoint, json={"clusters": chunk}, timeout=UPLOAD_TIMEOUT)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response.json()
+            error = requests.exceptions.HTTPError(f"{response.status_code} from {endpoint}", response=response)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+        if attempt == retries:
+            raise error
+        time.sleep(_retry_delay(attempt, response))
+
+def upload_all_clusters_chunked(clusters_data, parallelism=UPLOAD_PARALLELISM, max_bytes=UPLOAD_CHUNK_BYTES,
+                                checkpoint=None, session=None):
+    """
+    Upload clusters as size-bounded chunks sent concurrently, skipping chunks a
+    previous run already got acknowledged.
+
+    Args:
+        clusters_data: List of cluster dictionaries
+        parallelism: Chunks in flight at once
+        max_bytes: Largest chunk body
+        checkpoint: UploadCheckpoint to resume from and record into (default: none)
+        session: requests session (default: a pooled session sized for parallelism)
+
+    Returns:
+        Dictionary with the summed server summary, chunk counts and failed chunk errors
+    """
+    session = session or create_session(parallelism)
+    checkpoint = checkpoint or UploadCheckpoint(path=None)
+    chunks = [(chunk_digest(chunk), chunk) for chunk in chunk_clusters(clusters_data, max_bytes)]
+    pending = [(digest, chunk) for digest, chunk in chunks if digest not in checkpoint.done]
+
+    totals = {
+        "total_clusters_created": 0,
+        "total_articles_created": 0,
+        "total_clusters_unchanged": 0,
+        "total_articles_unchanged": 0,
+    }
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(parallelism, 1)) as pool:
+        futures = {pool.submit(upload_chunk, session, chunk): (i, digest)
+                   for i, (digest, chunk) in enumerate(pending)}
+        for future in as_completed(futures):
+            i, digest = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed.append({"chunk": i, "error": str(e)})
+                print(f"  Chunk {i + 1}/{len(pending)} failed: {e}")
+                continue
+            checkpoint.acknowledge(digest)
+            for key in totals:
+                totals[key] += result.get("summary", {}).get(key, 0)
+
+    return {
+        "summary": totals,
+        "chunks": len(chunks),
+        "skipped": len(chunks) - len(pending),
+        "uploaded": len(pending) - len(failed),
+        "failed": failed,
+    }
+
+def write_direct(clusters_data):
+    """
+    Write clusters straight to the storage backend (STORAGE_BACKEND, see db.py)
+    without going through the API server, using the same validation and
+    idempotent writes as /api/data/bulk. With REDIS_URL set, the servers'
+    shared response cache is invalidated once the rows are written.
+
+    Args:
+        clusters_data: List of cluster dictionaries
+
+    Returns:
+        summarize() totals of what was created and what already existed
+
+    Raises:
+        ingest.ValidationError: if any cluster or article is invalid
+    """
+    from dotenv import load_dotenv
+    from cache import ResponseCache
+    from db import create_store
+    from writer import write_clusters
+
+    load_dotenv()
+    redis_url = os.getenv("REDIS_URL")
+    cache = ResponseCache(redis_url=redis_url) if redis_url else None
+    _, summary = write_clusters(create_store(), clusters_data, cache=cache)
+    return summary
+
 def check_server_health():
     """
     Check if the server is running and accessible.
@@ -96,7 +352,7 @@ def check_server_health():
         True if server is healthy, False otherwise
     """
     try:
-        response = requests.get(f"{API_BASE_URL}/health")
+        response = _session.get(f"{API_BASE_URL}/health", timeout=10)
         return response.status_code == 200
     except requests.exceptions.RequestException:
         return False
@@ -104,28 +360,35 @@ def check_server_health():
 def main():
     """
     Main function to execute the data transformation and upload process.
+
+    With --direct, the data is written straight to the database and the API
+    server does not need to be running.
     """
+    direct = "--direct" in sys.argv
+
     # Check server health first
     print("Checking server health...")
-    if not check_server_health():
+    if direct:
+        print("Skipped: writing directly to the database\n")
+    elif not check_server_health():
         print("Server is not accessible. Please ensure the Flask server is running.")
         print(f"   Server URL: {API_BASE_URL}")
         return
-    
-    print("Server is healthy\n")
+    else:
+        print("Server is healthy\n")
     
     # Load the raw data from file
     print("Loading raw data from file...")
     try:
-        with open('rawdata.json', 'r', encoding='utf-8') as f:
+        with open(RAWDATA_PATH, 'r', encoding='utf-8') as f:
             raw_data = json.load(f)
         print(f"Loaded data for {len(raw_data)} clusters\n")
     except FileNotFoundError:
-        print("rawdata.json file not found. Please ensure the file exists in the current directory.")
-        return
+        print(f"{RAWDATA_PATH} not found. Please ensure the file exists.")
+        sys.exit(1)
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON file: {e}")
-        return
+        sys.exit(1)
     
     # Transform the data
     print("Transforming data...")
@@ -135,15 +398,51 @@ def main():
     # Calculate total articles
     total_articles = sum(len(cluster['articles']) for cluster in transformed_clusters)
     print(f"Total articles to upload: {total_articles}\n")
+
+    if direct:
+        print("Writing to the database...")
+        start = time.perf_counter()
+        try:
+            summary = write_direct(transformed_clusters)
+        except Exception as e:
+            print(f"\nError writing to the database: {e}")
+            sys.exit(1)
+        print(f"\nWrote to the database in {time.perf_counter() - start:.1f}s")
+        print(f"   - Clusters created: {summary['total_clusters_created']}")
+        print(f"   - Articles created: {summary['total_articles_created']}")
+        print(f"   - Unchanged: {summary['total_clusters_unchanged']} clusters, "
+              f"{summary['total_articles_unchanged']} articles")
+        return
     
     # Ask user for upload method
     print("Choose upload method:")
     print("1. Upload all clusters at once (bulk upload)")
     print("2. Upload clusters one by one")
+    print(f"3. Upload in chunks of up to {UPLOAD_CHUNK_BYTES // 1024} KB, {UPLOAD_PARALLELISM} at a time "
+          f"and {UPLOAD_RATE:g} per second, "
+          f"resuming from {UPLOAD_CHECKPOINT}")
     
-    choice = input("\nEnter your choice (1 or 2): ").strip()
+    choice = input("\nEnter your choice (1, 2 or 3): ").strip()
     
-    if choice == '1':
+    if choice == '3':
+        print("\nStarting chunked upload...")
+        checkpoint = UploadCheckpoint()
+        start = time.perf_counter()
+        outcome = upload_all_clusters_chunked(transformed_clusters, checkpoint=checkpoint)
+        elapsed = time.perf_counter() - start
+        summary = outcome["summary"]
+        print(f"\nUploaded {outcome['uploaded']} of {outcome['chunks']} chunks in {elapsed:.1f}s "
+              f"({outcome['skipped']} already acknowledged, {len(outcome['failed'])} failed)")
+        print(f"   - Clusters created: {summary['total_clusters_created']}")
+        print(f"   - Articles created: {summary['total_articles_created']}")
+        print(f"   - Unchanged: {summary['total_clusters_unchanged']} clusters, "
+              f"{summary['total_articles_unchanged']} articles")
+        if outcome["failed"]:
+            print("\nRun again to retry the failed chunks.")
+        else:
+            checkpoint.clear()
+
+    elif choice == '1':
         # Bulk upload
         print("\nStarting bulk upload...")
         try:
@@ -153,6 +452,8 @@ def main():
                 print(f"\nBulk upload successful!")
                 print(f"   - Clusters created: {result['summary']['total_clusters_created']}")
                 print(f"   - Articles created: {result['summary']['total_articles_created']}")
+                print(f"   - Unchanged: {result['summary']['total_clusters_unchanged']} clusters, "
+                      f"{result['summary']['total_articles_unchanged']} articles")
                 print(f"   - Message: {result['message']}")
             else:
                 print(f"\nBulk upload failed: {result.get('error')}")
@@ -192,7 +493,7 @@ def main():
         print(f"Failed: {failed_uploads}/{len(transformed_clusters)}")
         
     else:
-        print("\nInvalid choice. Please run the script again and choose 1 or 2.")
+        print("\nInvalid choice. Please run the script again and choose 1, 2 or 3.")
         return
     
     print("\nProcess completed!")
@@ -0,0 +1,216 @@
+"""
+Pre-download URL filter for the pipeline's newspaper sources (app.py).
+
+newspaper.build collects every link on an outlet's homepage and fetch_news
+downloads all of them, although most are section fronts, videos, live blogs or
+articles we already stored. UrlFilter decides from the URL alone, before any
+download, and drops:
+
+- seen: URLs that already have an article in the database (articles.url), or
+  that an earlier run downloaded and discarded as too short (SEEN_URLS_PATH)
+- non_article: URLs matching the outlet's non-article patterns, and undated
+  URLs on outlets whose article URLs always carry a date
+- stale: URLs whose embedded date is before the cutoff day
+
+Counts per outlet and reason are kept for the run's report.
+"""
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from ingest import normalize_url
+
+SEEN_URLS_PATH = os.getenv("SEEN_URLS_PATH", "seen_urls.json")
+# discarded URLs are forgotten after this many days; anything older is stale anyway
+SEEN_URLS_DAYS = int(os.getenv("SEEN_URLS_DAYS", "7"))
+
+# matched against normalize_url(url): "host/path?query", no scheme or www.
+COMMON_SKIP = [
+    r"/videos?/", r"/live/", r"/audio/", r"/podcasts?/", r"/gallery/", r"/galleries/", r"/photos?/",
+    r"/newsletters?/", r"/(subscribe|account|login|search)(/|\?|$)", r"/author/", r"/tags?/",
+    r"/crosswords?/", r"/games/", r"/horoscopes?/", r"/weather/",
+    r"\.(pdf|jpe?g|png|gif|mp3|mp4|xml|rss)$",
+]
+
+# dated: the outlet's article URLs always embed a date, so undated links are
+# section fronts, topic and author pages
+OUTLET_RULES = {
+    "CNN": {
+        "dated": True,
+        "skip": [r"/live-news/", r"/specials/", r"/interactive/", r"/profiles/", r"/cnn-underscored/",
+                 r"^(edition\.)?cnn\.com/(audio|travel/destinations)"],
+    },
+    "Guardian": {
+        "dated": True,
+        "skip": [r"/picture/", r"/series/", r"/profile/", r"/ng-interactive/", r"/info/", r"/help/"],
+    },
+    "NYT": {
+        "dated": True,
+        "skip": [r"/interactive/", r"/section/", r"/spotlight/", r"/column/", r"/by/", r"/slideshow/",
+                 r"^(cooking|myaccount|help|store)\.nytimes\.com", r"/wirecutter/"],
+    },
+    "NYPost": {
+        "dated": True,
+        "skip": [r"/shopping/", r"/coupons/", r"/video/", r"^nypost\.com/[a-z-]+/?$"],
+    },
+}
+
+MONTHS = {m: i for i, m in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+DATE_PATTERNS = [
+    re.compile(r"/(20\d{2})/(\d{1,2})/(\d{1,2})(?:/|$)"),
+    re.compile(r"/(20\d{2})/(" + "|".join(MONTHS) + r")/(\d{1,2})(?:/|$)"),
+    re.compile(r"(?<!\d)(20\d{2})-(\d{2})-(\d{2})(?!\d)"),
+]
+
+
+def url_date(url):
+    """
+    The publication date embedded in an article URL.
+
+    Understands /2025/10/18/, /2025/oct/18/ and 2025-10-18.
+
+    Returns:
+        datetime.date, or None if the URL has no (valid) date
+    """
+    path = url.lower()
+    for pattern in DATE_PATTERNS:
+        match = pattern.search(path)
+        if not match:
+            continue
+        year, month, day = match.groups()
+        month = MONTHS.get(month) or int(month)
+        try:
+            return date(int(year), month, int(day))
+        except ValueError:
+            continue
+    return None
+
+
+class SeenUrls:
+    """Normalized URLs downloaded and discarded by earlier runs, persisted as JSON with the day they were seen."""
+
+    def __init__(self, path=SEEN_URLS_PATH, days=SEEN_URLS_DAYS):
+        self.path = path
+        self.days = days
+        self.urls = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.urls = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[!] Ignoring unreadable {path}: {e}")
+
+    def __contains__(self, url):
+        return normalize_url(url) in self.urls
+
+    def add(self, url):
+        self.urls.setdefault(normalize_url(url), date.today().isoformat())
+
+    def save(self):
+        """Drop entries older than self.days and write the file atomically."""
+        if not self.path:
+            return
+        oldest = (date.today() - timedelta(days=self.days)).isoformat()
+        self.urls = {url: day for url, day in self.urls.items() if day >= oldest}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.urls, f)
+        os.replace(tmp, self.path)
+
+
+class UrlFilter:
+    def __init__(self, cutoff, store=None, seen=None, rules=OUTLET_RULES):
+        """
+        Args:
+            cutoff: datetime; URLs dated before its day are dropped
+            store: db.Store or sqlite_store.SqliteStore to check for stored URLs, or None
+            seen: SeenUrls, or None for the default file
+            rules: outlet name -> {"dated": bool, "skip": [regex, ...]}
+        """
+        self.cutoff = cutoff.astimezone(timezone.utc).date() if isinstance(cutoff, datetime) else cutoff
+        self.store = store
+        self.seen = seen if seen is not None else SeenUrls()
+        self.common = [re.compile(p) for p in COMMON_SKIP]
+        self.rules = {name: (rule.get("dated", False), [re.compile(p) for p in rule.get("skip", [])])
+                      for name, rule in rules.items()}
+        self.counts = defaultdict(Counter)
+        self.collected = set()
+
+    def add_collected(self, urls):
+        """URLs this run already has (e.g. from RSS); they count as seen."""
+        self.collected.update(normalize_url(url) for url in urls)
+
+    def reason(self, outlet, url):
+        """Why url should not be downloaded ("non_article" or "stale"), or None to keep it."""
+        key = normalize_url(url).lower()
+        dated, skip = self.rules.get(outlet, (False, []))
+        if any(p.search(key) for p in self.common) or any(p.search(key) for p in skip):
+            return "non_article"
+        published = url_date(key)
+        if published is None:
+            return "non_article" if dated else None
+        if published < self.cutoff:
+            return "stale"
+        return None
+
+    def filter(self, outlet, items, url=lambda item: item):
+        """
+        Keep the items worth downloading.
+
+        Args:
+            outlet: NEWSPAPER_SOURCES name, selects the outlet's rules
+            items: URLs, or objects url() maps to a URL (e.g. newspaper Articles)
+            url: item -> URL
+
+        Returns:
+            The kept items, in order
+        """
+        counts = self.counts[outlet]
+        candidates = []
+        known = set()
+        for item in items:
+            link = url(item)
+            key = normalize_url(link)
+            if key in known:
+                counts["duplicate"] += 1
+                continue
+            known.add(key)
+            if key in self.collected or link in self.seen:
+                counts["seen"] += 1
+                continue
+            why = self.reason(outlet, link)
+            if why:
+                counts[why] += 1
+                continue
+            candidates.append((item, link))
+
+        stored = set()
+        if self.store is not None and candidates:
+            try:
+                stored = self.store.existing_urls([link for _, link in candidates])
+            except Exception as e:
+                print(f"[!] Seen-URL check failed for {outlet}: {e}")
+        kept = [item for item, link in candidates if link not in stored]
+        counts["seen"] += len(candidates) - len(kept)
+        counts["kept"] += len(kept)
+        return kept
+
+    def mark_seen(self, url):
+        """Remember a URL that was downloaded but not kept, so later runs skip it."""
+        self.seen.add(url)
+
+    def avoided(self):
+        return sum(n for counts in self.counts.values() for reason, n in counts.items() if reason != "kept")
+
+    def report(self):
+        """One line per outlet plus a total, for the pipeline log."""
+        lines = []
+        for outlet, counts in self.counts.items():
+            dropped = ", ".join(f"{reason} {n}" for reason, n in sorted(counts.items()) if reason != "kept" and n)
+            lines.append(f"{outlet}: {counts['kept']} of {sum(counts.values())} URLs kept"
+                         + (f" (skipped {dropped})" if dropped else ""))
+        lines.append(f"Downloads avoided: {self.avoided()}")
+        return "\n".join(lines)
@@ -0,0 +1,195 @@
+"""
+Ingestion worker: leases jobs from the job queue (jobqueue.py) and runs them.
+
+    python worker.py                      # one worker process
+    python worker.py --processes 8        # eight, all on the queue's host (see jobqueue.py)
+    python worker.py --kinds article      # only download and parse article pages
+
+Job kinds, enqueued by coordinator.py or by other jobs:
+
+    feed        fetch an RSS feed and enqueue an article job per recent entry
+    homepage    build a NEWSPAPER_SOURCES outlet and enqueue its article links
+    article     download and parse one page and stage the article
+    summarize   summarize and embed a batch of staged articles
+
+Feed and homepage links go through the same URL filter as app.py, and
+articles whose title is already stored are not staged. A worker keeps its
+lease alive while a job runs, so a job is only handed to another worker when
+this one dies. Workers run until interrupted, or with --batch until that
+batch is finished.
+"""
+import os
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import multiprocessing
+import socket
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import newspaper
+
+from budget import Deadline, SOURCE_TIMEOUT, REQUEST_TIMEOUT
+from db import create_store
+from extract import parse_article
+from jobqueue import JOB_QUEUE_PATH, JobQueue
+from pipeline import (MIN_RSS_TEXT, MIN_PAGE_TEXT, newspaper_config, create_session, openai_client,
+                      download_html, feed_links, generate_summary)
+from semantic import EMBEDDING_MODEL
+from url_filter import SeenUrls, UrlFilter
+
+POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))
+MAX_ARTICLES = 2000
+SUMMARY_THREADS = 6
+
+
+class Worker:
+    def __init__(self, queue, worker_id=None, kinds=None):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.kinds = kinds
+        self.store = create_store()
+        self.session = create_session()
+        self.config = newspaper_config()
+        self.client = openai_client()
+        self._model = None
+        self.handlers = {
+            "feed": self.run_feed,
+            "homepage": self.run_homepage,
+            "article": self.run_article,
+            "summarize": self.run_summarize,
+        }
+
+    def url_filter(self, payload):
+        # the seen-URL file is per host, so workers only check the database
+        return UrlFilter(datetime.fromisoformat(payload["cutoff"]), self.store, SeenUrls(path=None))
+
+    def enqueue_articles(self, job, source, links, min_text):
+        payload = job["payload"]
+        jobs = [(link, {"source": source, "url": link, "min_text": min_text, "cutoff": payload["cutoff"]})
+                for link in links]
+        return self.queue.enqueue_many(job["batch"], "article", jobs)
+
+    # --- handlers ---
+
+    def run_feed(self, job):
+        payload = job["payload"]
+        deadline = Deadline.after(SOURCE_TIMEOUT)
+        links = feed_links(self.session, payload["url"], deadline, datetime.fromisoformat(payload["cutoff"]))
+        # feed links skip the per-outlet homepage rules (feeds list articles only)
+        links = self.url_filter(payload).filter(f"rss:{payload['source']}", links)
+        return self.enqueue_articles(job, payload["source"], links, MIN_RSS_TEXT)
+
+    def run_homepage(self, job):
+        payload = job["payload"]
+        html = download_html(self.session, payload["url"], Deadline.after(SOURCE_TIMEOUT))
+        paper = newspaper.build(payload["url"], config=self.config, memoize_articles=False, input_html=html)
+        links = self.url_filter(payload).filter(payload["source"], [art.url for art in paper.articles])
+        # staged under the outlet's brand, like app.py's newspaper articles
+        return self.enqueue_articles(job, paper.brand, links[:MAX_ARTICLES], MIN_PAGE_TEXT + 1)
+
+    def run_article(self, job):
+        payload = job["payload"]
+        html = download_html(self.session, payload["url"], Deadline.after(REQUEST_TIMEOUT))
+        title, text, _ = parse_article(html, payload["url"], self.config)
+        if len(text.strip()) < payload["min_text"] or self.store.existing_titles([title]):
+            return 0
+        return int(self.queue.stage_article(job["batch"], payload["source"], title, payload["url"], text))
+
+    def run_summarize(self, job):
+        rows = self.queue.get_staged(job["payload"]["article_ids"])
+        deadline = Deadline.after(self.queue.lease_seconds)
+        with ThreadPoolExecutor(max_workers=SUMMARY_THREADS) as executor:
+            summaries = list(executor.map(lambda row: generate_summary(self.client, row["text"], "article", deadline),
+                                          rows))
+        embeddings = self.model().encode(summaries)
+        self.queue.set_summaries([(row["article_id"], summary, embedding)
+                                  for row, summary, embedding in zip(rows, summaries, embeddings)])
+        return len(rows)
+
+    def model(self):
+        # loaded on the first summarize job, so fetch-only workers never hold it
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(EMBEDDING_MODEL)
+        return self._model
+
+    # --- loop ---
+
+    def run_job(self, job):
+        """Run one leased job, renewing its lease until it returns."""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.queue.lease_seconds / 3):
+                if not self.queue.heartbeat(job, self.worker_id):
+                    return
+
+        renewer = threading.Thread(target=renew, daemon=True)
+        renewer.start()
+        start = time.perf_counter()
+        try:
+            result = self.handlers[job["kind"]](job)
+        except Exception as e:
+            self.queue.fail(job, self.worker_id, f"{type(e).__name__}: {e}")
+            print(f"[{self.worker_id}] {job['kind']} {job['key']} failed (attempt {job['attempts']}): {e}")
+            return
+        finally:
+            stop.set()
+        if not self.queue.complete(job, self.worker_id):
+            print(f"[{self.worker_id}] lost the lease on {job['kind']} {job['key']}")
+        elif job["kind"] != "article":
+            print(f"[{self.worker_id}] {job['kind']} {job['key']}: {result} in {time.perf_counter() - start:.1f}s")
+
+    def run(self, batch=None):
+        """Lease and run jobs until interrupted, or until batch is finished."""
+        while batch is None or not self.queue.is_finished(batch):
+            job = self.queue.lease(self.worker_id, self.kinds)
+            if job is None:
+                time.sleep(POLL_SECONDS)
+                continue
+            self.run_job(job)
+
+
+def _process(queue_path, kinds, batch):
+    warnings.simplefilter(action="ignore", category=FutureWarning)
+    try:
+        Worker(JobQueue(queue_path), kinds=kinds).run(batch)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--kinds", help="comma-separated job kinds to take (default: all)")
+    parser.add_argument("--batch", help="exit once this batch is finished")
+    parser.add_argument("--queue", default=JOB_QUEUE_PATH, help="job queue database (JOB_QUEUE_PATH)")
+    args = parser.parse_args()
+    kinds = args.kinds.split(",") if args.kinds else None
+
+    if args.processes == 1:
+        _process(args.queue, kinds, args.batch)
+        return 0
+    processes = [multiprocessing.Process(target=_process, args=(args.queue, kinds, args.batch))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
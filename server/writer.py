@@ -0,0 +1,53 @@
+"""
+Direct database writer for pipeline output.
+
+The pipeline can write clusters and articles straight to the storage backend
+(Supabase or SQLite, see STORAGE_BACKEND) instead of posting them to the API.
+Payloads go through the same validation as /api/data/bulk (ingest.clean_bulk)
+and the same idempotent ingest_bulk writes, so the two paths produce identical
+rows. Each committed chunk is appended to the change log, which is how running
+API servers find out about the new rows (see ChangeFeed.watch in changes.py).
+A shared (Redis) response cache is invalidated here, once per write, rather
+than by each server worker that sees the change.
+
+The HTTP endpoints remain the way in for external producers.
+"""
+from changes import changed_ids
+from ingest import STREAM_CHUNK_SIZE, clean_bulk, summarize, write_stream
+
+
+def write_clusters(store, clusters_data, chunk_size=STREAM_CHUNK_SIZE, cache=None):
+    """
+    Validate and write a list of {"cluster": ..., "articles": [...]} batches.
+
+    The whole payload is validated before anything is written; it is then
+    written in transactions of chunk_size clusters, each recorded in the
+    change log once committed.
+
+    Args:
+        store: db.Store or sqlite_store.SqliteStore
+        clusters_data: List of cluster dictionaries, as posted to /api/data/bulk
+        chunk_size: Clusters per transaction
+        cache: optional shared cache.ResponseCache to invalidate once anything is written
+
+    Returns:
+        Tuple of (group_results() entries, summarize() totals)
+
+    Raises:
+        ingest.ValidationError: if any cluster or article is invalid
+    """
+    batches = clean_bulk(clusters_data)
+    results = []
+    changed = False
+    try:
+        for chunk in write_stream(store, iter(batches), chunk_size):
+            cluster_ids, article_ids = changed_ids(chunk)
+            if cluster_ids or article_ids:
+                store.record_change(list(dict.fromkeys(cluster_ids)), list(dict.fromkeys(article_ids)))
+                changed = True
+            results.extend(chunk)
+    finally:
+        # also after a failure part way, for the chunks that were committed
+        if changed and cache is not None:
+            cache.bump_version()
+    return results, summarize(results)